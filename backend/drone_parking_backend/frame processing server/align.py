@@ -1,17 +1,231 @@
 import cv2
 import numpy as np
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+FLANN_INDEX_PARAMS = dict(algorithm=1, trees=5)
+FLANN_SEARCH_PARAMS = dict(checks=50)
 
-def precompute_master(master_img):
-    """Pre-calculate SIFT keypoints and descriptors for a master image."""
+# Robust estimators accepted by align_to_master(estimator=...)
+ESTIMATORS = {
+    "ransac": cv2.RANSAC,
+    "magsac": cv2.USAC_MAGSAC,
+    "accurate": cv2.USAC_ACCURATE,
+}
+
+# Master-side feature sets used by align_to_master's CLAHE and ORB fallbacks
+MASTER_VARIANTS = ("clahe", "orb")
+
+_fallback_pool = None
+# Per-thread CLAHE for the "clahe" variant, built on first use instead of per frame
+_clahe = threading.local()
+
+
+def precompute_master(master_img, mask=None, max_keypoints=0):
+    """Pre-calculate SIFT keypoints and descriptors for a master image.
+
+    Args:
+        master_img: the master image BGR array
+        mask: (optional) uint8 mask of the static structure to take keypoints from
+        max_keypoints: keep only the strongest N keypoints (0 = no limit)
+    """
     gray = cv2.cvtColor(master_img, cv2.COLOR_BGR2GRAY)
-    sift = cv2.SIFT_create()
-    kp, des = sift.detectAndCompute(gray, None)
+    sift = cv2.SIFT_create(nfeatures=max_keypoints)
+    kp, des = sift.detectAndCompute(gray, mask)
     return kp, des
 
 
-def align_to_master(master, new_img, master_kp=None, master_des=None):
+def _detect_features(gray, variant, mask=None, max_keypoints=0):
+    """Detect keypoints and descriptors on a grayscale image for one alignment strategy."""
+    if variant == "clahe":
+        clahe = getattr(_clahe, "instance", None)
+        if clahe is None:
+            clahe = _clahe.instance = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        return cv2.SIFT_create(nfeatures=max_keypoints).detectAndCompute(clahe.apply(gray), mask)
+    if variant == "orb":
+        return cv2.ORB_create(nfeatures=max_keypoints or 5000).detectAndCompute(gray, mask)
+    return cv2.SIFT_create(nfeatures=max_keypoints).detectAndCompute(gray, mask)
+
+
+def precompute_master_variant(master_img, variant, mask=None, max_keypoints=0):
+    """Pre-calculate keypoints and descriptors for one fallback variant ("clahe" or "orb") of a master image."""
+    gray = cv2.cvtColor(master_img, cv2.COLOR_BGR2GRAY)
+    return _detect_features(gray, variant, mask, max_keypoints)
+
+
+def build_alignment_mask(shape, include=None, exclude=None, border=0):
+    """Build a uint8 keypoint mask for feature extraction.
+
+    Args:
+        shape: image shape (h, w[, c])
+        include: (optional) polygons of static structure (paint lines, curbs); if
+                 given, only these regions are kept
+        exclude: (optional) polygons to blank out, e.g. spot interiors where cars move
+        border: pixels to ignore along every image edge
+
+    Returns the mask, or None when nothing would be masked.
+    """
+    if not include and not exclude and border <= 0:
+        return None
+
+    h, w = shape[:2]
+    if include:
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.asarray(p, np.int32) for p in include], 255)
+    else:
+        mask = np.full((h, w), 255, dtype=np.uint8)
+    if exclude:
+        cv2.fillPoly(mask, [np.asarray(p, np.int32) for p in exclude], 0)
+    if border > 0:
+        mask[:border, :] = 0
+        mask[-border:, :] = 0
+        mask[:, :border] = 0
+        mask[:, -border:] = 0
+    return mask
+
+
+def build_master_matcher(master_des):
+    """Train a FLANN index over the master descriptors once, for reuse across live frames.
+
+    Live frames query the trained index (live -> master), so the KD-trees are
+    built once per lot instead of once per frame.
+    Returns None if there are too few descriptors to index.
+    """
+    if master_des is None or len(master_des) < 2:
+        return None
+    return cv2.flann_Index(np.asarray(master_des, dtype=np.float32), FLANN_INDEX_PARAMS)
+
+
+def keypoint_coords(kp):
+    """Return keypoint positions as an (N, 2) float32 array."""
+    if not kp:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.KeyPoint_convert(kp)
+
+
+def knn_candidates(master_des, live_des, index=None, use_flann=True):
+    """Find the two nearest neighbours for every query descriptor.
+
+    With a trained index over the master, live descriptors are the query side.
+    Without one, the master descriptors query the live frame, as the per-frame
+    matchers always have.
+
+    Args:
+        master_des: master descriptors (float32 SIFT or uint8 ORB)
+        live_des: live-frame descriptors of the same kind
+        index: (optional) build_master_matcher index over master_des
+        use_flann: FLANN for float descriptors, brute-force Hamming (ORB) otherwise
+
+    Returns (nn_idx, dists, live_is_query), where nn_idx and dists are (N, 2)
+    arrays indexed by query descriptor, or None if matching is impossible.
+    """
+    if master_des is None or live_des is None or len(master_des) == 0 or len(live_des) == 0:
+        return None
+
+    live_is_query = index is not None
+    query, train = (live_des, master_des) if live_is_query else (master_des, live_des)
+    if len(train) < 2:
+        return None
+
+    if use_flann:
+        if index is None:
+            index = cv2.flann_Index(np.asarray(train, dtype=np.float32), FLANN_INDEX_PARAMS)
+        nn_idx, dists = index.knnSearch(np.asarray(query, dtype=np.float32), 2, params=FLANN_SEARCH_PARAMS)
+        # The KD-tree reports squared L2 distances
+        return nn_idx, np.sqrt(dists), live_is_query
+
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False).knnMatch(query, train, k=2)
+    nn_idx = np.zeros((len(matches), 2), dtype=np.int32)
+    dists = np.full((len(matches), 2), np.inf, dtype=np.float32)
+    for i, m_n in enumerate(matches):
+        for j, m in enumerate(m_n[:2]):
+            nn_idx[i, j] = m.trainIdx
+            dists[i, j] = m.distance
+    return nn_idx, dists, live_is_query
+
+
+def ratio_test(candidates, ratio):
+    """Vectorized Lowe ratio test over knn_candidates output.
+
+    Returns (live_idx, master_idx) arrays of the matches that pass.
+    """
+    nn_idx, dists, live_is_query = candidates
+    keep = dists[:, 0] < ratio * dists[:, 1]
+    query_idx, train_idx = np.flatnonzero(keep), nn_idx[keep, 0]
+    if live_is_query:
+        return query_idx, train_idx
+    return train_idx, query_idx
+
+
+def estimate_homography(src_pts, dst_pts, estimator="ransac", ransac_thresh=5.0, max_iters=2000, confidence=0.995):
+    """Estimate a src -> dst homography with the named robust estimator.
+
+    Returns (H, inliers), with H None if estimation failed.
+    """
+    H, mask = cv2.findHomography(
+        src_pts.reshape(-1, 1, 2),
+        dst_pts.reshape(-1, 1, 2),
+        ESTIMATORS[estimator],
+        ransac_thresh,
+        maxIters=max_iters,
+        confidence=confidence,
+    )
+    if H is None:
+        return None, 0
+    return H, int(mask.ravel().sum())
+
+
+def build_master_variants(feature_sets):
+    """Wrap precomputed fallback feature sets for align_to_master.
+
+    Args:
+        feature_sets: dict of variant name -> (keypoints, descriptors)
+
+    Returns dict of variant name -> {"kp", "des", "matcher"}, with a trained FLANN
+    matcher for the SIFT-based CLAHE variant (ORB is brute-force matched).
+    """
+    variants = {}
+    for name, (kp, des) in feature_sets.items():
+        matcher = build_master_matcher(des) if name == "clahe" else None
+        variants[name] = {"kp": kp, "des": des, "matcher": matcher}
+    return variants
+
+
+def precompute_master_variants(master_img, mask=None, max_keypoints=0):
+    """Pre-calculate all fallback feature variants of a master image for align_to_master."""
+    return build_master_variants(
+        {name: precompute_master_variant(master_img, name, mask, max_keypoints) for name in MASTER_VARIANTS}
+    )
+
+
+def _get_fallback_pool():
+    global _fallback_pool
+    if _fallback_pool is None:
+        _fallback_pool = ThreadPoolExecutor(
+            max_workers=max(len(MASTER_VARIANTS) + 1, os.cpu_count() or 1), thread_name_prefix="align-fallback"
+        )
+    return _fallback_pool
+
+
+def align_to_master(
+    master,
+    new_img,
+    master_kp=None,
+    master_des=None,
+    master_matcher=None,
+    master_variants=None,
+    parallel_fallbacks=False,
+    warp=True,
+    max_keypoints=0,
+    master_mask=None,
+    live_mask=None,
+    estimator="ransac",
+    max_iters=2000,
+    confidence=0.995,
+):
     """Align a new drone image to the master reference using SIFT + FLANN with robust fallbacks.
     
     Args:
@@ -19,100 +233,132 @@ def align_to_master(master, new_img, master_kp=None, master_des=None):
         new_img: the live drone image BGR array
         master_kp: (optional) precompute_master keypoints
         master_des: (optional) precompute_master descriptors
+        master_matcher: (optional) build_master_matcher index over master_des
+        master_variants: (optional) precompute_master_variants output, so the CLAHE and
+                         ORB fallbacks don't re-featurize the master; variants
+                         missing from it are computed from the master
+        parallel_fallbacks: run SIFT, CLAHE + SIFT and ORB concurrently in a thread pool
+                            and take the first that reaches the inlier threshold
+        warp: resample the live image into master coordinates as "aligned". With
+              warp=False, "aligned" is the untouched live image; use
+              project_parking_data to bring the spots into live coordinates instead.
+        max_keypoints: keypoint budget for live-frame (and uncached master) extraction, 0 = no limit
+        master_mask: (optional) build_alignment_mask for the master, used when its
+                     features are not precomputed
+        live_mask: (optional) build_alignment_mask for the live frame
+        estimator: homography estimator, a key of ESTIMATORS ("ransac", "magsac", "accurate")
+        max_iters: iteration cap for the estimator
+        confidence: estimator confidence level
     """
-    gray1 = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
     gray2 = cv2.cvtColor(new_img, cv2.COLOR_BGR2GRAY)
+    gray1 = None
+    # Variants missing from master_variants are computed from the master's gray image
+    missing_variants = master_variants is None or not set(MASTER_VARIANTS) <= set(master_variants)
+    if master_kp is None or master_des is None or missing_variants:
+        gray1 = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
 
-    def attempt_alignment(kp1, des1, kp2, des2, ratio=0.7, ransac_thresh=5.0, use_flann=True):
-        if des1 is None or des2 is None or len(kp1) == 0 or len(kp2) == 0:
-            return None, 0, 0
-            
-        if use_flann:
-            index_params = dict(algorithm=1, trees=5) 
-            search_params = dict(checks=50)
-            matcher = cv2.FlannBasedMatcher(index_params, search_params)
-        else:
-            matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-            
-        try:
-            matches = matcher.knnMatch(des1, des2, k=2)
-        except Exception:
+    def attempt_alignment(master_pts, live_pts, candidates, ratio=0.7, ransac_thresh=5.0):
+        if candidates is None:
             return None, 0, 0
 
-        good_matches = []
-        for m_n in matches:
-            if len(m_n) == 2:
-                m, n = m_n
-                if m.distance < ratio * n.distance:
-                    good_matches.append(m)
-
-        if len(good_matches) < 10:
-            return None, len(good_matches), 0
-
-        dst_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        src_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-
-        H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, ransac_thresh)
+        live_idx, master_idx = ratio_test(candidates, ratio)
+        good = len(live_idx)
+        if good < 10:
+            return None, good, 0
 
+        H, inliers = estimate_homography(
+            live_pts[live_idx], master_pts[master_idx], estimator, ransac_thresh, max_iters, confidence
+        )
         if H is None:
-            return None, len(good_matches), 0
-
-        inliers = int(mask.ravel().sum())
-        return H, len(good_matches), inliers
+            return None, good, 0
+        return H, good, inliers
 
-    sift = cv2.SIFT_create()
-    
     if master_kp is None or master_des is None:
-        kp1, des1 = sift.detectAndCompute(gray1, None)
-    else:
-        kp1, des1 = master_kp, master_des
-        
-    kp2, des2 = sift.detectAndCompute(gray2, None)
-    
+        master_kp, master_des = _detect_features(gray1, "sift", master_mask, max_keypoints)
+        master_matcher = None
+
     result = {
         "aligned": new_img,
         "homography": None,
-        "keypoints_master": len(kp1) if kp1 else 0,
-        "keypoints_live": len(kp2) if kp2 else 0,
+        "keypoints_master": len(master_kp) if master_kp else 0,
+        "keypoints_live": 0,
         "good_matches": 0,
         "inliers": 0,
         "fallback_used": "None"
     }
 
-    H, good, inliers = attempt_alignment(kp1, des1, kp2, des2, ratio=0.7)
-    
-    if H is None or inliers < 10:
-        print("⚠️ Standard SIFT alignment failed, activating Fallback 1: Relaxed Ratio Test (0.8)")
-        H, good, inliers = attempt_alignment(kp1, des1, kp2, des2, ratio=0.8)
-        result["fallback_used"] = "Relaxed Ratio (0.8)"
-        
-    if H is None or inliers < 10:
-        print("⚠️ Relaxed SIFT failed, activating Fallback 2: CLAHE Enhanced SIFT")
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        gray1_clahe = clahe.apply(gray1)
-        gray2_clahe = clahe.apply(gray2)
-        
-        kp1_c, des1_c = sift.detectAndCompute(gray1_clahe, None)
-        kp2_c, des2_c = sift.detectAndCompute(gray2_clahe, None)
-        
-        H, good, inliers = attempt_alignment(kp1_c, des1_c, kp2_c, des2_c, ratio=0.75)
-        result["fallback_used"] = "CLAHE + SIFT"
-        
-    if H is None or inliers < 10:
-        print("⚠️ CLAHE SIFT failed, activating Fallback 3: ORB Matching")
-        orb = cv2.ORB_create(nfeatures=5000)
-        kp1_o, des1_o = orb.detectAndCompute(gray1, None)
-        kp2_o, des2_o = orb.detectAndCompute(gray2, None)
-        
-        H, good, inliers = attempt_alignment(kp1_o, des1_o, kp2_o, des2_o, ratio=0.8, use_flann=False)
-        result["fallback_used"] = "ORB Matcher"
+    # Each strategy returns (fallback_used, H, good_matches, inliers, live keypoints)
+    def run_sift():
+        kp2, des2 = _detect_features(gray2, "sift", live_mask, max_keypoints)
+        live_keypoints = len(kp2) if kp2 else 0
+
+        # Both ratio tests filter the same k-NN matches, so the relaxed retry is nearly free
+        master_pts, live_pts = keypoint_coords(master_kp), keypoint_coords(kp2)
+        candidates = knn_candidates(master_des, des2, index=master_matcher)
+        H, good, inliers = attempt_alignment(master_pts, live_pts, candidates, ratio=0.7)
+        if H is not None and inliers >= 10:
+            return "None", H, good, inliers, live_keypoints
+
+        if not parallel_fallbacks:
+            print("⚠️ Standard SIFT alignment failed, activating Fallback 1: Relaxed Ratio Test (0.8)")
+        H, good, inliers = attempt_alignment(master_pts, live_pts, candidates, ratio=0.8)
+        return "Relaxed Ratio (0.8)", H, good, inliers, live_keypoints
+
+    def run_variant(variant, label, ratio, use_flann):
+        if master_variants is not None and variant in master_variants:
+            master_variant = master_variants[variant]
+        else:
+            kp, des = _detect_features(gray1, variant, master_mask, max_keypoints)
+            master_variant = {"kp": kp, "des": des, "matcher": None}
+
+        kp2, des2 = _detect_features(gray2, variant, live_mask, max_keypoints)
+        candidates = knn_candidates(master_variant["des"], des2, index=master_variant["matcher"], use_flann=use_flann)
+        H, good, inliers = attempt_alignment(
+            keypoint_coords(master_variant["kp"]), keypoint_coords(kp2), candidates, ratio=ratio
+        )
+        return label, H, good, inliers, len(kp2) if kp2 else 0
+
+    strategies = [
+        (run_sift, ()),
+        (run_variant, ("clahe", "CLAHE + SIFT", 0.75, True)),
+        (run_variant, ("orb", "ORB Matcher", 0.8, False)),
+    ]
+
+    if parallel_fallbacks:
+        pool = _get_fallback_pool()
+        futures = {pool.submit(fn, *args): i for i, (fn, args) in enumerate(strategies)}
+        outcomes = [None] * len(strategies)
+        chosen = None
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcomes[futures[future]] = outcome
+            if outcome[1] is not None and outcome[3] >= 10:
+                # Slower strategies keep running in the background; their results are dropped
+                chosen = outcome
+                break
+        if chosen is None:
+            chosen = outcomes[-1]
+        fallback, H, good, inliers, live_keypoints = chosen
+    else:
+        fallback, H, good, inliers, live_keypoints = run_sift()
 
+        if H is None or inliers < 10:
+            print("⚠️ Relaxed SIFT failed, activating Fallback 2: CLAHE Enhanced SIFT")
+            fallback, H, good, inliers, live_keypoints = run_variant("clahe", "CLAHE + SIFT", 0.75, True)
+
+        if H is None or inliers < 10:
+            print("⚠️ CLAHE SIFT failed, activating Fallback 3: ORB Matching")
+            fallback, H, good, inliers, live_keypoints = run_variant("orb", "ORB Matcher", 0.8, False)
+
+    result["keypoints_live"] = live_keypoints
+    result["fallback_used"] = fallback
     result["good_matches"] = good
     result["inliers"] = inliers
 
     if H is not None and inliers >= 10:
         result["homography"] = H
-        result["aligned"] = cv2.warpPerspective(new_img, H, (master.shape[1], master.shape[0]))
+        if warp:
+            result["aligned"] = cv2.warpPerspective(new_img, H, (master.shape[1], master.shape[0]))
     else:
         # All fallbacks failed
         result["homography"] = None
@@ -121,6 +367,280 @@ def align_to_master(master, new_img, master_kp=None, master_des=None):
     return result
 
 
+def project_parking_data(parking_data, homography):
+    """Map master-coordinate spot polygons into the live frame of a live->master homography.
+
+    Returns parking_data in the same (polygon_ndarray, spot_id) format, so
+    check_occupancy and draw_visualization can run on the unwarped live image.
+    """
+    H_inv = np.linalg.inv(homography)
+    projected = []
+    for polygon, spot_id in parking_data:
+        pts = np.asarray(polygon, dtype=np.float64).reshape(-1, 1, 2)
+        live = cv2.perspectiveTransform(pts, H_inv).reshape(-1, 2)
+        projected.append((np.round(live).astype(np.int32), spot_id))
+    return projected
+
+
+def project_box_corners(boxes, homography):
+    """Map live-frame (x1, y1, x2, y2, ...) boxes to their exact quads in master coordinates.
+
+    Returns an (N, 4, 2) float64 array of corners in top-left, top-right,
+    bottom-right, bottom-left order. Under rotation or perspective these
+    quads are not axis-aligned, so draw them instead of their bounding rects.
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 4, 2), dtype=np.float64)
+    coords = np.float64([box[:4] for box in boxes])
+    corners = coords[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(corners, homography).reshape(-1, 4, 2)
+
+
+def project_boxes_to_master(boxes, homography, master_shape=None):
+    """Map live-frame (x1, y1, x2, y2, conf) boxes to master coordinates.
+
+    Each box becomes the bounding rectangle of its projected corners, clipped
+    to the master image when master_shape is given. With rotation or
+    perspective that rect is larger than the box's true footprint; use
+    project_box_corners for the exact quad.
+    """
+    projected = []
+    for box, pts in zip(boxes, project_box_corners(boxes, homography)):
+        mx1, my1 = pts.min(axis=0)
+        mx2, my2 = pts.max(axis=0)
+        if master_shape is not None:
+            h, w = master_shape[:2]
+            mx1, mx2 = np.clip([mx1, mx2], 0, w)
+            my1, my2 = np.clip([my1, my2], 0, h)
+        projected.append((int(round(mx1)), int(round(my1)), int(round(mx2)), int(round(my2))) + tuple(box[4:]))
+    return projected
+
+
+def _scale_matrix(sx, sy):
+    return np.array([[sx, 0, 0], [0, sy, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def _downscale(img, scale):
+    """Resize an image by `scale`, returning it with the exact (sx, sy) factors used."""
+    h, w = img.shape[:2]
+    new_w, new_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    small = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return small, new_w / w, new_h / h
+
+
+def precompute_master_pyramid(master_img, scale=0.25, roi=None):
+    """Pre-calculate the master-side state for align_to_master_pyramid.
+
+    Holds the downscaled master with its SIFT features and matcher, plus the
+    full-resolution corners used by refine="matches".
+    """
+    small, sx, sy = _downscale(master_img, scale)
+    kp, des = precompute_master(small)
+    gray = cv2.cvtColor(master_img, cv2.COLOR_BGR2GRAY)
+    return {
+        "image": small,
+        "scale": (sx, sy),
+        "kp": kp,
+        "des": des,
+        "matcher": build_master_matcher(des),
+        "track_points": master_track_points(gray, roi),
+    }
+
+
+def _refine_ecc(gray1, gray2, H, roi, ecc_scale=0.5, iterations=50, eps=1e-4):
+    """Refine a live->master homography with ECC over the master ROI only.
+
+    ECC runs on the ROI resampled by `ecc_scale`, which keeps it cheap on large lots.
+    Returns (refined_H, correlation), or (None, 0.0) if ECC does not converge.
+    """
+    x, y, w, h = roi
+    w_s, h_s = max(1, int(round(w * ecc_scale))), max(1, int(round(h * ecc_scale)))
+    # K maps scaled ROI coordinates to master coordinates
+    K = np.array([[w / w_s, 0, x], [0, h / h_s, y], [0, 0, 1]], dtype=np.float64)
+    K_inv = np.linalg.inv(K)
+
+    template = cv2.resize(gray1[y:y + h, x:x + w], (w_s, h_s), interpolation=cv2.INTER_AREA)
+    warped = cv2.warpPerspective(gray2, K_inv @ H, (w_s, h_s))
+
+    warp = np.eye(3, dtype=np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, eps)
+    try:
+        cc, warp = cv2.findTransformECC(template, warped, warp, cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+    except cv2.error:
+        return None, 0.0
+
+    # ECC maps ROI coords into the pre-warped ROI, so undo it on the master side
+    refined = K @ np.linalg.inv(warp.astype(np.float64)) @ K_inv @ H
+    return refined / refined[2, 2], float(cc)
+
+
+def master_track_points(gray1, roi=None, max_points=300, mask=None):
+    """Pick strong corners in the master (inside the ROI and mask) to track into live frames."""
+    if roi is not None:
+        x, y, w, h = roi
+        roi_mask = np.zeros(gray1.shape[:2], dtype=np.uint8)
+        roi_mask[y:y + h, x:x + w] = 255
+        mask = roi_mask if mask is None else cv2.bitwise_and(mask, roi_mask)
+    pts = cv2.goodFeaturesToTrack(gray1, max_points, 0.01, 10, mask=mask)
+    if pts is None:
+        return np.empty((0, 1, 2), dtype=np.float32)
+    return pts.astype(np.float32)
+
+
+def refine_with_point_tracks(gray1, gray2, H, master_pts, ransac_thresh=3.0, win_size=21):
+    """Refine a live->master homography from a small set of full-resolution point matches.
+
+    Each master corner is projected into the live frame with the current estimate
+    and snapped to its exact position with pyramidal Lucas-Kanade, so only a few
+    hundred small patches are examined at full resolution.
+    Returns (refined_H, matches, inliers), or (None, matches, inliers) if refinement fails.
+    """
+    if len(master_pts) < 10:
+        return None, 0, 0
+
+    guess = cv2.perspectiveTransform(master_pts, np.linalg.inv(H)).astype(np.float32)
+
+    # Pyramidal LK needs both images at the same size; pad or crop the live frame (no resampling)
+    if gray2.shape != gray1.shape:
+        h, w = gray1.shape[:2]
+        canvas = np.zeros_like(gray1)
+        canvas[:min(h, gray2.shape[0]), :min(w, gray2.shape[1])] = gray2[:h, :w]
+        gray2 = canvas
+    live_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+        gray1, gray2, master_pts, guess.copy(), winSize=(win_size, win_size), maxLevel=2,
+        flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+    )
+    ok = status.ravel() == 1
+    if ok.sum() < 10:
+        return None, int(ok.sum()), 0
+
+    refined, mask = cv2.findHomography(live_pts[ok], master_pts[ok], cv2.RANSAC, ransac_thresh)
+    if refined is None:
+        return None, int(ok.sum()), 0
+
+    inliers = int(mask.ravel().sum())
+    if inliers < 10:
+        return None, int(ok.sum()), inliers
+    return refined, int(ok.sum()), inliers
+
+
+def align_to_master_pyramid(
+    master,
+    new_img,
+    scale=0.25,
+    refine="matches",
+    roi=None,
+    master_pyramid=None,
+    warp=True,
+):
+    """Coarse-to-fine alignment: estimate the homography on a downscaled level, then refine at full resolution.
+
+    Args:
+        master: the master image BGR array
+        new_img: the live drone image BGR array
+        scale: pyramid level used for the coarse estimate (0.25 = quarter resolution)
+        refine: "ecc", "matches" or None to skip the full-resolution refinement
+        roi: (x, y, w, h) lot region in master coordinates to refine on, defaults to the whole master
+        master_pyramid: (optional) precompute_master_pyramid output for the same scale and roi
+        warp: as in align_to_master
+
+    Returns the same dict as align_to_master, with a full-resolution "homography", plus
+    "coarse_scale", "refinement" (the method that was actually applied) and "elapsed" seconds.
+    """
+    start = time.perf_counter()
+
+    if master_pyramid is None:
+        master_pyramid = precompute_master_pyramid(master, scale, roi)
+    small_live, lx, ly = _downscale(new_img, scale)
+
+    coarse = align_to_master(
+        master_pyramid["image"],
+        small_live,
+        master_kp=master_pyramid["kp"],
+        master_des=master_pyramid["des"],
+        master_matcher=master_pyramid["matcher"],
+        warp=False,
+    )
+
+    result = {
+        "aligned": new_img,
+        "homography": None,
+        "keypoints_master": coarse["keypoints_master"],
+        "keypoints_live": coarse["keypoints_live"],
+        "good_matches": coarse["good_matches"],
+        "inliers": coarse["inliers"],
+        "fallback_used": coarse["fallback_used"],
+        "coarse_scale": scale,
+        "refinement": None,
+        "elapsed": 0.0,
+    }
+
+    if coarse["homography"] is None:
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    mx, my = master_pyramid["scale"]
+    H = np.linalg.inv(_scale_matrix(mx, my)) @ coarse["homography"] @ _scale_matrix(lx, ly)
+    H /= H[2, 2]
+
+    if refine is not None:
+        gray1 = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
+        gray2 = cv2.cvtColor(new_img, cv2.COLOR_BGR2GRAY)
+
+    if refine == "ecc":
+        refined, cc = _refine_ecc(gray1, gray2, H, roi or (0, 0, master.shape[1], master.shape[0]))
+        if refined is not None:
+            H = refined
+            result["refinement"] = "ecc"
+            result["ecc_correlation"] = cc
+    elif refine == "matches":
+        refined, good, inliers = refine_with_point_tracks(gray1, gray2, H, master_pyramid["track_points"])
+        if refined is not None:
+            H = refined
+            result["refinement"] = "matches"
+            result["good_matches"] = good
+            result["inliers"] = inliers
+
+    result["homography"] = H
+    if warp:
+        result["aligned"] = cv2.warpPerspective(new_img, H, (master.shape[1], master.shape[0]))
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def compare_pyramid_alignment(master, new_img, master_kp=None, master_des=None, master_matcher=None, **pyramid_kwargs):
+    """Run the full-resolution and pyramid alignment paths on one frame and report the difference.
+
+    Returns a dict with per-path seconds and inliers, the speedup of the pyramid
+    path and the mean displacement (live-frame pixels) of the ROI corners between
+    the two homographies.
+    """
+    start = time.perf_counter()
+    full = align_to_master(master, new_img, master_kp=master_kp, master_des=master_des, master_matcher=master_matcher)
+    full_seconds = time.perf_counter() - start
+
+    pyramid = align_to_master_pyramid(master, new_img, **pyramid_kwargs)
+
+    corner_error = None
+    if full["homography"] is not None and pyramid["homography"] is not None:
+        # Compare where each homography puts the lot ROI (or master) corners in the live frame
+        x, y, w, h = pyramid_kwargs.get("roi") or (0, 0, master.shape[1], master.shape[0])
+        corners = np.float32([[x, y], [x + w, y], [x + w, y + h], [x, y + h]]).reshape(-1, 1, 2)
+        a = cv2.perspectiveTransform(corners, np.linalg.inv(full["homography"]))
+        b = cv2.perspectiveTransform(corners, np.linalg.inv(pyramid["homography"]))
+        corner_error = float(np.linalg.norm(a - b, axis=2).mean())
+
+    return {
+        "full_seconds": full_seconds,
+        "full_inliers": full["inliers"],
+        "pyramid_seconds": pyramid["elapsed"],
+        "pyramid_inliers": pyramid["inliers"],
+        "pyramid_refinement": pyramid["refinement"],
+        "speedup": full_seconds / pyramid["elapsed"] if pyramid["elapsed"] > 0 else float("inf"),
+        "corner_error": corner_error,
+    }
+
+
 if __name__ == "__main__":
     if len(sys.argv) != 3:
         print("Usage: python align.py <master_image> <test_image>")
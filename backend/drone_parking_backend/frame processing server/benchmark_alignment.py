@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+from align import (
+    ESTIMATORS,
+    build_master_matcher,
+    compare_pyramid_alignment,
+    estimate_homography,
+    keypoint_coords,
+    knn_candidates,
+    precompute_master,
+    precompute_master_pyramid,
+    ratio_test,
+)
+from config import load_lot, load_lot_features
+
+
+def benchmark_pyramid(lot_id, image_path, scales=(0.25, 0.5), refinements=("matches", "ecc", None)):
+    """Compare full-resolution alignment against each pyramid configuration on one frame."""
+    print(f"\n{'='*50}")
+    print(f"PYRAMID ALIGNMENT BENCHMARK: {image_path} (lot {lot_id})")
+    print(f"{'='*50}")
+
+    master_img, parking_data, features, err = load_lot_features(lot_id)
+    if err:
+        print("Error loading lot:", err)
+        return
+
+    image = cv2.imread(image_path)
+    if image is None:
+        print("Error: Could not load image:", image_path)
+        return
+
+    master_kp, master_des = features.sift()
+    master_matcher = build_master_matcher(master_des)
+    roi = cv2.boundingRect(np.concatenate([polygon for polygon, _ in parking_data]))
+
+    for scale in scales:
+        master_pyramid = precompute_master_pyramid(master_img, scale, roi)
+        for refine in refinements:
+            stats = compare_pyramid_alignment(
+                master_img,
+                image,
+                master_kp=master_kp,
+                master_des=master_des,
+                master_matcher=master_matcher,
+                scale=scale,
+                refine=refine,
+                roi=roi,
+                master_pyramid=master_pyramid,
+            )
+            corner_error = "n/a" if stats["corner_error"] is None else f"{stats['corner_error']:.2f}px"
+            print(
+                f"scale={scale:<5} refine={str(refine):<8} "
+                f"full={stats['full_seconds']:.3f}s ({stats['full_inliers']} inliers) | "
+                f"pyramid={stats['pyramid_seconds']:.3f}s ({stats['pyramid_inliers']} inliers) | "
+                f"speedup={stats['speedup']:.1f}x | corner diff={corner_error}"
+            )
+
+
+def synthetic_cases():
+    """Rebuild the synthetic master/live pairs used in tests/test_align.py, with their true homographies."""
+    shapes = np.zeros((200, 200, 3), dtype=np.uint8)
+    cv2.rectangle(shapes, (20, 20), (80, 80), (255, 255, 255), -1)
+    cv2.circle(shapes, (150, 50), 20, (200, 100, 50), -1)
+    cv2.fillPoly(shapes, [np.array([[50, 150], [100, 190], [10, 190]])], (100, 255, 100))
+    cv2.line(shapes, (120, 150), (180, 180), (100, 100, 255), 5)
+    M = cv2.getRotationMatrix2D((100, 100), 5, 1)
+    M[0, 2] += 10
+    M[1, 2] -= 5
+    # warpAffine maps master -> live, so live -> master is its inverse
+    H_shapes = np.linalg.inv(np.vstack([M, [0, 0, 1]]))
+    shapes_live = cv2.warpAffine(shapes, M, (200, 200))
+
+    rng = np.random.default_rng(0)
+    blocks = np.full((600, 800, 3), 60, dtype=np.uint8)
+    for _ in range(80):
+        x, y = int(rng.integers(0, 760)), int(rng.integers(0, 560))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(blocks, (x, y), (x + int(rng.integers(10, 40)), y + int(rng.integers(10, 40))), color, -1)
+    H_blocks = np.array([[1.02, 0.03, -15.0], [-0.02, 0.99, 12.0], [1e-5, -2e-5, 1.0]])
+    blocks_live = cv2.warpPerspective(blocks, np.linalg.inv(H_blocks), (800, 600))
+
+    return [
+        ("synthetic shapes", shapes, shapes_live, H_shapes),
+        ("synthetic blocks", blocks, blocks_live, H_blocks),
+    ]
+
+
+def benchmark_estimators(cases, ratio=0.7, repeats=20, iteration_caps=(500, 2000)):
+    """Time each homography estimator on the ratio-tested matches of each (name, master, live, H_true) case."""
+    print(f"\n{'='*50}")
+    print("HOMOGRAPHY ESTIMATOR BENCHMARK")
+    print(f"{'='*50}")
+
+    for name, master, live, H_true in cases:
+        master_kp, master_des = precompute_master(master)
+        live_kp, live_des = precompute_master(live)
+        candidates = knn_candidates(master_des, live_des, index=build_master_matcher(master_des))
+        if candidates is None:
+            print(f"{name}: no matches")
+            continue
+        live_idx, master_idx = ratio_test(candidates, ratio)
+        src = keypoint_coords(live_kp)[live_idx]
+        dst = keypoint_coords(master_kp)[master_idx]
+        print(f"\n{name}: {len(live_idx)} ratio-tested matches")
+
+        h, w = master.shape[:2]
+        corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        for estimator in ESTIMATORS:
+            for max_iters in iteration_caps:
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    H, inliers = estimate_homography(src, dst, estimator, max_iters=max_iters)
+                ms = (time.perf_counter() - start) / repeats * 1000
+
+                error = "n/a"
+                if H is not None and H_true is not None:
+                    diff = cv2.perspectiveTransform(corners, np.linalg.inv(H)) - cv2.perspectiveTransform(
+                        corners, np.linalg.inv(H_true)
+                    )
+                    error = f"{np.linalg.norm(diff, axis=2).mean():.2f}px"
+                print(f"  {estimator:<9} iters<={max_iters:<5} {ms:7.2f} ms | inliers={inliers:4d} | corner error={error}")
+
+
+if __name__ == "__main__":
+    image_path = sys.argv[1] if len(sys.argv) > 1 else "test_lot1.png"
+    lot_id = sys.argv[2] if len(sys.argv) > 2 else "1"
+
+    if not os.path.exists(image_path):
+        print(f"Error: {image_path} not found. Provide a valid image.")
+        sys.exit(1)
+
+    benchmark_pyramid(lot_id, image_path)
+
+    master_img, _, err = load_lot(lot_id)
+    cases = synthetic_cases()
+    if not err:
+        cases.append((os.path.basename(image_path), master_img, cv2.imread(image_path), None))
+    benchmark_estimators(cases)
@@ -0,0 +1,68 @@
+import sys
+import time
+import numpy as np
+
+from occupancy import LotGeometry
+
+
+def synthetic_lot(n_spots, spot_w=40, spot_h=80, gap=6, per_row=100):
+    """Build a garage-like lot of n_spots rectangular spots laid out in rows."""
+    parking_data = []
+    for i in range(n_spots):
+        row, col = divmod(i, per_row)
+        x, y = col * (spot_w + gap), row * (spot_h + gap)
+        polygon = np.array([[x, y], [x + spot_w, y], [x + spot_w, y + spot_h], [x, y + spot_h]], np.int32)
+        parking_data.append((polygon, f"S{i}"))
+    return parking_data
+
+
+def synthetic_boxes(parking_data, n_boxes, seed=0):
+    """Place n_boxes car-sized boxes over randomly chosen spots, jittered by a few pixels."""
+    rng = np.random.default_rng(seed)
+    boxes = []
+    for i in rng.choice(len(parking_data), size=min(n_boxes, len(parking_data)), replace=False):
+        x1, y1 = parking_data[i][0].min(axis=0) + rng.integers(-8, 9, 2)
+        x2, y2 = parking_data[i][0].max(axis=0) + rng.integers(-8, 9, 2)
+        boxes.append((int(x1), int(y1), int(x2), int(y2), float(rng.uniform(0.4, 0.99))))
+    return boxes
+
+
+def time_check(geometry, boxes, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = geometry.check(boxes)
+    return (time.perf_counter() - start) / repeats, result
+
+
+def benchmark_spatial_index(spot_counts=(10, 1000, 10000), max_boxes=300, repeats=5):
+    """Compare grid-indexed occupancy against testing every box against every spot."""
+    print(f"\n{'='*50}")
+    print("OCCUPANCY SPATIAL INDEX BENCHMARK")
+    print(f"{'='*50}")
+
+    for n_spots in spot_counts:
+        parking_data = synthetic_lot(n_spots)
+        boxes = synthetic_boxes(parking_data, min(max_boxes, max(1, n_spots // 2)))
+
+        start = time.perf_counter()
+        geometry = LotGeometry(parking_data)
+        build_seconds = time.perf_counter() - start
+        # One cell covering the whole lot makes every spot a candidate for every box
+        all_pairs = LotGeometry(parking_data, cell_size=1 << 30)
+
+        indexed_seconds, indexed_result = time_check(geometry, boxes, repeats)
+        all_pairs_seconds, all_pairs_result = time_check(all_pairs, boxes, repeats)
+        assert indexed_result == all_pairs_result
+
+        pairs = sum(len(geometry.candidates(box)) for box in boxes)
+        print(
+            f"spots={n_spots:<6} boxes={len(boxes):<4} build={build_seconds * 1000:8.1f} ms | "
+            f"indexed={indexed_seconds * 1000:7.2f} ms ({pairs} pairs) | "
+            f"all pairs={all_pairs_seconds * 1000:8.2f} ms ({n_spots * len(boxes)} pairs) | "
+            f"speedup={all_pairs_seconds / indexed_seconds:.1f}x | occupied={len(indexed_result['occupied'])}"
+        )
+
+
+if __name__ == "__main__":
+    counts = tuple(int(n) for n in sys.argv[1:]) or (10, 1000, 10000)
+    benchmark_spatial_index(counts)
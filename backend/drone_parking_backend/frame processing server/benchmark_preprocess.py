@@ -0,0 +1,71 @@
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+from detect import Preprocessor
+
+
+def original_preprocess(image):
+    """preprocess() as it was before Preprocessor: every table, kernel and buffer rebuilt per call."""
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
+    cl = clahe.apply(l)
+    limg = cv2.merge((cl, a, b))
+    enhanced = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+
+    invGamma = 1.0 / 1.2
+    table = np.array([((i / 255.0) ** invGamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
+    enhanced = cv2.LUT(enhanced, table)
+
+    kernel = np.array([[-1/9, -1/9, -1/9], [-1/9, 17/9, -1/9], [-1/9, -1/9, -1/9]])
+    return cv2.filter2D(enhanced, -1, kernel)
+
+
+def measure(fn, image, repeats):
+    """Return (seconds per call, peak traced allocation in bytes) for fn(image)."""
+    fn(image)  # warm-up, so one-time buffers don't count as per-frame cost
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(image)
+    seconds = (time.perf_counter() - start) / repeats
+
+    tracemalloc.start()
+    fn(image)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def benchmark_preprocess(image, repeats=20):
+    """Compare per-call time and peak allocation of the original preprocess and Preprocessor."""
+    print(f"\n{'='*50}")
+    print(f"PREPROCESS BENCHMARK: {image.shape[1]}x{image.shape[0]}")
+    print(f"{'='*50}")
+
+    megapixels = image.shape[0] * image.shape[1] / 1e6
+    preprocessor = Preprocessor()
+    out = np.empty_like(image)
+    assert np.array_equal(original_preprocess(image), preprocessor(image, out))
+
+    for name, fn in (
+        ("original", original_preprocess),
+        ("Preprocessor", preprocessor),
+        ("Preprocessor(out=)", lambda img: preprocessor(img, out)),
+    ):
+        seconds, peak = measure(fn, image, repeats)
+        print(
+            f"{name:<20} {seconds * 1000:8.2f} ms ({seconds * 1000 / megapixels:6.2f} ms/MP) | "
+            f"peak alloc {peak / 1e6:7.2f} MB ({peak / 1e6 / megapixels:6.2f} MB/MP)"
+        )
+
+
+if __name__ == "__main__":
+    image_path = sys.argv[1] if len(sys.argv) > 1 else "test_lot1.png"
+    image = cv2.imread(image_path)
+    if image is None:
+        print("Error: Could not load image:", image_path)
+        sys.exit(1)
+    benchmark_preprocess(image)
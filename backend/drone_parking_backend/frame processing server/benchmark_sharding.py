@@ -0,0 +1,117 @@
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+import config
+from sharding import ShardedPool
+
+
+def offline_worker(lot_dir):
+    """Shard initializer: read lots from lot_dir, replace the paid detector with an empty result, silence logs."""
+    import pipeline
+
+    sys.stdout = open(os.devnull, "w")
+    config.LOT_DIR = lot_dir
+    pipeline.detect_cars = lambda image, **kwargs: []
+
+
+def synthetic_lots(lot_dir, n_lots, frames_per_lot=3, size=(960, 540)):
+    """Write n_lots synthetic lots (textured master + 2 spots) and return {lot_id: [encoded frames]}."""
+    import pipeline
+
+    config.LOT_DIR = lot_dir
+    w, h = size
+    frames = {}
+    for n in range(n_lots):
+        rng = np.random.default_rng(n)
+        master = np.full((h, w, 3), 60, dtype=np.uint8)
+        for _ in range(120):
+            x, y = int(rng.integers(0, w - 40)), int(rng.integers(0, h - 40))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.rectangle(master, (x, y), (x + int(rng.integers(10, 40)), y + int(rng.integers(10, 40))), color, -1)
+        lot_id = f"bench{n}"
+        os.makedirs(os.path.join(lot_dir, lot_id))
+        cv2.imwrite(os.path.join(lot_dir, lot_id, "master.jpg"), master)
+        spots = [
+            {"id": "A1", "polygon": [[100, 100], [200, 100], [200, 200], [100, 200]]},
+            {"id": "A2", "polygon": [[300, 100], [400, 100], [400, 200], [300, 200]]},
+        ]
+        with open(os.path.join(lot_dir, lot_id, "parking.json"), "w") as f:
+            json.dump(spots, f)
+        # Fill the on-disk feature cache once so workers measure warm-up, not SIFT on the master
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.build_master_state(lot_id, *config.load_lot(lot_id)[:2])
+
+        frames[lot_id] = []
+        for i in range(frames_per_lot):
+            H = np.array([[1.0, 0.01, 4.0 + i], [-0.01, 1.0, -4.0], [0.0, 0.0, 1.0]])
+            frame = cv2.warpPerspective(master, np.linalg.inv(H), (w, h))
+            frames[lot_id].append(cv2.imencode(".jpg", frame)[1].tobytes())
+    return frames
+
+
+def run_workload(pool, requests, concurrency):
+    """Send (lot_id, frame) requests with `concurrency` in flight; return per-request latencies in seconds."""
+
+    def timed(request):
+        start = time.perf_counter()
+        pool.submit(request[0], [request[1]]).result()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as senders:
+        return list(senders.map(timed, requests))
+
+
+def benchmark_sharding(lot_counts=(1, 10, 100), workers=4, requests_per_config=200, seed=0):
+    """Compare lot-affinity sharding against a shared (round-robin) process pool."""
+    print(f"\n{'='*50}")
+    print(f"LOT SHARDING BENCHMARK ({workers} worker processes)")
+    print(f"{'='*50}")
+
+    for n_lots in lot_counts:
+        lot_dir = tempfile.mkdtemp(prefix="lots-")
+        try:
+            frames = synthetic_lots(lot_dir, n_lots)
+            rng = random.Random(seed)
+            lot_ids = sorted(frames)
+            requests = []
+            for _ in range(max(requests_per_config, 2 * n_lots)):
+                lot_id = rng.choice(lot_ids)
+                requests.append((lot_id, rng.choice(frames[lot_id])))
+
+            for routing in ("round_robin", "hash"):
+                pool = ShardedPool(workers, routing=routing, initializer=offline_worker, initargs=(lot_dir,), cache=None)
+                try:
+                    pool.stats()  # wait until every worker is up
+                    start = time.perf_counter()
+                    latencies = np.array(run_workload(pool, requests, workers))
+                    seconds = time.perf_counter() - start
+                    stats = pool.stats()
+                finally:
+                    pool.close()
+
+                label = "shared pool" if routing == "round_robin" else "sharded"
+                print(
+                    f"lots={n_lots:<4} {label:<12} warm lot copies={sum(len(s['lots']) for s in stats):4d} | "
+                    f"lot state={sum(s['lot_bytes'] for s in stats) / 1e6:7.1f} MB | "
+                    f"worker RSS={sum(s['max_rss_bytes'] for s in stats) / 1e6:7.1f} MB | "
+                    f"p50={np.percentile(latencies, 50) * 1000:7.1f} ms p99={np.percentile(latencies, 99) * 1000:7.1f} ms | "
+                    f"{len(requests) / seconds:5.1f} frames/s"
+                )
+        finally:
+            shutil.rmtree(lot_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    counts = tuple(int(n) for n in sys.argv[1:]) or (1, 10, 100)
+    workers = int(os.environ.get("SHARD_WORKERS") or 4)
+    benchmark_sharding(counts, workers)
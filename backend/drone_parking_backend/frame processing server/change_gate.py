@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+
+from occupancy import spot_label_image
+
+# Mean absolute gray-level difference inside a spot that counts as a change
+CHANGE_THRESHOLD = 12.0
+# Spots are compared on a master-space copy of the frame shrunk by this factor
+GATE_SCALE = 0.25
+
+# lot_id -> change gate state for that lot
+GATES = {}
+
+
+def _new_gate(parking_data, master_shape, scale):
+    labels = spot_label_image(parking_data, master_shape, scale)
+    return {
+        "master_shape": master_shape,
+        "scale": scale,
+        "size": (labels.shape[1], labels.shape[0]),
+        "labels": labels.ravel(),
+        "counts": np.bincount(labels.ravel(), minlength=len(parking_data) + 1),
+        "reference": None,
+        "pending": None,
+        "result": None,
+        "diffs": None,
+        "skipped": 0,
+        "detected": 0,
+    }
+
+
+def reset_gate(lot_id):
+    """Forget a lot's reference frame, e.g. after its master image or spots change."""
+    GATES.pop(lot_id, None)
+
+
+def spot_differences(gray, reference, labels, counts):
+    """Mean absolute difference between two images inside each labelled spot.
+
+    Args:
+        gray, reference: same-sized uint8 images
+        labels: flattened label image, 1 + spot index per pixel and 0 elsewhere
+        counts: np.bincount(labels), the pixel count of each label
+
+    Returns a float array with one value per spot (0 for spots with no pixels).
+    """
+    diff = cv2.absdiff(gray, reference).ravel()
+    sums = np.bincount(labels, weights=diff, minlength=len(counts))
+    return (sums / np.maximum(counts, 1))[1:]
+
+
+def check_gate(lot_id, image, homography, parking_data, master_shape, threshold=CHANGE_THRESHOLD, scale=GATE_SCALE):
+    """Return the lot's last detection result if no spot changed since it was computed.
+
+    The live frame is shrunk, warped into master coordinates with the frame's
+    homography and compared to the frame the last detection ran on. Each
+    parking.json spot gets its mean absolute difference, and if none exceeds
+    threshold the previous result is returned and counted as a skipped
+    detector call. Otherwise None is returned and the caller should detect and
+    then call record_detection.
+
+    Args:
+        lot_id: lot whose gate state to use and update
+        image: the live drone image BGR array
+        homography: live -> master homography from alignment
+        parking_data: list of (polygon_ndarray, spot_id) tuples in master coordinates
+        master_shape: shape of the lot's master image
+        threshold: per-spot mean absolute difference (gray levels) that counts as a change
+        scale: downscale factor of the comparison images
+    """
+    gate = GATES.get(lot_id)
+    if gate is None or gate["master_shape"] != master_shape or len(gate["counts"]) != len(parking_data) + 1:
+        gate = _new_gate(parking_data, master_shape, scale)
+        GATES[lot_id] = gate
+
+    s = gate["scale"]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+    # Same homography in downscaled coordinates on both sides
+    S = np.diag([s, s, 1.0])
+    H_small = S @ homography @ np.linalg.inv(S)
+    gate["pending"] = cv2.warpPerspective(small, H_small, gate["size"])
+
+    if gate["reference"] is None or gate["result"] is None:
+        return None
+
+    gate["diffs"] = spot_differences(gate["pending"], gate["reference"], gate["labels"], gate["counts"])
+    if gate["diffs"].size and gate["diffs"].max() > threshold:
+        return None
+
+    gate["skipped"] += 1
+    return gate["result"]
+
+
+def gate_frame(lot_id):
+    """Return the comparison image of the frame last passed to check_gate, or None."""
+    gate = GATES.get(lot_id)
+    return None if gate is None else gate["pending"]
+
+
+def record_detection(lot_id, result, reference=None):
+    """Make a frame the lot's reference, with its detection result.
+
+    Args:
+        lot_id: lot whose gate to update
+        result: detection result to reuse for unchanged frames
+        reference: gate_frame() of the detected frame, for callers that gate
+                   later frames before this detection finishes (default: the
+                   frame last passed to check_gate)
+    """
+    gate = GATES.get(lot_id)
+    if reference is None and gate is not None:
+        reference = gate["pending"]
+    # The gate may have been rebuilt for a new master since the frame was gated
+    if gate is None or reference is None or reference.shape != (gate["size"][1], gate["size"][0]):
+        return
+    # The reference only moves when detection runs, so slow changes still add up to a trigger
+    gate["reference"] = reference
+    gate["result"] = result
+    gate["detected"] += 1
+
+
+def gate_stats(lot_id):
+    """Return (skipped_detections, detections) counts for a lot."""
+    gate = GATES.get(lot_id)
+    if gate is None:
+        return 0, 0
+    return gate["skipped"], gate["detected"]
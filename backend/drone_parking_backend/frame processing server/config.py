@@ -1,10 +1,40 @@
 import os
 import json
+import hashlib
 import cv2
 import numpy as np
 
+from align import (
+    MASTER_VARIANTS,
+    build_alignment_mask,
+    build_master_variants,
+    precompute_master,
+    precompute_master_variant,
+)
+from feature_cache import CACHE_FILENAME, file_hash, load_features, save_features
+
 LOT_DIR = "lots"
 
+# Defaults for the optional lots/<id>/alignment.json
+ALIGNMENT_DEFAULTS = {
+    "max_keypoints": 0,  # SIFT/ORB keypoint budget per image, 0 = no limit
+    "border": 0,  # pixels ignored along every image edge
+    "exclude_spots": False,  # drop keypoints inside spot polygons, where cars come and go
+    "static_regions": None,  # optional polygons of static structure (paint lines, curbs) to keep
+    "estimator": "ransac",  # homography estimator: "ransac", "magsac" or "accurate"
+    "max_iters": 2000,  # estimator iteration cap
+}
+
+
+def find_master_path(lot_id):
+    """Return the path of a lot's master image, or None if it is missing."""
+    lot_path = os.path.join(LOT_DIR, lot_id)
+    for name in ("master.jpg", "master.JPG"):
+        master_path = os.path.join(lot_path, name)
+        if os.path.exists(master_path):
+            return master_path
+    return None
+
 
 def load_lot(lot_id):
     """Load master image and parking spot definitions for a lot.
@@ -14,13 +44,10 @@ def load_lot(lot_id):
     matching the format used by the occupancy checker.
     """
     lot_path = os.path.join(LOT_DIR, lot_id)
-    master_path = os.path.join(lot_path, "master.jpg")
+    master_path = find_master_path(lot_id)
     parking_path = os.path.join(lot_path, "parking.json")
 
-    # Try .jpg first, then .JPG
-    if not os.path.exists(master_path):
-        master_path = os.path.join(lot_path, "master.JPG")
-    if not os.path.exists(master_path):
+    if master_path is None:
         return None, None, f"Master image missing for {lot_id}"
 
     if not os.path.exists(parking_path):
@@ -42,6 +69,151 @@ def load_lot(lot_id):
     return master_img, parking_data, None
 
 
+def load_lot_features(lot_id):
+    """Load a lot like load_lot, plus a lazy handle on its master's features.
+
+    Returns (master_img, parking_data, features, error_string), where
+    features is a MasterFeatures handle that reads the master's features from
+    the on-disk cache on first use.
+    """
+    master_img, parking_data, err = load_lot(lot_id)
+    if err:
+        return None, None, None, err
+    return master_img, parking_data, MasterFeatures(lot_id, master_img), None
+
+
+def load_alignment_settings(lot_id):
+    """Load per-lot alignment settings from lots/<id>/alignment.json.
+
+    Missing keys (or a missing file) fall back to ALIGNMENT_DEFAULTS.
+    """
+    settings = dict(ALIGNMENT_DEFAULTS)
+    settings_path = os.path.join(LOT_DIR, lot_id, "alignment.json")
+    if os.path.exists(settings_path):
+        with open(settings_path, "r") as f:
+            settings.update(json.load(f))
+    return settings
+
+
+def build_master_mask(master_img, parking_data, settings):
+    """Build the master keypoint mask described by a lot's alignment settings, or None."""
+    exclude = [polygon for polygon, _ in parking_data] if settings["exclude_spots"] else None
+    return build_alignment_mask(
+        master_img.shape, include=settings["static_regions"], exclude=exclude, border=settings["border"]
+    )
+
+
+def build_live_mask(live_img, settings):
+    """Build the live-frame keypoint mask for a lot's alignment settings, or None.
+
+    Spot and structure polygons are in master coordinates, so only the border applies.
+    """
+    return build_alignment_mask(live_img.shape, border=settings["border"])
+
+
+def _load_feature_sets(lot_id, names, master_img=None, mask=None, max_keypoints=0, master_path=None):
+    """Load named master feature sets from the on-disk cache, computing any that are missing.
+
+    The cache lives next to the master as lots/<id>/master_features.npz and is
+    keyed by a content hash of the master file (and of the mask and keypoint
+    budget, when used), so replacing the master or changing the alignment
+    settings invalidates it automatically. Newly computed sets are written
+    back for the next process. master_path overrides the lot's master file,
+    e.g. a promoted master that is not swapped in yet.
+
+    Returns dict of name -> (keypoints, descriptors), or None if the master is missing.
+    """
+    master_path = master_path or find_master_path(lot_id)
+    if master_path is None:
+        return None
+
+    master_hash = file_hash(master_path)
+    if mask is not None or max_keypoints:
+        settings_hash = hashlib.sha256(str(max_keypoints).encode())
+        if mask is not None:
+            settings_hash.update(mask.tobytes())
+        master_hash = f"{master_hash}-{settings_hash.hexdigest()[:16]}"
+    cache_path = os.path.join(LOT_DIR, lot_id, CACHE_FILENAME)
+
+    feature_sets = {}
+    cached = load_features(cache_path, master_hash)
+    if cached is not None:
+        image_size, cached_sets = cached
+        if master_img is None or image_size == (master_img.shape[1], master_img.shape[0]):
+            feature_sets = cached_sets
+
+    missing = [name for name in names if name not in feature_sets]
+    if missing:
+        if master_img is None:
+            master_img = cv2.imread(master_path)
+            if master_img is None:
+                return None
+
+        for name in missing:
+            if name == "sift":
+                feature_sets[name] = precompute_master(master_img, mask, max_keypoints)
+            else:
+                feature_sets[name] = precompute_master_variant(master_img, name, mask, max_keypoints)
+
+        try:
+            save_features(cache_path, master_hash, (master_img.shape[1], master_img.shape[0]), feature_sets)
+        except OSError as e:
+            print(f"Warning: could not write feature cache for {lot_id}: {e}")
+
+    return {name: feature_sets[name] for name in names}
+
+
+def load_master_features(lot_id, master_img=None, mask=None, max_keypoints=0, master_path=None):
+    """Load SIFT features for a lot's master image, using the on-disk feature cache.
+
+    mask and max_keypoints are passed to precompute_master on a cache miss.
+
+    Returns (keypoints, descriptors), or (None, None) if the master is missing.
+    """
+    feature_sets = _load_feature_sets(lot_id, ["sift"], master_img, mask, max_keypoints, master_path)
+    if feature_sets is None:
+        return None, None
+    return feature_sets["sift"]
+
+
+def load_master_variants(lot_id, master_img=None, mask=None, max_keypoints=0, master_path=None):
+    """Load the CLAHE and ORB fallback features for a lot's master, using the on-disk feature cache.
+
+    Returns the align.build_master_variants dict, or None if the master is missing.
+    """
+    feature_sets = _load_feature_sets(lot_id, list(MASTER_VARIANTS), master_img, mask, max_keypoints, master_path)
+    if feature_sets is None:
+        return None
+    return build_master_variants(feature_sets)
+
+
+class MasterFeatures:
+    """Lazy handle on a master image's features in the on-disk feature cache.
+
+    Nothing is hashed, read or computed until sift() or variants() is called.
+    Each feature set is then loaded from lots/<id>/master_features.npz, or
+    computed and written back on a cache miss (see _load_feature_sets).
+
+    Args:
+        lot_id: lot the master belongs to
+        master_img: the decoded master, used on a cache miss (read from disk if None)
+        master_path: master file the cache is keyed by (default: the lot's master)
+    """
+
+    def __init__(self, lot_id, master_img=None, master_path=None):
+        self.lot_id = lot_id
+        self.master_img = master_img
+        self.master_path = master_path
+
+    def sift(self, mask=None, max_keypoints=0):
+        """Return the master's SIFT (keypoints, descriptors), or (None, None) if it is missing."""
+        return load_master_features(self.lot_id, self.master_img, mask, max_keypoints, self.master_path)
+
+    def variants(self, mask=None, max_keypoints=0):
+        """Return the master's CLAHE and ORB fallback features (see load_master_variants)."""
+        return load_master_variants(self.lot_id, self.master_img, mask, max_keypoints, self.master_path)
+
+
 if __name__ == "__main__":
     img, data, err = load_lot("lotA")
     if err:
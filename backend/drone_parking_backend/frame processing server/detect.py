@@ -1,16 +1,54 @@
+import base64
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
 from roboflow import Roboflow
+from urllib3.util.retry import Retry
 
 # Roboflow config — reads API key from env var
 ROBOFLOW_API_KEY = os.environ.get("ROBOFLOW_API_KEY", "crcxvzrMUhqJYcyMcpW8")
 WORKSPACE = "drone-parking-management-system"
 PROJECT = "drone-parking-detection"
 MODEL_VERSION = 4
+ROBOFLOW_DETECT_URL = os.environ.get("DETECTOR_URL", "https://detect.roboflow.com")
+
+# Detector backend: "roboflow" (hosted API) or "local" (exported ONNX model on CPU via OpenCV DNN)
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "roboflow")
+LOCAL_MODEL_PATH = os.environ.get("DETECTOR_MODEL_PATH", os.path.join("models", f"{PROJECT}-{MODEL_VERSION}.onnx"))
+MODEL_INPUT_SIZE = int(os.environ.get("DETECTOR_INPUT_SIZE", "640"))
+
+# Compact upload mode: JPEG quality of the cropped, downscaled frame, and the uplink
+# rate used to estimate the time saved (the profile wrote ~1.28 MB in 3.8 s)
+UPLOAD_JPEG_QUALITY = int(os.environ.get("DETECTOR_JPEG_QUALITY", "80"))
+UPLINK_BYTES_PER_SEC = float(os.environ.get("DETECTOR_UPLINK_BPS", "335000"))
+# Base64 payload bytes per pixel of a full frame at the SDK's default JPEG quality
+# (~0.36 measured on test_lot1.png), used to estimate what compact mode avoids sending
+FULL_FRAME_BYTES_PER_PIXEL = float(os.environ.get("DETECTOR_FULL_FRAME_BPP", "0.36"))
+
+# Pooled HTTP client: concurrent requests (and kept-alive connections), per-request
+# timeout in seconds, and retries with exponential backoff on connection errors and 429/5xx
+MAX_CONCURRENCY = int(os.environ.get("DETECTOR_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.environ.get("DETECTOR_TIMEOUT", "30"))
+MAX_RETRIES = int(os.environ.get("DETECTOR_RETRIES", "3"))
+RETRY_BACKOFF = float(os.environ.get("DETECTOR_BACKOFF", "0.5"))
+# cv2.imencode's default, i.e. what the Roboflow SDK sends for a numpy frame
+SDK_JPEG_QUALITY = 95
+
+# Tiled mode: tile edge length and overlap between neighbouring tiles, in frame pixels.
+# The overlap should exceed a car's length so every car is whole in at least one tile.
+TILE_SIZE = int(os.environ.get("DETECTOR_TILE_SIZE", "640"))
+TILE_OVERLAP = int(os.environ.get("DETECTOR_TILE_OVERLAP", "160"))
 
 _model = None
+_client = None
+_detectors = {}
+_detectors_lock = threading.Lock()
 
 
 def _get_model():
@@ -24,64 +62,509 @@ def _get_model():
     return _model
 
 
-def preprocess(image):
+class DetectionClient:
+    """Keep-alive HTTP client for the hosted detection endpoint.
+
+    One requests.Session with a connection pool is reused for every call, so
+    TLS setup and certificate loading happen once per connection instead of
+    once per frame.
+
+    Args:
+        base_url: endpoint root; the model path and query string are appended
+        max_concurrency: worker threads for predict_many and pooled connections
+        timeout: seconds before a single request attempt is abandoned
+        retries: retry attempts on connection errors, timeouts and 429/5xx responses
+        backoff: exponential backoff factor in seconds between retries
+    """
+
+    def __init__(
+        self,
+        base_url=ROBOFLOW_DETECT_URL,
+        max_concurrency=MAX_CONCURRENCY,
+        timeout=REQUEST_TIMEOUT,
+        retries=MAX_RETRIES,
+        backoff=RETRY_BACKOFF,
+    ):
+        self.url = f"{base_url.rstrip('/')}/{PROJECT}/{MODEL_VERSION}"
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,  # inference POSTs are safe to repeat
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def predict_jpeg(self, data, confidence=30, overlap=30):
+        """POST JPEG bytes and return the Roboflow-style prediction dicts."""
+        resp = self.session.post(
+            self.url,
+            params={"api_key": ROBOFLOW_API_KEY, "confidence": confidence, "overlap": overlap, "format": "json"},
+            data=base64.b64encode(data),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()["predictions"]
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.session.close()
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = DetectionClient()
+    return _client
+
+
+class Preprocessor:
+    """Reusable form of preprocess() with its tables, kernel and CLAHE built once.
+
+    Intermediate LAB, luminance and BGR images are kept per input shape and
+    reused, and the result can be written into a caller-supplied buffer, so a
+    steady stream of same-sized frames allocates nothing per call.
+
+    Not thread-safe: each thread should use its own instance (preprocess() does).
+
+    Args:
+        clip_limit, tile_grid: CLAHE settings for the L channel
+        gamma: gamma correction applied after CLAHE
+    """
+
+    def __init__(self, clip_limit=2.5, tile_grid=(8, 8), gamma=1.2):
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid)
+        invGamma = 1.0 / gamma
+        # Same expression preprocess() always used, so the table matches it exactly
+        self.gamma_table = np.array([((i / 255.0) ** invGamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
+        self.kernel = np.array([[-1/9, -1/9, -1/9], [-1/9, 17/9, -1/9], [-1/9, -1/9, -1/9]])
+        self._shape = None
+
+    def _buffers(self, shape):
+        if self._shape != shape:
+            self._lab = np.empty(shape, dtype=np.uint8)
+            self._l = np.empty(shape[:2], dtype=np.uint8)
+            self._l_eq = np.empty(shape[:2], dtype=np.uint8)
+            self._bgr = np.empty(shape, dtype=np.uint8)
+            self._shape = shape
+
+    def __call__(self, image, out=None):
+        """Enhance a BGR image; writes into out (same shape, uint8) if given and returns it."""
+        self._buffers(image.shape)
+        cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=self._lab)
+        cv2.extractChannel(self._lab, 0, dst=self._l)
+        self.clahe.apply(self._l, dst=self._l_eq)
+        cv2.insertChannel(self._l_eq, self._lab, 0)
+        cv2.cvtColor(self._lab, cv2.COLOR_LAB2BGR, dst=self._bgr)
+        cv2.LUT(self._bgr, self.gamma_table, dst=self._bgr)
+        if out is None:
+            out = np.empty_like(self._bgr)
+        cv2.filter2D(self._bgr, -1, self.kernel, dst=out)
+        return out
+
+
+_preprocessors = threading.local()
+
+
+def preprocess(image, out=None):
     """Enhance image for better detection, especially for dark vehicles.
 
     Uses LAB CLAHE for local contrast, Gamma correction for shadow recovery,
     and a subtle sharpening to define vehicle edges.
+
+    Runs on a per-thread Preprocessor. The result is a new array unless an
+    output buffer is passed as out.
+    """
+    preprocessor = getattr(_preprocessors, "instance", None)
+    if preprocessor is None:
+        preprocessor = _preprocessors.instance = Preprocessor()
+    return preprocessor(image, out)
+
+
+def parse_predictions(predictions):
+    """Convert Roboflow-style center/size predictions into (x1, y1, x2, y2, confidence) tuples."""
+    boxes = []
+    for d in predictions:
+        x, y, w, h = d["x"], d["y"], d["width"], d["height"]
+        conf = d.get("confidence", 0.0)
+        x1, y1 = int(x - w / 2), int(y - h / 2)
+        x2, y2 = int(x + w / 2), int(y + h / 2)
+        boxes.append((x1, y1, x2, y2, conf))
+    return boxes
+
+
+class RoboflowDetector:
+    """Hosted Roboflow inference for the lot model version."""
+
+    name = "roboflow"
+
+    def predict(self, image, confidence=30, overlap=30):
+        """Return Roboflow-style prediction dicts for a BGR image."""
+        model = _get_model()
+        # Roboflow SDK can take a numpy array directly, avoiding disk I/O
+        return model.predict(image, confidence=confidence, overlap=overlap).json()["predictions"]
+
+    def predict_jpeg(self, data, confidence=30, overlap=30):
+        """Return Roboflow-style prediction dicts for already JPEG-encoded image bytes.
+
+        Posts to the same hosted endpoint as the SDK, but through the pooled
+        keep-alive client and without re-encoding, so the caller controls the
+        payload size.
+        """
+        return _get_client().predict_jpeg(data, confidence=confidence, overlap=overlap)
+
+
+class LocalDetector:
+    """CPU inference on an ONNX export of the same model version, through OpenCV DNN.
+
+    Expects a YOLOv8-style export trained at a square input size: one output of
+    shape (1, 4 + num_classes, N) holding center x, center y, width, height in
+    input pixels followed by per-class scores. The frame is stretched to the
+    input size, like Roboflow's "Stretch to" preprocessing step.
+
+    A cv2.dnn.Net can't run forward() from several threads at once, so
+    every thread gets its own copy of the network, the way preprocess()
+    keeps one Preprocessor per thread.
+
+    Args:
+        model_path: path to the .onnx file
+        input_size: model input width and height in pixels
     """
-    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-    l = clahe.apply(l)
-    img = cv2.merge([l, a, b])
-    img = cv2.cvtColor(img, cv2.COLOR_LAB2BGR)
 
-    gamma = 1.2
-    invGamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** invGamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
-    img = cv2.LUT(img, table)
+    name = "local"
+
+    def __init__(self, model_path=LOCAL_MODEL_PATH, input_size=MODEL_INPUT_SIZE):
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"Local detector model not found: {model_path} (set DETECTOR_MODEL_PATH)")
+        self.model_path = model_path
+        self.input_size = input_size
+        self._nets = threading.local()
+        self._nets.net = cv2.dnn.readNetFromONNX(model_path)
+
+    @property
+    def net(self):
+        """The calling thread's network, loaded on its first use."""
+        if not hasattr(self._nets, "net"):
+            self._nets.net = cv2.dnn.readNetFromONNX(self.model_path)
+        return self._nets.net
+
+    def predict(self, image, confidence=30, overlap=30):
+        """Return Roboflow-style prediction dicts for a BGR image, in image pixels."""
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (self.input_size, self.input_size), swapRB=True, crop=False)
+        net = self.net
+        net.setInput(blob)
+        output = net.forward()
 
-    kernel = np.array([[-1/9, -1/9, -1/9], [-1/9, 17/9, -1/9], [-1/9, -1/9, -1/9]])
-    img = cv2.filter2D(img, -1, kernel)
+        rows = output[0].T
+        scores = rows[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        class_scores = scores[np.arange(len(rows)), class_ids]
+        keep = class_scores >= confidence / 100
+        rows, class_ids, class_scores = rows[keep], class_ids[keep], class_scores[keep]
 
-    return img
+        sx, sy = w / self.input_size, h / self.input_size
+        centers = rows[:, :4] * [sx, sy, sx, sy]
+        # NMSBoxes takes top-left (x, y, w, h)
+        rects = np.column_stack([centers[:, :2] - centers[:, 2:] / 2, centers[:, 2:]])
+        indices = cv2.dnn.NMSBoxes(rects.tolist(), class_scores.tolist(), confidence / 100, overlap / 100)
 
+        return [
+            {
+                "x": float(centers[i, 0]),
+                "y": float(centers[i, 1]),
+                "width": float(centers[i, 2]),
+                "height": float(centers[i, 3]),
+                "confidence": float(class_scores[i]),
+                "class_id": int(class_ids[i]),
+            }
+            for i in np.array(indices).flatten()
+        ]
 
-def detect_cars(image, confidence=30, overlap=30, use_preprocess=True):
-    """Run Roboflow detection on a cv2 image.
+
+def spot_union_roi(parking_data, image_shape, pad=32):
+    """Return the (x, y, w, h) union of the spot bounding rects, padded and clipped to the image.
+
+    Args:
+        parking_data: list of (polygon_ndarray, spot_id) tuples in the image's coordinates
+        image_shape: shape of the image detection will run on
+        pad: pixels added on every side so cars overhanging a spot are still in view
+    """
+    x, y, w, h = cv2.boundingRect(np.concatenate([polygon for polygon, _ in parking_data]).astype(np.int32))
+    x1, y1 = max(0, x - pad), max(0, y - pad)
+    x2, y2 = min(image_shape[1], x + w + pad), min(image_shape[0], y + h + pad)
+    return x1, y1, max(0, x2 - x1), max(0, y2 - y1)
+
+
+def compact_upload(image, roi=None, input_size=None, jpeg_quality=UPLOAD_JPEG_QUALITY):
+    """Crop an image to roi, shrink it to the model input size and JPEG-encode it.
+
+    Args:
+        image: BGR numpy array
+        roi: optional (x, y, w, h) region to keep
+        input_size: if set, downscale so the longer side is at most this many pixels
+        jpeg_quality: cv2.IMWRITE_JPEG_QUALITY for the encoded payload, or None to skip encoding
+
+    Returns (small_image, jpeg_bytes, (x0, y0, scale)); a point p in small_image
+    is at p / scale + (x0, y0) in the original image.
+    """
+    x0, y0 = 0, 0
+    if roi is not None:
+        x0, y0, w, h = roi
+        image = image[y0:y0 + h, x0:x0 + w]
+
+    scale = 1.0
+    if input_size and max(image.shape[:2]) > input_size:
+        scale = input_size / max(image.shape[:2])
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    if jpeg_quality is None:
+        return image, None, (x0, y0, scale)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return image, buffer.tobytes(), (x0, y0, scale)
+
+
+DETECTOR_BACKENDS = {"roboflow": RoboflowDetector, "local": LocalDetector}
+
+
+def get_detector(backend=None):
+    """Return the (cached) detector for a backend name, defaulting to DETECTOR_BACKEND."""
+    backend = backend or DETECTOR_BACKEND
+    with _detectors_lock:
+        if backend not in _detectors:
+            if backend not in DETECTOR_BACKENDS:
+                raise ValueError(f"Unknown detector backend '{backend}', expected one of {sorted(DETECTOR_BACKENDS)}")
+            _detectors[backend] = DETECTOR_BACKENDS[backend]()
+        return _detectors[backend]
+
+
+def detect_cars(
+    image,
+    confidence=30,
+    overlap=30,
+    use_preprocess=True,
+    backend=None,
+    roi=None,
+    input_size=None,
+    jpeg_quality=None,
+    stats=None,
+):
+    """Run vehicle detection on a cv2 image.
 
     Args:
         image: BGR numpy array (cv2 image)
         confidence: detection confidence threshold (0-100)
         overlap: overlap threshold (0-100)
         use_preprocess: whether to apply image enhancement
+        backend: "roboflow" or "local"; defaults to the DETECTOR_BACKEND env var
+        roi: compact upload mode - only send this (x, y, w, h) region, e.g. spot_union_roi()
+        input_size: compact upload mode - downscale so the longer side is at most this (MODEL_INPUT_SIZE)
+        jpeg_quality: compact upload mode - JPEG quality of the payload (UPLOAD_JPEG_QUALITY)
+        stats: optional dict filled in compact upload mode with bytes_sent,
+               full_frame_bytes (estimated from FULL_FRAME_BYTES_PER_PIXEL),
+               request_seconds and latency_saved (estimated from UPLINK_BYTES_PER_SEC)
+
+    Setting any of roi, input_size or jpeg_quality enables compact upload mode.
+    Boxes are always returned in the coordinates of the input image.
 
     Returns list of (x1, y1, x2, y2, confidence) tuples.
     """
     if use_preprocess:
         image = preprocess(image)
 
-    model = _get_model()
+    detector = get_detector(backend)
 
-    # Roboflow SDK can take a numpy array directly, avoiding disk I/O
-    pred = model.predict(image, confidence=confidence, overlap=overlap).json()
+    if roi is None and input_size is None and jpeg_quality is None:
+        predictions = detector.predict(image, confidence=confidence, overlap=overlap)
+        return parse_predictions(predictions)
 
-    boxes = []
-    for d in pred["predictions"]:
-        x, y, w, h = d["x"], d["y"], d["width"], d["height"]
-        conf = d.get("confidence", 0.0)
-        x1, y1 = int(x - w / 2), int(y - h / 2)
-        x2, y2 = int(x + w / 2), int(y + h / 2)
-        boxes.append((x1, y1, x2, y2, conf))
+    # Local inference has no upload to shrink; it still benefits from the smaller input
+    remote = hasattr(detector, "predict_jpeg")
+    quality = None if not remote else UPLOAD_JPEG_QUALITY if jpeg_quality is None else jpeg_quality
+    small, data, (x0, y0, scale) = compact_upload(image, roi, input_size, quality)
 
-    return boxes
+    start = time.perf_counter()
+    if remote:
+        predictions = detector.predict_jpeg(data, confidence=confidence, overlap=overlap)
+    else:
+        predictions = detector.predict(small, confidence=confidence, overlap=overlap)
+    request_seconds = time.perf_counter() - start
+
+    if stats is not None:
+        # What the default path would have sent, estimated rather than paying a full-frame encode
+        full_frame_bytes = int(image.shape[0] * image.shape[1] * FULL_FRAME_BYTES_PER_PIXEL) if remote else 0
+        bytes_sent = len(base64.b64encode(data)) if remote else 0
+        stats.update(
+            bytes_sent=bytes_sent,
+            full_frame_bytes=full_frame_bytes,
+            request_seconds=request_seconds,
+            latency_saved=(full_frame_bytes - bytes_sent) / UPLINK_BYTES_PER_SEC,
+        )
+
+    for d in predictions:
+        d["x"] = d["x"] / scale + x0
+        d["y"] = d["y"] / scale + y0
+        d["width"] = d["width"] / scale
+        d["height"] = d["height"] / scale
+    return parse_predictions(predictions)
+
+
+def detect_cars_many(images, confidence=30, overlap=30, use_preprocess=True, backend=None, max_concurrency=None, **upload_kwargs):
+    """Run detect_cars on several images, sending the remote requests concurrently.
+
+    Args:
+        images: list of BGR numpy arrays
+        confidence, overlap, use_preprocess, backend: as in detect_cars
+        max_concurrency: requests in flight at once; defaults to, and is capped
+                         at, the client's DETECTOR_CONCURRENCY
+        **upload_kwargs: compact upload options (roi, input_size, jpeg_quality) as in detect_cars
+
+    Remote frames go through the pooled keep-alive client and its worker
+    threads. More requests in flight than its connection pool holds would
+    open connections that are dropped after one use, each paying a new TLS
+    handshake. Without compact upload options frames are sent whole at the
+    SDK's JPEG quality. Local inference runs the images one after another.
+
+    Returns a list of box lists, one per image, in input order.
+    """
+    detector = get_detector(backend)
+    if not hasattr(detector, "predict_jpeg"):
+        return [detect_cars(image, confidence, overlap, use_preprocess, backend, **upload_kwargs) for image in images]
+
+    upload_kwargs.setdefault("jpeg_quality", SDK_JPEG_QUALITY)
+
+    def run(image):
+        return detect_cars(image, confidence, overlap, use_preprocess, backend, **upload_kwargs)
+
+    client = _get_client()
+    if max_concurrency is None or max_concurrency >= client.max_concurrency:
+        return list(client.pool.map(run, images))
+
+    slots = threading.Semaphore(max_concurrency)
+
+    def throttled(image):
+        with slots:
+            return run(image)
+
+    return list(client.pool.map(throttled, images))
+
+
+def tile_grid(image_shape, tile_size=TILE_SIZE, tile_overlap=TILE_OVERLAP, parking_data=None):
+    """Split an image into overlapping (x, y, w, h) tiles.
+
+    Args:
+        image_shape: shape of the image to tile
+        tile_size: tile edge length in pixels; tiles are clipped to the image
+        tile_overlap: pixels shared by neighbouring tiles
+        parking_data: optional (polygon_ndarray, spot_id) list; only tiles
+                      intersecting a spot's bounding rect are kept
+    """
+    h, w = image_shape[:2]
+    step = max(1, tile_size - tile_overlap)
+
+    def starts(length):
+        last = max(0, length - tile_size)
+        # The final tile is flush with the far edge instead of hanging off it
+        return sorted(set(range(0, last, step)) | {last})
+
+    tiles = [(x, y, min(tile_size, w - x), min(tile_size, h - y)) for y in starts(h) for x in starts(w)]
+    if parking_data is None:
+        return tiles
+
+    rects = [cv2.boundingRect(polygon.astype(np.int32)) for polygon, _ in parking_data]
+    return [
+        (x, y, tw, th)
+        for x, y, tw, th in tiles
+        if any(px < x + tw and x < px + pw and py < y + th and y < py + ph for px, py, pw, ph in rects)
+    ]
+
+
+def merge_boxes(boxes, iou_threshold=0.5, containment_threshold=0.8):
+    """Greedy NMS over (x1, y1, x2, y2, confidence) boxes from overlapping tiles.
+
+    A box is dropped if it overlaps an already kept, more confident (or, on
+    ties, larger) box by at least iou_threshold IoU, or if at least
+    containment_threshold of its area lies inside that box. The second rule
+    removes the clipped half of a car cut by a tile edge.
+    """
+    if not boxes:
+        return []
+    arr = np.array([b[:4] for b in boxes], dtype=np.float64)
+    areas = np.maximum(0, arr[:, 2] - arr[:, 0]) * np.maximum(0, arr[:, 3] - arr[:, 1])
+    order = sorted(range(len(boxes)), key=lambda i: (-boxes[i][4], -areas[i]))
+
+    kept = []
+    for i in order:
+        if kept:
+            k = arr[kept]
+            iw = np.maximum(0, np.minimum(k[:, 2], arr[i, 2]) - np.maximum(k[:, 0], arr[i, 0]))
+            ih = np.maximum(0, np.minimum(k[:, 3], arr[i, 3]) - np.maximum(k[:, 1], arr[i, 1]))
+            inter = iw * ih
+            iou = inter / np.maximum(areas[kept] + areas[i] - inter, 1e-9)
+            contained = inter / max(areas[i], 1e-9)
+            if np.any(iou >= iou_threshold) or np.any(contained >= containment_threshold):
+                continue
+        kept.append(i)
+    return [boxes[i] for i in kept]
+
+
+def detect_cars_tiled(
+    image,
+    parking_data=None,
+    confidence=30,
+    overlap=30,
+    use_preprocess=True,
+    backend=None,
+    tile_size=TILE_SIZE,
+    tile_overlap=TILE_OVERLAP,
+    max_concurrency=None,
+    **upload_kwargs,
+):
+    """Tiled mode of detect_cars: detect on overlapping tiles at once and merge across seams.
+
+    Args:
+        image: BGR numpy array
+        parking_data: optional (polygon_ndarray, spot_id) list in the image's
+                      coordinates; tiles without spots are not sent
+        confidence, overlap, use_preprocess, backend: as in detect_cars
+        tile_size, tile_overlap: as in tile_grid
+        max_concurrency: tiles in flight at once; defaults to the client's
+                         DETECTOR_CONCURRENCY, so every tile reuses a pooled
+                         keep-alive connection (see detect_cars_many)
+        **upload_kwargs: jpeg_quality / input_size applied to each tile
+
+    Returns list of (x1, y1, x2, y2, confidence) tuples in image coordinates.
+    """
+    if use_preprocess:
+        # Enhance once over the whole frame so tiles match the untiled input
+        image = preprocess(image)
+
+    tiles = tile_grid(image.shape, tile_size, tile_overlap, parking_data)
+    if not tiles:
+        return []
+
+    crops = [image[y:y + h, x:x + w] for x, y, w, h in tiles]
+    results = detect_cars_many(
+        crops, confidence, overlap, False, backend, max_concurrency, **upload_kwargs
+    )
+
+    boxes = []
+    for (x, y, _, _), tile_boxes in zip(tiles, results):
+        boxes.extend((x1 + x, y1 + y, x2 + x, y2 + y, conf) for x1, y1, x2, y2, conf in tile_boxes)
+    return merge_boxes(boxes, iou_threshold=overlap / 100)
 
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print("Usage: python detect.py <image_path>")
-        print("Requires ROBOFLOW_API_KEY env var to be set")
+        print("Uses DETECTOR_BACKEND (roboflow/local); roboflow requires ROBOFLOW_API_KEY")
         sys.exit(1)
 
     image = cv2.imread(sys.argv[1])
@@ -3,9 +3,14 @@ import sys
 import glob
 import cv2
 import numpy as np
-from align import align_to_master, precompute_master
+from align import align_to_master, build_master_matcher
 from detect import detect_cars
-from config import load_lot
+from config import (
+    build_live_mask,
+    build_master_mask,
+    load_alignment_settings,
+    load_lot_features,
+)
 
 def evaluate_alignment_quality(lot_id, test_images_dir):
     """
@@ -16,13 +21,17 @@ def evaluate_alignment_quality(lot_id, test_images_dir):
     print(f"ALIGNMENT QUALITY EVALUATION FOR LOT: {lot_id}")
     print(f"{'='*50}")
 
-    master_img, parking_data, err = load_lot(lot_id)
+    master_img, parking_data, features, err = load_lot_features(lot_id)
     if err:
         print("Error loading lot:", err)
         return
 
-    print("Precomputing master image SIFT features...")
-    master_kp, master_des = precompute_master(master_img)
+    print("Loading master image SIFT features...")
+    settings = load_alignment_settings(lot_id)
+    master_mask = build_master_mask(master_img, parking_data, settings)
+    master_kp, master_des = features.sift(master_mask, settings["max_keypoints"])
+    master_matcher = build_master_matcher(master_des)
+    master_variants = features.variants(master_mask, settings["max_keypoints"])
 
     image_paths = glob.glob(os.path.join(test_images_dir, "*.jpg")) + glob.glob(os.path.join(test_images_dir, "*.png"))
     
@@ -39,7 +48,19 @@ def evaluate_alignment_quality(lot_id, test_images_dir):
         if test_img is None:
             continue
 
-        align_res = align_to_master(master_img, test_img, master_kp=master_kp, master_des=master_des)
+        align_res = align_to_master(
+            master_img,
+            test_img,
+            master_kp=master_kp,
+            master_des=master_des,
+            master_matcher=master_matcher,
+            master_variants=master_variants,
+            max_keypoints=settings["max_keypoints"],
+            master_mask=master_mask,
+            live_mask=build_live_mask(test_img, settings),
+            estimator=settings["estimator"],
+            max_iters=settings["max_iters"],
+        )
         
         inliers = align_res["inliers"]
         matches = align_res["good_matches"]
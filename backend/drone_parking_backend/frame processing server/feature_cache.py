@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+import cv2
+import numpy as np
+
+CACHE_FILENAME = "master_features.npz"
+CACHE_VERSION = 1
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def keypoints_to_array(kp):
+    """Pack cv2.KeyPoint objects into an (N, 7) float32 array."""
+    if not kp:
+        return np.empty((0, 7), dtype=np.float32)
+    return np.array(
+        [(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave, k.class_id) for k in kp],
+        dtype=np.float32,
+    )
+
+
+def array_to_keypoints(arr):
+    """Rebuild cv2.KeyPoint objects from keypoints_to_array output."""
+    return tuple(
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in arr
+    )
+
+
+def save_features(path, master_hash, image_size, feature_sets):
+    """Write named feature sets for a master image to an .npz cache file.
+
+    Args:
+        path: destination .npz file
+        master_hash: file_hash() of the master image the features came from, optionally
+                     suffixed with a digest of the extraction settings
+        image_size: (width, height) of the master image
+        feature_sets: dict of name -> (keypoints, descriptors)
+
+    The file is written to a unique temp file in the same directory and
+    renamed, so readers never see a partially written cache and concurrent
+    writers (threads or processes) never share a temp file.
+    """
+    arrays = {
+        "version": np.array(CACHE_VERSION),
+        "master_hash": np.array(master_hash),
+        "image_size": np.array(image_size, dtype=np.int32),
+        "names": np.array(sorted(feature_sets)),
+    }
+    for name, (kp, des) in feature_sets.items():
+        arrays[f"{name}_kp"] = keypoints_to_array(kp)
+        arrays[f"{name}_des"] = des if des is not None else np.empty((0, 0), dtype=np.float32)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_features(path, master_hash):
+    """Load feature sets written by save_features.
+
+    Returns (image_size, feature_sets), or None when the file is missing,
+    unreadable, from another cache version, or built from a different master.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != CACHE_VERSION or str(data["master_hash"]) != master_hash:
+                return None
+
+            image_size = tuple(int(v) for v in data["image_size"])
+            feature_sets = {}
+            for name in data["names"]:
+                name = str(name)
+                kp = array_to_keypoints(data[f"{name}_kp"])
+                des = data[f"{name}_des"]
+                feature_sets[name] = (kp, des if des.size else None)
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+    return image_size, feature_sets
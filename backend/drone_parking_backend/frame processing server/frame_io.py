@@ -0,0 +1,80 @@
+import os
+import cv2
+import numpy as np
+
+# Frames whose longer side exceeds this are decoded at 1/2, 1/4 or 1/8 resolution
+# so it fits (0 = always decode at full resolution)
+MAX_DECODE_SIDE = int(os.environ.get("MAX_DECODE_SIDE", "0"))
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start-of-frame markers (SOF0-SOF15 minus DHT, JPG and DAC), which carry the image size
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def encoded_image_size(data):
+    """Read (width, height) from a JPEG or PNG header without decoding the image.
+
+    Args:
+        data: encoded image as bytes, bytearray or memoryview
+
+    Returns None for other formats or truncated headers.
+    """
+    buf = memoryview(data).cast("B")
+    if bytes(buf[:8]) == PNG_SIGNATURE and len(buf) >= 24:
+        return int.from_bytes(buf[16:20], "big"), int.from_bytes(buf[20:24], "big")
+
+    if bytes(buf[:2]) != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 4 <= len(buf):
+        if buf[i] != 0xFF:
+            return None
+        marker = buf[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # markers without a length
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(buf):
+                return None
+            return int.from_bytes(buf[i + 7:i + 9], "big"), int.from_bytes(buf[i + 5:i + 7], "big")
+        i += 2 + int.from_bytes(buf[i + 2:i + 4], "big")
+    return None
+
+
+def decode_reduction(data, max_side=MAX_DECODE_SIDE):
+    """Return the decode reduction factor (1, 2, 4 or 8) that brings a frame's longer side within max_side."""
+    if not max_side:
+        return 1
+    size = encoded_image_size(data)
+    if size is None:
+        return 1
+    for factor in (1, 2, 4, 8):
+        if max(size) / factor <= max_side:
+            return factor
+    return 8
+
+
+def decode_frame(data, max_side=MAX_DECODE_SIDE):
+    """Decode an uploaded frame straight from memory.
+
+    Args:
+        data: encoded image as bytes, bytearray or memoryview (not copied)
+        max_side: decode oversized JPEG/PNG frames at reduced resolution so the
+                  longer side is at most this many pixels (0 = full resolution)
+
+    Returns (image, factor): the BGR array, or None if the data can't be
+    decoded, and the reduction factor it was decoded at.
+    """
+    factor = decode_reduction(data, max_side)
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_DECODE_FLAGS[factor])
+    return image, factor
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import config
+from feature_cache import file_hash
+
+# Memory the registry may hold across all loaded lots before evicting the least recently used
+LOT_CACHE_MAX_BYTES = int(os.environ.get("LOT_CACHE_MAX_BYTES", str(1 << 30)))
+
+# Rough per-object size of OpenCV objects that don't expose their buffers
+KEYPOINT_BYTES = 64
+
+
+def lot_files(lot_id):
+    """Return the master image, parking.json and alignment.json paths of a lot (master may be None)."""
+    lot_path = os.path.join(config.LOT_DIR, lot_id)
+    return (
+        config.find_master_path(lot_id),
+        os.path.join(lot_path, "parking.json"),
+        os.path.join(lot_path, "alignment.json"),
+    )
+
+
+def list_lots():
+    """Return the IDs of every lot directory under config.LOT_DIR."""
+    try:
+        names = os.listdir(config.LOT_DIR)
+    except OSError:
+        return []
+    return sorted(name for name in names if os.path.isdir(os.path.join(config.LOT_DIR, name)))
+
+
+def file_signature(paths):
+    """Return (path, mtime_ns, size) for each path, with None for missing files."""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            signature.append(None)
+            continue
+        signature.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+def content_hashes(paths):
+    """Return the SHA-256 of each path's contents, with None for missing files."""
+    hashes = []
+    for path in paths:
+        try:
+            hashes.append(file_hash(path))
+        except (OSError, TypeError):
+            hashes.append(None)
+    return tuple(hashes)
+
+
+def estimate_nbytes(obj, _seen=None):
+    """Approximate memory held by numpy arrays and keypoints reachable from obj."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, cv2.KeyPoint):
+        return KEYPOINT_BYTES
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(v, _seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_nbytes(v, _seen) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return estimate_nbytes(vars(obj), _seen)
+    return 0
+
+
+class LotRegistry:
+    """Process-wide cache of loaded lots: decoded master, spot polygons and derived state.
+
+    Each get() stats the lot's master image, parking.json and alignment.json.
+    If their mtime or size changed, the contents are hashed and the entry is
+    only rebuilt when a hash differs too, so a touched but unchanged file
+    costs one hash pass. Rebuilt lots are reported to on_change (e.g. to reset
+    tracking state). The least recently used lots are evicted once the
+    estimated memory exceeds max_bytes, always keeping the newest one;
+    evicted lots are reported to on_change too, so their frame history is
+    dropped with them.
+
+    Args:
+        build_state: optional fn(lot_id, master_img, parking_data) -> derived
+                     per-lot state (features, matcher, geometry, ...)
+        max_bytes: memory cap across all lots
+        on_change: optional fn(lot_id) called when a cached lot is rebuilt
+                   because its files changed, invalidated or evicted
+    """
+
+    def __init__(self, build_state=None, max_bytes=LOT_CACHE_MAX_BYTES, on_change=None):
+        self.build_state = build_state
+        self.max_bytes = max_bytes
+        self.on_change = on_change
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # lot_id -> entry dict
+        self._lock = threading.Lock()
+        self._lot_locks = {}
+
+    def get(self, lot_id):
+        """Return (entry, error_string) for a lot, loading or refreshing it if needed.
+
+        entry holds "master_img", "parking_data" (list of (polygon_ndarray,
+        spot_id) tuples, as from config.load_lot), "state" (build_state
+        output, or None) and "nbytes". entry is None when the lot can't be loaded.
+        """
+        with self._lock:
+            lot_lock = self._lot_locks.setdefault(lot_id, threading.Lock())
+
+        with lot_lock:
+            paths = lot_files(lot_id)
+            signature = file_signature(paths)
+            with self._lock:
+                entry = self._entries.get(lot_id)
+                if entry is not None and entry["signature"] == signature:
+                    self._entries.move_to_end(lot_id)
+                    self.hits += 1
+                    return entry, None
+
+            if entry is not None and content_hashes(paths) == entry["hashes"]:
+                with self._lock:
+                    entry["signature"] = signature
+                    self._entries.move_to_end(lot_id)
+                    self.hits += 1
+                return entry, None
+
+            if entry is not None:
+                print(f"Lot {lot_id} changed on disk — reloading")
+            new_entry, err = self._load(lot_id, paths)
+            evicted = []
+            with self._lock:
+                self._entries.pop(lot_id, None)
+                if new_entry is not None:
+                    self._entries[lot_id] = new_entry
+                    evicted = self._evict()
+            if entry is not None and self.on_change is not None:
+                self.on_change(lot_id)
+            self._evicted(evicted)
+            return new_entry, err
+
+    def _load(self, lot_id, paths):
+        # Hash before reading so a file replaced mid-load is picked up by the next get()
+        hashes = content_hashes(paths)
+        signature = file_signature(paths)
+        master_img, parking_data, err = config.load_lot(lot_id)
+        if err:
+            return None, err
+
+        state = None
+        if self.build_state is not None:
+            state = self.build_state(lot_id, master_img, parking_data)
+        self.loads += 1
+        return self._entry(master_img, parking_data, state, signature, hashes), None
+
+    @staticmethod
+    def _entry(master_img, parking_data, state, signature, hashes):
+        entry = {
+            "master_img": master_img,
+            "parking_data": parking_data,
+            "state": state,
+            "signature": signature,
+            "hashes": hashes,
+            "loaded_at": time.time(),
+        }
+        entry["nbytes"] = estimate_nbytes([master_img, parking_data, state])
+        return entry
+
+    def swap(self, lot_id, expected, master_img, state, replace_files):
+        """Replace a lot's files and install a prebuilt entry for them in one step.
+
+        replace_files() runs under the lot's lock, so get() calls wait for the
+        swap instead of reloading a half-replaced lot, while requests already
+        holding the old entry finish with it. Nothing is replaced when the
+        lot was reloaded, dropped or changed on disk since `expected` was read.
+        The new master keeps the lot's coordinates and spots, so on_change is
+        not called and per-lot frame history (tracking, change gate) carries over.
+
+        Args:
+            lot_id: lot to update
+            expected: the entry the new state was derived from
+            master_img: decoded new master image
+            state: build_state output for the new master
+            replace_files: fn() that moves the new files into place
+
+        Returns True if the new entry was installed.
+        """
+        with self._lock:
+            lot_lock = self._lot_locks.setdefault(lot_id, threading.Lock())
+
+        with lot_lock:
+            paths = lot_files(lot_id)
+            with self._lock:
+                if self._entries.get(lot_id) is not expected or file_signature(paths) != expected["signature"]:
+                    return False
+
+            replace_files()
+            paths = lot_files(lot_id)
+            entry = self._entry(master_img, expected["parking_data"], state, file_signature(paths), content_hashes(paths))
+            with self._lock:
+                self._entries[lot_id] = entry
+                self._entries.move_to_end(lot_id)
+                evicted = self._evict()
+        self._evicted(evicted)
+        return True
+
+    def _evict(self):
+        # Called under self._lock; returns the evicted lot IDs for _evicted()
+        evicted = []
+        while len(self._entries) > 1 and self.nbytes > self.max_bytes:
+            lot_id, _ = self._entries.popitem(last=False)
+            lot_lock = self._lot_locks.get(lot_id)
+            if lot_lock is not None and not lot_lock.locked():
+                del self._lot_locks[lot_id]
+            self.evictions += 1
+            evicted.append(lot_id)
+            print(f"Lot registry over {self.max_bytes / 1e6:.0f} MB — evicted lot {lot_id}")
+        return evicted
+
+    def _evicted(self, lot_ids):
+        if self.on_change is not None:
+            for lot_id in lot_ids:
+                self.on_change(lot_id)
+
+    def invalidate(self, lot_id):
+        """Drop a lot so the next get() reloads it, e.g. after its master image was replaced."""
+        with self._lock:
+            dropped = self._entries.pop(lot_id, None)
+        if dropped is not None and self.on_change is not None:
+            self.on_change(lot_id)
+
+    def preload(self, lot_ids=None):
+        """Load lots ahead of the first request, e.g. at service startup.
+
+        Args:
+            lot_ids: lots to load (default: every directory under config.LOT_DIR)
+
+        Returns dict of lot_id -> error string (None for lots that loaded).
+        """
+        if lot_ids is None:
+            lot_ids = list_lots()
+
+        errors = {}
+        start = time.perf_counter()
+        for lot_id in lot_ids:
+            _, errors[lot_id] = self.get(lot_id)
+        loaded = sum(err is None for err in errors.values())
+        print(
+            f"Preloaded {loaded}/{len(errors)} lots in {time.perf_counter() - start:.2f}s "
+            f"({self.nbytes / 1e6:.1f} MB)"
+        )
+        return errors
+
+    def loaded(self):
+        """Return the IDs of the lots currently held, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        """Drop every loaded lot."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def nbytes(self):
+        return sum(entry["nbytes"] for entry in self._entries.values())
+
+    def __contains__(self, lot_id):
+        return lot_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -2,12 +2,153 @@ import cv2
 import numpy as np
 
 
+class LotGeometry:
+    """Rasterized spot masks for a lot, built once and reused for every frame.
+
+    Each spot keeps its bounding rect, its pixel area and a summed-area table
+    of its mask, so the overlap between a box and a spot is four lookups
+    instead of a fillPoly and a count_nonzero per box. The spot rects are
+    also bucketed into a uniform grid so each box is only compared against
+    the spots whose rects share a cell with it.
+
+    Args:
+        parking_data: list of (polygon_ndarray, spot_id) tuples, as returned by config.load_lot
+        cell_size: grid cell size in pixels; defaults to the median spot rect size
+    """
+
+    def __init__(self, parking_data, cell_size=None):
+        self.spot_ids = []
+        rects = []
+        areas = []
+        tables = []
+        for polygon, spot_id in parking_data:
+            px, py, pw, ph = cv2.boundingRect(polygon)
+            self.spot_ids.append(spot_id)
+            rects.append((px, py, pw, ph))
+
+            if pw <= 1 or ph <= 1 or cv2.contourArea(polygon) < 5:
+                areas.append(0)
+                continue
+
+            spot_mask = np.zeros((ph, pw), dtype=np.uint8)
+            cv2.fillPoly(spot_mask, [polygon - [px, py]], 1)
+            # table[y, x] = mask pixels in spot_mask[:y, :x]
+            table = cv2.integral(spot_mask)
+            areas.append(int(table[-1, -1]))
+            tables.append(table)
+
+        self.rects = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        self.areas = np.array(areas, dtype=np.int64)
+
+        # All tables flattened into one array so overlaps for many (box, spot)
+        # pairs are a single gather; degenerate spots have no table.
+        self.offsets = np.zeros(len(rects), dtype=np.int64)
+        sizes = [t.size for t in tables]
+        self.offsets[self.areas > 0] = np.cumsum([0] + sizes[:-1])
+        self.tables = np.concatenate([t.ravel() for t in tables]) if tables else np.empty(0, dtype=np.int32)
+
+        indexed = np.flatnonzero(self.areas > 0)
+        if cell_size is None:
+            cell_size = int(np.median(self.rects[indexed, 2:].max(axis=1))) if len(indexed) else 1
+        self.cell_size = max(1, cell_size)
+        self.grid = {}
+        for i in indexed:
+            px, py, pw, ph = self.rects[i]
+            for cx in range(px // self.cell_size, (px + pw - 1) // self.cell_size + 1):
+                for cy in range(py // self.cell_size, (py + ph - 1) // self.cell_size + 1):
+                    self.grid.setdefault((cx, cy), []).append(int(i))
+
+        if self.grid:
+            cells = np.array(list(self.grid))
+            self.cell_bounds = (*cells.min(axis=0), *cells.max(axis=0))
+
+    def candidates(self, box):
+        """Return the indices of spots whose rect shares a grid cell with an (x1, y1, x2, y2) box."""
+        x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
+        if x2 <= x1 or y2 <= y1 or not self.grid:
+            return []
+
+        # Clamp to the occupied cells so a huge box doesn't walk an empty grid
+        min_cx, min_cy, max_cx, max_cy = self.cell_bounds
+        found = set()
+        for cx in range(max(min_cx, x1 // self.cell_size), min(max_cx, (x2 - 1) // self.cell_size) + 1):
+            for cy in range(max(min_cy, y1 // self.cell_size), min(max_cy, (y2 - 1) // self.cell_size) + 1):
+                found.update(self.grid.get((cx, cy), ()))
+        return sorted(found)
+
+    def check(self, boxes, overlap_threshold=0.3):
+        """Same as check_occupancy(boxes, parking_data, overlap_threshold) for this lot's spots."""
+        confs = [box[4] if len(box) > 4 else 0.0 for box in boxes]
+
+        box_idx = []
+        spot_idx = []
+        for i, box in enumerate(boxes):
+            found = self.candidates(box)
+            box_idx.extend([i] * len(found))
+            spot_idx.extend(found)
+
+        best_conf = {}
+        if spot_idx:
+            coords = np.array([[int(b[0]), int(b[1]), int(b[2]), int(b[3])] for b in boxes], dtype=np.int64)[box_idx]
+            spot_idx = np.array(spot_idx, dtype=np.int64)
+            px, py, pw, ph = self.rects[spot_idx].T
+
+            ix1 = np.clip(coords[:, 0] - px, 0, pw)
+            iy1 = np.clip(coords[:, 1] - py, 0, ph)
+            ix2 = np.clip(coords[:, 2] - px, 0, pw)
+            iy2 = np.clip(coords[:, 3] - py, 0, ph)
+            valid = (ix2 > ix1) & (iy2 > iy1)
+
+            base = self.offsets[spot_idx]
+            stride = pw + 1
+            overlap_area = (
+                self.tables[base + iy2 * stride + ix2]
+                - self.tables[base + iy1 * stride + ix2]
+                - self.tables[base + iy2 * stride + ix1]
+                + self.tables[base + iy1 * stride + ix1]
+            )
+            hits = valid & (overlap_area / self.areas[spot_idx] >= overlap_threshold)
+
+            # Pairs are in box order, so this keeps the first of equal confidences like a plain loop
+            for i in np.flatnonzero(hits):
+                spot = int(spot_idx[i])
+                best_conf[spot] = max(best_conf.get(spot, 0.0), confs[box_idx[i]])
+
+        occupied = []
+        free = []
+        for i, spot_id in enumerate(self.spot_ids):
+            if i in best_conf:
+                occupied.append({"id": spot_id, "confidence": best_conf[i]})
+            else:
+                free.append({"id": spot_id, "confidence": 0.0})
+
+        return {"occupied": occupied, "free": free}
+
+
+def spot_label_image(parking_data, shape, scale=1.0):
+    """Rasterize spots into one int32 image holding 1 + the spot index per pixel, 0 outside every spot.
+
+    Args:
+        parking_data: list of (polygon_ndarray, spot_id) tuples
+        shape: shape of the full-resolution image the polygons live in
+        scale: size of the label image relative to that image
+
+    Where spots overlap, the later spot wins. Per-spot sums over any image of
+    the same size are then one np.bincount(labels.ravel(), weights=...).
+    """
+    h, w = shape[:2]
+    labels = np.zeros((max(1, int(h * scale)), max(1, int(w * scale))), dtype=np.int32)
+    for i, (polygon, _) in enumerate(parking_data):
+        cv2.fillPoly(labels, [np.round(np.asarray(polygon) * scale).astype(np.int32)], i + 1)
+    return labels
+
+
 def check_occupancy(boxes, parking_data, overlap_threshold=0.3):
     """Determine which parking spots are occupied by detected vehicles using area overlap.
 
     Args:
         boxes: list of (x1, y1, x2, y2, confidence) tuples
-        parking_data: list of (polygon_ndarray, spot_id) tuples
+        parking_data: list of (polygon_ndarray, spot_id) tuples, or a prebuilt LotGeometry
         overlap_threshold: minimum percentage (0.0 to 1.0) of a spot's area 
                            that must be covered by a car to count as occupied.
 
@@ -15,55 +156,8 @@ def check_occupancy(boxes, parking_data, overlap_threshold=0.3):
         occupied: list of {"id": spot_id, "confidence": float}
         free: list of {"id": spot_id, "confidence": 0.0}
     """
-    occupied = []
-    free = []
-
-    for polygon, spot_id in parking_data:
-        px, py, pw, ph = cv2.boundingRect(polygon)
-        
-        if pw <= 1 or ph <= 1 or cv2.contourArea(polygon) < 5:
-            free.append({"id": spot_id, "confidence": 0.0})
-            continue
-
-        spot_mask = np.zeros((ph, pw), dtype=np.uint8)
-        cv2.fillPoly(spot_mask, [polygon - [px, py]], 255)
-        spot_area = np.count_nonzero(spot_mask)
-
-        if spot_area == 0:
-            free.append({"id": spot_id, "confidence": 0.0})
-            continue
-            
-        best_conf = 0.0
-        max_overlap = 0.0
-        is_occupied = False
-
-        for box in boxes:
-            bx1, by1, bx2, by2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
-            conf = box[4] if len(box) > 4 else 0.0
-
-            ix1 = max(0, bx1 - px)
-            iy1 = max(0, by1 - py)
-            ix2 = min(pw, bx2 - px)
-            iy2 = min(ph, by2 - py)
-
-            if ix2 > ix1 and iy2 > iy1:
-                intersection_mask = spot_mask[iy1:iy2, ix1:ix2]
-                overlap_area = np.count_nonzero(intersection_mask)
-                overlap_ratio = overlap_area / spot_area
-
-                if overlap_ratio > max_overlap:
-                    max_overlap = overlap_ratio
-                
-                if overlap_ratio >= overlap_threshold:
-                    is_occupied = True
-                    best_conf = max(best_conf, conf)
-
-        if is_occupied:
-            occupied.append({"id": spot_id, "confidence": best_conf})
-        else:
-            free.append({"id": spot_id, "confidence": 0.0})
-
-    return {"occupied": occupied, "free": free}
+    geometry = parking_data if isinstance(parking_data, LotGeometry) else LotGeometry(parking_data)
+    return geometry.check(boxes, overlap_threshold)
 
 
 if __name__ == "__main__":
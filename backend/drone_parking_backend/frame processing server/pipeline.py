@@ -0,0 +1,571 @@
+import cv2
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import detect
+from align import build_master_matcher, project_box_corners, project_parking_data
+from change_gate import GATES, check_gate, gate_frame, record_detection, reset_gate
+from config import (
+    MasterFeatures,
+    build_live_mask,
+    build_master_mask,
+    load_alignment_settings,
+)
+from detect import MODEL_INPUT_SIZE, detect_cars, detect_cars_tiled, spot_union_roi
+from frame_io import MAX_DECODE_SIDE, decode_frame
+from lot_registry import LotRegistry, estimate_nbytes
+from occupancy import LotGeometry, check_occupancy
+from promotion import MasterPromoter
+from result_cache import ResultCache, frame_digest, result_key
+from spot_classifier import classify_spots
+from tracking import TRACKERS, align_tracked, reset_tracker
+
+
+def build_master_state(lot_id, master_img, parking_data, master_path=None):
+    """Build the derived per-lot state kept by the lot registry.
+
+    The state holds the alignment settings and master mask, the SIFT keypoints,
+    descriptors and trained matcher, the CLAHE/ORB fallback variants, and the
+    rasterized spot geometry used for occupancy in master coordinates.
+    master_path overrides the master file the feature cache is keyed by
+    (used for promoted masters before they are swapped in).
+    """
+    print(f"Loading master features for lot {lot_id}...")
+    settings = load_alignment_settings(lot_id)
+    mask = build_master_mask(master_img, parking_data, settings)
+    features = MasterFeatures(lot_id, master_img, master_path)
+    kp, des = features.sift(mask, settings["max_keypoints"])
+    return {
+        "settings": settings,
+        "mask": mask,
+        "kp": kp,
+        "des": des,
+        "matcher": build_master_matcher(des),
+        "variants": features.variants(mask, settings["max_keypoints"]),
+        "geometry": LotGeometry(parking_data),
+    }
+
+
+def reset_lot_state(lot_id):
+    """Forget per-lot frame history that refers to an outdated master or spot layout."""
+    reset_tracker(lot_id)
+    reset_gate(lot_id)
+
+
+# Loaded lots (master image, spots, features), reloaded when their files change
+LOTS = LotRegistry(build_state=build_master_state, on_change=reset_lot_state)
+
+# Writes promoted masters and builds their features off the request path
+PROMOTER = MasterPromoter(LOTS, build_state=build_master_state)
+
+# Results of processed frames, so queue retries and duplicate uploads skip the pipeline
+RESULT_CACHE = ResultCache()
+
+
+def lot_state_nbytes():
+    """Estimated memory held for lots: registry entries plus their tracking and change gate state."""
+    # Trackers reference the registry's master image, which LOTS.nbytes already counts
+    history = [{k: v for k, v in state.items() if k != "master"} for state in list(TRACKERS.values())]
+    return LOTS.nbytes + estimate_nbytes([history, list(GATES.values())])
+
+
+def get_master_state(lot_id):
+    """Return the registry's per-lot master state (see build_master_state), or None if the lot can't be loaded."""
+    lot, err = LOTS.get(lot_id)
+    return None if err else lot["state"]
+
+
+def promote_master(lot_id, aligned_image, inliers, inlier_threshold=140, homography=None, master_size=None):
+    """Queues the current aligned frame as the new master if it matches exceptionally well.
+
+    Since the image is already 'aligned', it perfectly matches the existing
+    coordinates in parking.json. The master is written and its features are
+    built in the background (PROMOTER), then swapped in atomically.
+
+    When homography and master_size (width, height) are given, aligned_image is
+    the unwarped live frame and is only warped if it actually gets promoted.
+
+    Returns True if a promotion was queued.
+    """
+    if inliers > inlier_threshold:
+        return PROMOTER.submit(lot_id, aligned_image, inliers, homography, master_size)
+    return False
+
+
+def run_detection(image, parking_data, compact_upload=False, tiled=False):
+    """Detect vehicles in the frame detection runs on, in the requested upload mode.
+
+    Args:
+        image: aligned (or live) BGR frame
+        parking_data: (polygon_ndarray, spot_id) list in that frame's coordinates
+        compact_upload: send only the spot region, downscaled and recompressed
+        tiled: detect on concurrent overlapping tiles merged with NMS
+    """
+    if tiled:
+        return detect_cars_tiled(image, parking_data)
+    if compact_upload:
+        return detect_cars(image, roi=spot_union_roi(parking_data, image.shape), input_size=MODEL_INPUT_SIZE)
+    return detect_cars(image)
+
+
+def classify_then_detect(image, parking_data, tiled=False):
+    """Decide occupancy from spot crops, sending only the unsure spots to the vehicle detector.
+
+    Args:
+        image: aligned BGR frame
+        parking_data: (polygon_ndarray, spot_id) list in that frame's coordinates
+        tiled: detect the unsure spots with tiled mode instead of one compact upload
+
+    Returns (boxes, occupancy, escalated) where boxes come from the detector
+    call (empty if every spot was decided locally), occupancy is in the
+    check_occupancy format and spot order, and escalated is the number of
+    spots sent to the detector. Each spot also has a "source": "classifier"
+    when decided locally (its confidence is the classifier's heuristic score,
+    not a detector probability) or "detector" when escalated.
+    """
+    states, confidences = classify_spots(image, parking_data)
+    unsure = [spot for spot, state in zip(parking_data, states) if state is None]
+
+    boxes = []
+    detected = {}
+    detected_occupied = set()
+    if unsure:
+        print(f"{len(unsure)} of {len(parking_data)} spots unsure — escalating them to the vehicle detector")
+        # Only the region around the unsure spots is sent
+        boxes = run_detection(image, unsure, compact_upload=not tiled, tiled=tiled)
+        unsure_occ = check_occupancy(boxes, unsure)
+        detected = {o["id"]: dict(o, source="detector") for o in unsure_occ["occupied"] + unsure_occ["free"]}
+        detected_occupied = {o["id"] for o in unsure_occ["occupied"]}
+
+    occupied = []
+    free = []
+    for (_, spot_id), state, conf in zip(parking_data, states, confidences):
+        if state is None:
+            (occupied if spot_id in detected_occupied else free).append(detected[spot_id])
+        elif state == "occupied":
+            occupied.append({"id": spot_id, "confidence": conf, "source": "classifier"})
+        else:
+            free.append({"id": spot_id, "confidence": 0.0, "source": "classifier"})
+    return boxes, {"occupied": occupied, "free": free}, len(unsure)
+
+
+def draw_visualization(image, parking_data, occupancy_result, boxes, box_quads=None):
+    """Draw parking polygons, occupancy state, and detected cars.
+
+    box_quads optionally gives each box's four corners in the image (e.g.
+    live-frame boxes projected into master coordinates); the quads are drawn
+    instead of the axis-aligned boxes.
+    """
+    vis = image.copy()
+
+    occupied_ids = {o["id"] for o in occupancy_result["occupied"]}
+
+    for polygon, spot_id in parking_data:
+        polygon = np.array(polygon, np.int32)
+
+        if spot_id in occupied_ids:
+            color = (0, 0, 255)  # red
+        else:
+            color = (0, 255, 0)  # green
+
+        cv2.polylines(vis, [polygon], True, color, 2)
+
+        cx = int(np.mean(polygon[:, 0]))
+        cy = int(np.mean(polygon[:, 1]))
+        cv2.putText(
+            vis,
+            spot_id,
+            (cx, cy),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            color,
+            2,
+            cv2.LINE_AA,
+        )
+
+    for i, box in enumerate(boxes):
+        if box_quads is None:
+            x1, y1, x2, y2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
+            cv2.rectangle(vis, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        else:
+            quad = np.round(box_quads[i]).astype(np.int32)
+            x1, y1 = int(quad[0][0]), int(quad[0][1])
+            cv2.polylines(vis, [quad], True, (255, 0, 0), 2)
+
+        if len(box) > 4:
+            conf = box[4]
+            cv2.putText(
+                vis,
+                f"{conf:.2f}",
+                (x1, y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (255, 0, 0),
+                1,
+                cv2.LINE_AA,
+            )
+
+    return vis
+
+
+def render_result(image, result, master_img, parking_data):
+    """Draw a process_frame result in master coordinates.
+
+    Args:
+        image: the live frame the result was computed from
+        result: process_frame result (fresh or cached)
+        master_img: the lot's master image
+        parking_data: list of (polygon_ndarray, spot_id) tuples in master coordinates
+    """
+    H = result["alignment"]["homography"]
+    H = None if H is None else np.array(H)
+    boxes = [tuple(box) for box in result["boxes"]]
+    occ = result["occupancy"]
+    master_size = (master_img.shape[1], master_img.shape[0])
+
+    if H is None:
+        return draw_visualization(image, parking_data, occ, boxes)
+    if result["alignment"]["warp_frame"]:
+        # Cached results don't carry the warped frame, so warp it again
+        aligned = result.get("aligned")
+        if aligned is None:
+            aligned = cv2.warpPerspective(image, H, master_size)
+        return draw_visualization(aligned, parking_data, occ, boxes)
+    # Only the visualization is resampled; live boxes are drawn as their exact master-space quads
+    warped = cv2.warpPerspective(image, H, master_size)
+    return draw_visualization(warped, parking_data, occ, boxes, box_quads=project_box_corners(boxes, H))
+
+
+def align_frame(
+    lot_id,
+    image,
+    frame_hash=None,
+    parallel_fallbacks=False,
+    warp_frame=True,
+    compact_upload=False,
+    tiled=False,
+    cache=RESULT_CACHE,
+    skip_unchanged=False,
+    classify=False,
+):
+    """First stage of process_frame: result-cache lookup, alignment, promotion and change gate.
+
+    Takes the process_frame arguments. Frames of a lot must go through this
+    stage in order, because it advances the lot's tracker and change gate.
+    detect_frame and complete_frame finish the frame.
+
+    Returns the per-frame state dict passed on to the next stages. It holds
+    "result" already when the frame was found in the cache. Returns None if
+    the lot can't be loaded.
+    """
+    key = None
+    if cache is not None:
+        variant = "".join(
+            [
+                "warp" if warp_frame else "live",
+                "+compact" if compact_upload else "",
+                "+tiled" if tiled else "",
+                "+classify" if classify else "",
+                "+gated" if skip_unchanged else "",
+            ]
+        )
+        model_version = f"{detect.PROJECT}/{detect.MODEL_VERSION}"
+        key = result_key(frame_hash or frame_digest(image), lot_id, model_version, variant)
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"Frame already processed for lot {lot_id} — returning cached result")
+            return {"result": dict(cached, cached=True)}
+
+    lot, err = LOTS.get(lot_id)
+    if err:
+        print("Error:", err)
+        return None
+    master_img, parking_data, master = lot["master_img"], lot["parking_data"], lot["state"]
+
+    print("Aligning image...")
+
+    align_result = align_tracked(
+        lot_id,
+        master_img,
+        image,
+        master_kp=master["kp"],
+        master_des=master["des"],
+        master_matcher=master["matcher"],
+        master_variants=master["variants"],
+        parallel_fallbacks=parallel_fallbacks,
+        warp=warp_frame,
+        max_keypoints=master["settings"]["max_keypoints"],
+        master_mask=master["mask"],
+        live_mask=build_live_mask(image, master["settings"]),
+        estimator=master["settings"]["estimator"],
+        max_iters=master["settings"]["max_iters"],
+    )
+    aligned = align_result["aligned"]
+    inliers = align_result["inliers"]
+    H = align_result["homography"]
+    master_size = (master_img.shape[1], master_img.shape[0])
+    # Spot polygons in the coordinates of the image detection runs on
+    frame_parking_data = master["geometry"]
+
+    if align_result["homography"] is None:
+        print(" Alignment failed — using original image (All fallbacks exhausted)")
+        aligned = image
+    else:
+        if not warp_frame:
+            frame_parking_data = project_parking_data(parking_data, H)
+        promote_kwargs = {} if warp_frame else {"homography": H, "master_size": master_size}
+        fallback = align_result.get("fallback_used", "None")
+        if fallback == "Tracked":
+            # Tracked inliers count LK points, not SIFT matches, so they don't drive promotion
+            print(f"Alignment successful (Tracked from previous frame). Inliers: {inliers}")
+        elif fallback == "None":
+            print(f"Alignment successful (Standard Methods). Inliers: {inliers}")
+            promote_master(lot_id, aligned, inliers, **promote_kwargs)
+        else:
+            print(f"Alignment successful via Fallback ({fallback}). Inliers: {inliers}")
+            promote_master(lot_id, aligned, inliers, **promote_kwargs)
+
+    previous = None
+    gate_reference = None
+    if skip_unchanged and H is not None:
+        previous = check_gate(lot_id, image, H, parking_data, master_img.shape)
+        # Kept with the frame, since later frames may pass the gate before this one is detected
+        gate_reference = gate_frame(lot_id)
+
+    return {
+        "lot_id": lot_id,
+        "key": key,
+        "cache": cache,
+        "image": image,
+        "aligned": aligned,
+        "align_result": align_result,
+        "parking_data": parking_data,
+        "frame_parking_data": frame_parking_data,
+        "spots": parking_data if frame_parking_data is master["geometry"] else frame_parking_data,
+        "previous": previous,
+        "gate_reference": gate_reference,
+        "warp_frame": warp_frame,
+        "compact_upload": compact_upload,
+        "tiled": tiled,
+        "classify": classify,
+    }
+
+
+def detect_frame(frame):
+    """Second stage of process_frame: vehicle detection (or the classifier) and occupancy.
+
+    Independent per frame, so detector calls of several frames can be in
+    flight at once. Adds "boxes", "occupancy" and "escalated" to the
+    align_frame state and returns it.
+    """
+    if "result" in frame:
+        return frame
+    align_result = frame["align_result"]
+    H = align_result["homography"]
+    escalated = None
+    if frame["previous"] is not None:
+        print("No spot changed since the last detection — reusing its result")
+        boxes, occ = frame["previous"]
+    elif frame["classify"] and H is not None and align_result.get("fallback_used", "None") in ("None", "Tracked"):
+        print("Classifying spots...")
+        boxes, occ, escalated = classify_then_detect(frame["aligned"], frame["spots"], frame["tiled"])
+    else:
+        print("Running detection...")
+        boxes = run_detection(frame["aligned"], frame["spots"], frame["compact_upload"], frame["tiled"])
+
+        print(f"Detected {len(boxes)} vehicles")
+        for i, box in enumerate(boxes):
+            print(f"  Box {i}: {box}")
+
+        print("Checking occupancy...")
+        occ = check_occupancy(boxes, frame["frame_parking_data"])
+    frame.update(boxes=boxes, occupancy=occ, escalated=escalated)
+    return frame
+
+
+def complete_frame(frame):
+    """Last stage of process_frame: change-gate bookkeeping, result assembly and caching.
+
+    Frames of a lot must go through this stage in order. Returns the
+    process_frame result.
+    """
+    if "result" in frame:
+        return frame["result"]
+    align_result = frame["align_result"]
+    H = align_result["homography"]
+    boxes, occ = frame["boxes"], frame["occupancy"]
+    if frame["previous"] is None and frame["gate_reference"] is not None:
+        record_detection(frame["lot_id"], (boxes, occ), frame["gate_reference"])
+
+    print(f"Occupied: {len(occ['occupied'])}")
+    print(f"Free: {len(occ['free'])}")
+
+    result = {
+        "lot_id": frame["lot_id"],
+        "alignment": {
+            "homography": None if H is None else H.tolist(),
+            "inliers": int(align_result["inliers"]),
+            "good_matches": int(align_result["good_matches"]),
+            "fallback_used": align_result.get("fallback_used", "None"),
+            "warp_frame": frame["warp_frame"],
+        },
+        "boxes": [[int(x1), int(y1), int(x2), int(y2), float(conf)] for x1, y1, x2, y2, conf in boxes],
+        "occupancy": {
+            "occupied": [dict(o, confidence=float(o["confidence"])) for o in occ["occupied"]],
+            "free": occ["free"],
+        },
+        "detection_skipped": frame["previous"] is not None,
+        "escalated_spots": frame["escalated"],
+    }
+    if frame["key"] is not None:
+        frame["cache"].put(frame["key"], result)
+    return dict(result, cached=False, aligned=frame["aligned"])
+
+
+def process_frame(lot_id, image, **kwargs):
+    """Align one drone frame to its lot, detect vehicles and compute spot occupancy.
+
+    Args:
+        lot_id: lot the frame belongs to
+        image: the live drone image BGR array
+        frame_hash: content hash of the frame (e.g. result_cache.frame_digest of
+                    the uploaded bytes); computed from the pixels if omitted
+        parallel_fallbacks: race the alignment fallbacks in a thread pool
+        warp_frame: False projects the spot polygons into the live frame
+                    instead of warping the frame into master coordinates.
+                    Boxes are then axis-aligned in the live frame, so under
+                    rotation or perspective a spot near the overlap threshold
+                    can differ from the warped result
+        compact_upload: send only the spot region, downscaled and recompressed
+        tiled: detect on concurrent overlapping tiles merged with NMS
+        cache: ResultCache keyed by frame hash, lot and model version, or None
+        skip_unchanged: after alignment, compare every spot with the frame the
+                        last detection ran on (change_gate) and reuse that
+                        detection if no spot changed
+        classify: for well-aligned frames (no alignment fallback), decide
+                  occupancy from the spot crops (spot_classifier) and only
+                  send the spots it is unsure about to the vehicle detector
+
+    Runs align_frame, detect_frame and complete_frame back to back (stream.py
+    overlaps them across frames).
+
+    Returns a JSON-serializable dict with "alignment" (homography as nested
+    lists, inliers, matches, fallback_used), "boxes", "occupancy",
+    "detection_skipped", "escalated_spots" (None unless classify ran) and "cached",
+    plus the non-serializable "aligned" image detection ran on for fresh
+    results. With classify, every spot in "occupancy" carries a "source" of
+    "classifier" or "detector" (see classify_then_detect). Returns None if
+    the lot can't be loaded.
+    """
+    frame = align_frame(lot_id, image, **kwargs)
+    if frame is None:
+        return None
+    return complete_frame(detect_frame(frame))
+
+
+def process_frame_bytes(lot_id, data, max_side=MAX_DECODE_SIDE, visualize=False, **kwargs):
+    """Run process_frame on an encoded upload held in memory, e.g. an object fetched from R2.
+
+    Nothing is written to disk: the frame is decoded with cv2.imdecode and
+    the result (and visualization, if asked for) is returned in memory.
+
+    Args:
+        lot_id: lot the frame belongs to
+        data: encoded frame as bytes, bytearray or memoryview
+        max_side: decode oversized frames at 1/2, 1/4 or 1/8 resolution so the
+                  longer side fits (0 = full resolution)
+        visualize: also draw the result in master coordinates
+        **kwargs: passed on to process_frame
+
+    Returns the process_frame result with "decode_scale" (1 / reduction
+    factor, the scale of live-frame coordinates relative to the upload) and,
+    with visualize=True, the BGR "visualization" array. Returns None if the
+    data can't be decoded or the lot can't be loaded.
+    """
+    image, factor = decode_frame(data, max_side)
+    if image is None:
+        print(f"Error: Could not decode frame for lot {lot_id}")
+        return None
+
+    result = process_frame(lot_id, image, frame_hash=frame_digest(data, factor), **kwargs)
+    if result is None:
+        return None
+    result["decode_scale"] = 1.0 / factor
+
+    if visualize:
+        lot, err = LOTS.get(lot_id)
+        if not err:
+            print("Drawing visualization...")
+            result["visualization"] = render_result(image, result, lot["master_img"], lot["parking_data"])
+    return result
+
+
+def process_lot_frames(lot_id, frames, **kwargs):
+    """Process several encoded frames of one lot in order, loading the lot once.
+
+    Frames of a lot go one after another because they share its tracker and
+    change gate.
+
+    Args:
+        lot_id: lot the frames belong to
+        frames: encoded frames (bytes or memoryview), oldest first
+        **kwargs: passed on to process_frame_bytes
+
+    Returns one entry per frame: its process_frame_bytes result, or a dict
+    with "lot_id", "error" and "reason" ("lot_unavailable", "undecodable" or
+    "failed") if it could not be processed.
+    """
+    lot, err = LOTS.get(lot_id)
+    if err:
+        return [{"lot_id": lot_id, "error": err, "reason": "lot_unavailable"} for _ in frames]
+
+    results = []
+    for data in frames:
+        try:
+            result = process_frame_bytes(lot_id, data, **kwargs)
+        except Exception as e:
+            # One bad frame (or detector error) must not fail the rest of the batch
+            result = {"lot_id": lot_id, "error": f"{type(e).__name__}: {e}", "reason": "failed"}
+        if result is None:
+            result = {"lot_id": lot_id, "error": f"Could not decode frame for lot {lot_id}", "reason": "undecodable"}
+        results.append(result)
+    return results
+
+
+def group_by_lot(lot_ids):
+    """Map each lot ID to the positions it occurs at, in first-seen order."""
+    groups = {}
+    for i, lot_id in enumerate(lot_ids):
+        groups.setdefault(lot_id, []).append(i)
+    return groups
+
+
+def process_batch(items, max_workers=None, **kwargs):
+    """Process a burst of frames from several lots, e.g. one queue message batch.
+
+    Items are grouped by lot so each lot is looked up once. Each lot's frames
+    run in order on one thread, and different lots run in parallel, so their
+    alignment and detector calls overlap.
+
+    Args:
+        items: list of (lot_id, encoded_frame) pairs
+        max_workers: lots processed at once (default: one thread per lot, up to the CPU count)
+        **kwargs: passed on to process_frame_bytes
+
+    Returns a list with one process_lot_frames entry per item, in input order.
+    """
+    groups = group_by_lot([lot_id for lot_id, _ in items])
+    results = [None] * len(items)
+    if not groups:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(groups), os.cpu_count() or 4)) as pool:
+        futures = {
+            lot_id: pool.submit(process_lot_frames, lot_id, [items[i][1] for i in positions], **kwargs)
+            for lot_id, positions in groups.items()
+        }
+        for lot_id, positions in groups.items():
+            for i, result in zip(positions, futures[lot_id].result()):
+                results[i] = result
+    return results
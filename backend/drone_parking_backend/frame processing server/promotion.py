@@ -0,0 +1,97 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from lot_registry import lot_files
+
+
+class MasterPromoter:
+    """Promote aligned frames to lot masters in a background thread.
+
+    A promotion writes the new master to a temp file next to the current
+    one and builds its features (build_state) from it. It then swaps the
+    file and the registry entry in one step (LotRegistry.swap). Requests
+    never wait for the JPEG write or the feature extraction, and the next
+    frame finds the new features already loaded instead of a cold lot.
+    Requests that started before the swap keep using the old master. The
+    first promotion of a lot copies the original master to
+    master_backup.jpg. While a lot has a promotion queued or running,
+    further candidates for it are dropped.
+
+    Args:
+        registry: LotRegistry holding the lots
+        build_state: fn(lot_id, master_img, parking_data, master_path=...) -> per-lot state
+    """
+
+    def __init__(self, registry, build_state=None):
+        self.registry = registry
+        self.build_state = build_state
+        self.promoted = 0
+        self._pending = {}  # lot_id -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="promote")
+
+    def submit(self, lot_id, image, inliers, homography=None, master_size=None):
+        """Queue a frame to become the lot's master.
+
+        When homography and master_size (width, height) are given, image is the
+        unwarped live frame and is warped in the background.
+
+        Returns False if a promotion of the lot is already pending, else True.
+        """
+        with self._lock:
+            if lot_id in self._pending:
+                return False
+            self._pending[lot_id] = self._executor.submit(self._promote, lot_id, image, inliers, homography, master_size)
+        return True
+
+    def wait(self):
+        """Block until every queued promotion finished."""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.result()
+
+    def _promote(self, lot_id, image, inliers, homography, master_size):
+        tmp_path = None
+        try:
+            entry, err = self.registry.get(lot_id)
+            if err:
+                return False
+            master_path = lot_files(lot_id)[0]
+
+            if homography is not None:
+                image = cv2.warpPerspective(image, homography, master_size)
+            encoded = cv2.imencode(".jpg", image)[1]
+            tmp_path = f"{master_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            # Keep the decoded JPEG, so the loaded master matches the file on disk
+            master_img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+            state = None
+            if self.build_state is not None:
+                state = self.build_state(lot_id, master_img, entry["parking_data"], master_path=tmp_path)
+
+            def replace_files():
+                backup_path = os.path.join(os.path.dirname(master_path), "master_backup.jpg")
+                if not os.path.exists(backup_path):
+                    shutil.copyfile(master_path, backup_path)
+                os.replace(tmp_path, master_path)
+
+            if not self.registry.swap(lot_id, entry, master_img, state, replace_files):
+                print(f"Lot {lot_id} changed during promotion — keeping its current master")
+                return False
+            self.promoted += 1
+            print(f"🌟 Master image for lot {lot_id} PROMOTED (Inliers: {inliers})")
+            return True
+        except Exception as e:
+            print(f"Warning: promoting master for lot {lot_id} failed: {e}")
+            return False
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                self._pending.pop(lot_id, None)
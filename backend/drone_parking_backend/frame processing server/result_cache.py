@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Frame result cache: entries kept in memory, seconds an entry stays valid, and an
+# optional directory that entries evicted from memory are spilled to
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+
+
+def frame_digest(data, factor=1):
+    """Return the SHA-256 hex digest of encoded frame bytes or a decoded image array.
+
+    factor is the reduction factor encoded bytes were decoded at (as from
+    frame_io.decode_frame). Frames decoded at another resolution give other
+    results, so the factor is appended to keep their cache entries apart.
+    """
+    h = hashlib.sha256()
+    if hasattr(data, "tobytes"):
+        # Decoded frames: include the shape so equal bytes in another layout don't collide
+        h.update(str(data.shape).encode())
+        data = data.tobytes()
+    h.update(data)
+    return h.hexdigest() if factor == 1 else f"{h.hexdigest()}/{factor}"
+
+
+def result_key(digest, lot_id, model_version, variant=""):
+    """Cache key for one frame of one lot run through one detector model version.
+
+    variant distinguishes pipeline options that change the stored result,
+    such as whether boxes are in master or live-frame coordinates.
+    """
+    return f"{lot_id}:{model_version}:{variant}:{digest}"
+
+
+class ResultCache:
+    """Bounded LRU cache of per-frame pipeline results with a TTL and optional disk spill.
+
+    Values must be JSON-serializable. When the in-memory cache is full the
+    least recently used entry is written to spill_dir (if set), and a later
+    miss in memory checks there before giving up. Expired entries are dropped
+    on access in both tiers.
+
+    Args:
+        max_entries: entries kept in memory
+        ttl: seconds an entry stays valid after it is stored
+        spill_dir: optional directory for evicted entries
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, spill_dir=RESULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            entry = self._load_spilled(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._store(key, *entry)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store a JSON-serializable value under key, evicting the least recently used entry if full."""
+        with self._lock:
+            self._store(key, time.time() + self.ttl, value)
+
+    def _store(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (old_expires, old_value) = self._entries.popitem(last=False)
+            if self.spill_dir and old_expires > time.time():
+                self._spill(old_key, old_expires, old_value)
+
+    def _spill(self, key, expires_at, value):
+        path = self._spill_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "expires_at": expires_at, "value": value}, f)
+        os.replace(tmp_path, path)
+
+    def _load_spilled(self, key, now):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("key") != key or data.get("expires_at", 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["expires_at"], data["value"]
+
+    def clear(self):
+        """Drop every in-memory entry (spilled files are left to expire)."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import requests
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import pipeline
+from sharding import SHARD_WORKERS, ShardedPool
+
+# Where uploaded frames are read from: the general-parking-worker's /api/get-frame/ URL,
+# or a local directory (e.g. a mounted bucket) holding the keys as relative paths
+FRAME_SOURCE_URL = os.environ.get("FRAME_SOURCE_URL", "")
+FRAME_DIR = os.environ.get("FRAME_DIR", "")
+FRAME_FETCH_TIMEOUT = float(os.environ.get("FRAME_FETCH_TIMEOUT", "30"))
+
+# Pipeline threads, and frames admitted (running or waiting) before answering 429
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.environ.get("MAX_PENDING_FRAMES", str(4 * PIPELINE_WORKERS)))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "5"))
+# Longest wait for a shard worker to return a lot's frames before answering 504
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "120"))
+PRELOAD_LOTS = os.environ.get("PRELOAD_LOTS", "1") == "1"
+
+# Lot IDs name directories under lots/, so anything that could leave it is rejected
+LOT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+_session = requests.Session()
+
+
+class FrameRequest(BaseModel):
+    lot_id: str = "1"
+    key: str
+
+
+class BatchRequest(BaseModel):
+    items: list[FrameRequest]
+
+
+def fetch_frame(key):
+    """Return the encoded bytes of an uploaded frame, or None if it doesn't exist.
+
+    Reads from FRAME_DIR when set, otherwise GETs FRAME_SOURCE_URL + key.
+    """
+    if FRAME_DIR:
+        path = os.path.realpath(os.path.join(FRAME_DIR, key))
+        if not path.startswith(os.path.realpath(FRAME_DIR) + os.sep):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    if not FRAME_SOURCE_URL:
+        raise RuntimeError("Set FRAME_SOURCE_URL or FRAME_DIR to read uploaded frames")
+    response = _session.get(FRAME_SOURCE_URL + quote(key), timeout=FRAME_FETCH_TIMEOUT)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+# HTTP status of each pipeline.process_lot_frames failure reason
+ERROR_STATUS = {"lot_unavailable": 404, "undecodable": 422, "failed": 500, "timeout": 504}
+
+
+def item_response(key, result):
+    """Turn one process_lot_frames entry into (status_code, JSON body)."""
+    if "error" in result:
+        return ERROR_STATUS.get(result["reason"], 500), {"key": key, "error": result["error"]}
+    result.pop("aligned", None)
+    result["key"] = key
+    return 200, result
+
+
+def create_app(
+    workers=PIPELINE_WORKERS,
+    max_pending=MAX_PENDING,
+    fetch=fetch_frame,
+    preload=PRELOAD_LOTS,
+    shards=SHARD_WORKERS,
+    shard_options=None,
+    shard_timeout=SHARD_TIMEOUT,
+    **pipeline_kwargs,
+):
+    """Build the frame-processing service.
+
+    The event loop only parses requests and awaits. Frame fetching runs in a
+    thread pool of its own, and the OpenCV/detection pipeline runs in a pool
+    of `workers` threads (OpenCV and the detector's HTTP calls release the GIL).
+    Frames of one lot are processed one at a time, in arrival order, because
+    they share the lot's tracker and change gate. Frames of different lots run
+    concurrently. Lot state (pipeline.LOTS) and the result cache are shared
+    by all requests.
+
+    Once max_pending frames are admitted, further requests get 429 with a
+    Retry-After header instead of queueing without bound. The bridge
+    worker's queue then redelivers them later.
+
+    With shards > 0 the pipeline runs in that many worker processes instead
+    (sharding.ShardedPool). Each lot is pinned to one process by consistent
+    hashing, so every process only keeps its own lots warm. Frames a
+    worker doesn't answer within shard_timeout seconds, or that were queued
+    on a worker that died, get 504 / 500 entries.
+
+    Args:
+        workers: pipeline threads
+        max_pending: frames admitted (processing or waiting) at once
+        fetch: fn(key) -> encoded bytes or None, run in the I/O pool
+        preload: load every lot under lots/ on startup
+        shards: worker processes for the sharded mode (0 = threads)
+        shard_options: extra ShardedPool keyword arguments (e.g. initializer)
+        shard_timeout: seconds to wait for a shard worker's results
+        **pipeline_kwargs: passed to pipeline.process_frame (e.g. skip_unchanged=True)
+    """
+    state = {"pending": 0, "processed": 0, "rejected": 0}
+    lot_locks = {}
+
+    def admit(n):
+        # A batch larger than max_pending is still let in when nothing else is running
+        if state["pending"] and state["pending"] + n > max_pending:
+            state["rejected"] += n
+            return JSONResponse(
+                {"error": "Server busy, retry later"},
+                status_code=429,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+        state["pending"] += n
+        return None
+
+    async def run_lot(lot_id, frames):
+        if shards:
+            # The lot's shard queue already keeps its frames in order
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(state["shards"].submit(lot_id, frames)), shard_timeout)
+            except asyncio.TimeoutError:
+                error, reason = f"Shard worker did not answer within {shard_timeout:.0f}s", "timeout"
+            except RuntimeError as e:
+                error, reason = str(e), "failed"
+            return [{"lot_id": lot_id, "error": error, "reason": reason} for _ in frames]
+        async with lot_locks.setdefault(lot_id, asyncio.Lock()):
+            return await asyncio.get_running_loop().run_in_executor(
+                state["cpu_pool"], lambda: pipeline.process_lot_frames(lot_id, frames, **pipeline_kwargs)
+            )
+
+    @asynccontextmanager
+    async def lifespan(app):
+        state["cpu_pool"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        state["io_pool"] = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="fetch")
+        loop = asyncio.get_running_loop()
+        if shards:
+            state["shards"] = await loop.run_in_executor(
+                state["io_pool"], lambda: ShardedPool(shards, **(shard_options or {}), **pipeline_kwargs)
+            )
+        if preload:
+            await loop.run_in_executor(state["io_pool"], state["shards"].preload if shards else pipeline.LOTS.preload)
+        yield
+        if shards:
+            state["shards"].close()
+        state["io_pool"].shutdown(wait=False, cancel_futures=True)
+        state["cpu_pool"].shutdown(wait=True)
+
+    app = FastAPI(title="Frame Processing Server", lifespan=lifespan)
+
+    @app.post("/process")
+    async def process(frame: FrameRequest):
+        if not LOT_ID_PATTERN.match(frame.lot_id):
+            return JSONResponse({"error": f"Invalid lot_id: {frame.lot_id!r}"}, status_code=400)
+        rejected = admit(1)
+        if rejected is not None:
+            return rejected
+        try:
+            start = time.perf_counter()
+            data = await asyncio.get_running_loop().run_in_executor(state["io_pool"], fetch, frame.key)
+            if data is None:
+                return JSONResponse({"error": f"Frame not found: {frame.key}"}, status_code=404)
+
+            status, body = item_response(frame.key, (await run_lot(frame.lot_id, [data]))[0])
+            if status == 200:
+                state["processed"] += 1
+                body["seconds"] = round(time.perf_counter() - start, 3)
+            return JSONResponse(body, status_code=status)
+        finally:
+            state["pending"] -= 1
+
+    @app.post("/process_batch")
+    async def process_batch(batch: BatchRequest):
+        """Process a queue message batch: frames are fetched concurrently and grouped by lot.
+
+        Lots run in parallel on the pipeline pool, and each lot's frames run
+        in order. The response always has status 200 (or 429 if the batch
+        is not admitted), with one {"key", "status", ...} entry per item
+        in request order, so the caller can retry only the items that failed.
+        """
+        items = batch.items
+        invalid = {i for i, item in enumerate(items) if not LOT_ID_PATTERN.match(item.lot_id)}
+        rejected = admit(len(items))
+        if rejected is not None:
+            return rejected
+        try:
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            valid = [i for i in range(len(items)) if i not in invalid]
+            fetched = await asyncio.gather(
+                *(loop.run_in_executor(state["io_pool"], fetch, items[i].key) for i in valid), return_exceptions=True
+            )
+            fetched = dict(zip(valid, fetched))
+
+            responses = [None] * len(items)
+            ready = []
+            for i, item in enumerate(items):
+                data = fetched.get(i)
+                if i in invalid:
+                    responses[i] = (400, {"key": item.key, "error": f"Invalid lot_id: {item.lot_id!r}"})
+                elif isinstance(data, Exception):
+                    responses[i] = (502, {"key": item.key, "error": f"Could not fetch frame: {data}"})
+                elif data is None:
+                    responses[i] = (404, {"key": item.key, "error": f"Frame not found: {item.key}"})
+                else:
+                    ready.append(i)
+
+            groups = pipeline.group_by_lot([items[i].lot_id for i in ready])
+            lot_results = await asyncio.gather(
+                *(run_lot(lot_id, [fetched[ready[j]] for j in positions]) for lot_id, positions in groups.items())
+            )
+            for positions, results in zip(groups.values(), lot_results):
+                for j, result in zip(positions, results):
+                    i = ready[j]
+                    responses[i] = item_response(items[i].key, result)
+
+            succeeded = sum(status == 200 for status, _ in responses)
+            state["processed"] += succeeded
+            return {
+                "results": [dict(body, status=status) for status, body in responses],
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+        finally:
+            state["pending"] -= len(items)
+
+    @app.get("/health")
+    async def health():
+        return {
+            "pending": state["pending"],
+            "max_pending": max_pending,
+            "workers": workers,
+            "processed": state["processed"],
+            "rejected": state["rejected"],
+            "lots_loaded": len(pipeline.LOTS),
+            "shards": state["shards"].nodes if shards else [],
+            "result_cache": {"hits": pipeline.RESULT_CACHE.hits, "misses": pipeline.RESULT_CACHE.misses},
+        }
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
@@ -0,0 +1,320 @@
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import os
+import resource
+import threading
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing.connection import wait
+
+# Worker processes of the sharded execution mode (0 = run the pipeline in threads instead)
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", "0"))
+# Points per worker on the hash ring; more points spread lots more evenly
+RING_REPLICAS = int(os.environ.get("SHARD_RING_REPLICAS", "64"))
+
+
+def _ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping lot IDs to worker names.
+
+    Each worker owns `replicas` points on the ring and a lot goes to the
+    worker owning the first point at or after the lot's hash. Adding or
+    removing a worker only moves the lots next to its points, about
+    1/len(workers) of them, and every process building a ring from the same
+    worker names agrees on the owner of every lot.
+
+    Args:
+        nodes: initial worker names
+        replicas: ring points per worker
+    """
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self._points = []  # sorted (hash, node)
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted({node for _, node in self._points})
+
+    def add(self, node):
+        for i in range(self.replicas):
+            bisect.insort(self._points, (_ring_hash(f"{node}#{i}"), node))
+
+    def remove(self, node):
+        self._points = [point for point in self._points if point[1] != node]
+
+    def node_for(self, key):
+        """Return the worker that owns key, or None if the ring is empty."""
+        if not self._points:
+            return None
+        i = bisect.bisect_left(self._points, (_ring_hash(key), ""))
+        return self._points[i % len(self._points)][1]
+
+
+def _resolve(future, value, error):
+    # The caller may have given up on (cancelled) the future in the meantime
+    try:
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(RuntimeError(error))
+    except InvalidStateError:
+        pass
+
+
+def _worker_main(name, requests, results, nodes, replicas, initializer, initargs, pipeline_kwargs):
+    """Body of one shard process: processes its lots' frames in arrival order."""
+    if initializer is not None:
+        initializer(*initargs)
+    import pipeline
+    from lot_registry import list_lots
+
+    ring = HashRing(nodes, replicas)
+    while True:
+        kind, request_id, payload = requests.get()
+        if kind == "stop":
+            break
+        try:
+            if kind == "frames":
+                lot_id, frames = payload
+                value = pipeline.process_lot_frames(lot_id, frames, **pipeline_kwargs)
+                for result in value:
+                    result.pop("aligned", None)
+            elif kind == "ring":
+                # Membership changed: drop the lots now owned by another worker
+                ring = HashRing(payload, replicas)
+                for lot_id in pipeline.LOTS.loaded():
+                    if ring.node_for(lot_id) != name:
+                        pipeline.LOTS.invalidate(lot_id)
+                value = None
+            elif kind == "preload":
+                value = pipeline.LOTS.preload([lot_id for lot_id in list_lots() if ring.node_for(lot_id) == name])
+            elif kind == "stats":
+                value = {
+                    "worker": name,
+                    "pid": os.getpid(),
+                    "lots": pipeline.LOTS.loaded(),
+                    "lot_bytes": pipeline.lot_state_nbytes(),
+                    "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                }
+            else:
+                raise ValueError(f"Unknown shard request: {kind}")
+            results.put((request_id, value, None))
+        except Exception as e:
+            results.put((request_id, None, f"{type(e).__name__}: {e}"))
+
+
+class ShardedPool:
+    """Run the pipeline in worker processes, with every lot pinned to one worker.
+
+    Lots are assigned to workers with a HashRing, so each process only keeps
+    its own lots warm in its pipeline.LOTS. Memory then grows with the
+    number of lots, not workers x lots. A lot's frames all go through one
+    worker's FIFO queue, so they are processed in order. add_worker() and
+    remove_worker() rebalance: in-flight frames are drained first, so no lot
+    is handled by two workers at once, and the workers drop the lots they
+    lost. A worker process that dies (e.g. killed for memory) fails its
+    outstanding requests with RuntimeError and is restarted under the same
+    name, so its lots stay where they are.
+
+    With routing="round_robin" requests are spread over the workers
+    regardless of lot, like a shared pool. This mode is kept for benchmarks.
+
+    Args:
+        workers: number of worker processes
+        replicas: ring points per worker
+        routing: "hash" (lot affinity) or "round_robin"
+        initializer, initargs: optional fn(*initargs) run first in each worker
+        **pipeline_kwargs: passed to pipeline.process_frame in the workers
+    """
+
+    def __init__(self, workers=SHARD_WORKERS or 2, replicas=RING_REPLICAS, routing="hash", initializer=None, initargs=(), **pipeline_kwargs):
+        self.replicas = replicas
+        self.routing = routing
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pipeline_kwargs = pipeline_kwargs
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._workers = {}  # name -> (process, requests queue)
+        self._ring = HashRing(replicas=replicas)
+        self._pending = {}  # request id -> (worker name, Future)
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._names = itertools.count()
+        self._round_robin = itertools.count()
+        # Held while dispatching and while membership changes
+        self._lock = threading.RLock()
+        self._closing = False
+        self._collector = threading.Thread(target=self._collect, name="shard-results", daemon=True)
+        self._collector.start()
+        for _ in range(workers):
+            self._start_worker()
+        self._monitor = threading.Thread(target=self._watch, name="shard-monitor", daemon=True)
+        self._monitor.start()
+
+    @property
+    def nodes(self):
+        return self._ring.nodes
+
+    def _start_worker(self):
+        name = f"shard-{next(self._names)}"
+        self._ring.add(name)
+        self._spawn(name)
+        return name
+
+    def _spawn(self, name):
+        requests = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(name, requests, self._results, self._ring.nodes, self.replicas, self.initializer, self.initargs, self.pipeline_kwargs),
+            name=name,
+            daemon=True,
+        )
+        process.start()
+        self._workers[name] = (process, requests)
+
+    def _collect(self):
+        while True:
+            message = self._results.get()
+            if message is None:
+                break
+            request_id, value, error = message
+            with self._pending_lock:
+                _, future = self._pending.pop(request_id, (None, None))
+            if future is not None:
+                _resolve(future, value, error)
+
+    def _send(self, name, kind, payload=None):
+        future = Future()
+        with self._lock:
+            with self._pending_lock:
+                request_id = next(self._ids)
+                self._pending[request_id] = (name, future)
+            self._workers[name][1].put((kind, request_id, payload))
+        return future
+
+    def _fail_pending(self, name, error):
+        with self._pending_lock:
+            lost = [request_id for request_id, (worker, _) in self._pending.items() if worker == name]
+            futures = [self._pending.pop(request_id)[1] for request_id in lost]
+        for future in futures:
+            _resolve(future, None, error)
+
+    def _watch(self):
+        # Restart workers that exit without being asked to, failing what they had queued
+        while not self._closing:
+            with self._lock:
+                sentinels = {process.sentinel: name for name, (process, _) in self._workers.items()}
+            for sentinel in wait(list(sentinels), timeout=0.5):
+                name = sentinels[sentinel]
+                process = self._workers.get(name, (None, None))[0]
+                if self._closing or process is None or process.sentinel != sentinel:
+                    continue  # stopped on purpose
+                error = f"Shard worker {name} died (exit code {process.exitcode})"
+                print(f"{error} — restarting it")
+                self._fail_pending(name, error)
+                # Requests sent to the dead worker while waiting for the lock are failed too
+                while not self._lock.acquire(timeout=0.1):
+                    self._fail_pending(name, error)
+                try:
+                    if self._closing or self._workers.get(name, (None, None))[0] is not process:
+                        continue
+                    self._fail_pending(name, error)
+                    self._spawn(name)
+                finally:
+                    self._lock.release()
+
+    def worker_for(self, lot_id):
+        """Return the name of the worker a lot's frames are sent to."""
+        with self._lock:
+            if self.routing == "round_robin":
+                nodes = self._ring.nodes
+                return nodes[next(self._round_robin) % len(nodes)]
+            return self._ring.node_for(lot_id)
+
+    def submit(self, lot_id, frames):
+        """Queue encoded frames of one lot on its worker.
+
+        Returns a concurrent.futures.Future of the pipeline.process_lot_frames
+        result list (without the "aligned" images).
+        """
+        with self._lock:
+            return self._send(self.worker_for(lot_id), "frames", (lot_id, list(frames)))
+
+    def process_batch(self, items):
+        """Process (lot_id, encoded_frame) pairs on their workers; returns results in input order."""
+        from pipeline import group_by_lot
+
+        groups = group_by_lot([lot_id for lot_id, _ in items])
+        futures = {lot_id: self.submit(lot_id, [items[i][1] for i in positions]) for lot_id, positions in groups.items()}
+        results = [None] * len(items)
+        for lot_id, positions in groups.items():
+            for i, result in zip(positions, futures[lot_id].result()):
+                results[i] = result
+        return results
+
+    def _broadcast(self, kind, payload=None):
+        futures = [self._send(name, kind, payload) for name in list(self._workers)]
+        return [future.result() for future in futures]
+
+    def preload(self):
+        """Have every worker load the lots under config.LOT_DIR that it owns; returns lot_id -> error."""
+        errors = {}
+        for worker_errors in self._broadcast("preload"):
+            errors.update(worker_errors)
+        return errors
+
+    def stats(self):
+        """Return per-worker {"worker", "pid", "lots", "lot_bytes", "max_rss_bytes"} dicts."""
+        return self._broadcast("stats")
+
+    def _drain(self):
+        # Called with _lock held, so nothing new is dispatched while waiting
+        with self._pending_lock:
+            futures = [future for _, future in self._pending.values()]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def add_worker(self):
+        """Start another worker and move the lots it now owns to it; returns its name."""
+        with self._lock:
+            self._drain()
+            name = self._start_worker()
+            self._broadcast("ring", self._ring.nodes)
+        return name
+
+    def remove_worker(self, name=None):
+        """Stop a worker (the newest by default) after its queue is drained; its lots move to the others."""
+        with self._lock:
+            if len(self._workers) < 2:
+                raise ValueError("Cannot remove the last worker")
+            name = name or list(self._workers)[-1]
+            self._drain()
+            process, requests = self._workers.pop(name)
+            self._ring.remove(name)
+            requests.put(("stop", None, None))
+            process.join()
+            self._broadcast("ring", self._ring.nodes)
+
+    def close(self):
+        """Stop every worker and the result collector."""
+        with self._lock:
+            self._closing = True
+            for process, requests in self._workers.values():
+                requests.put(("stop", None, None))
+            for process, _ in self._workers.values():
+                process.join()
+            self._workers.clear()
+            self._results.put(None)
+        self._collector.join()
+        self._monitor.join()
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+from occupancy import spot_label_image
+
+# Spot crops are scored on a copy of the aligned frame shrunk by this factor
+CLASSIFIER_SCALE = 0.5
+# Gray-level standard deviation inside a spot: bare asphalt stays flat, a car
+# (body, glass, shadow) does not. Calibrated on lots/1 at CLASSIFIER_SCALE.
+FREE_MAX_STD = 28.0
+OCCUPIED_MIN_STD = 40.0
+# Fraction of Canny edge pixels a free spot may have (paint lines, cracks)
+FREE_MAX_EDGES = 0.10
+
+
+def spot_features(image, parking_data, scale=CLASSIFIER_SCALE):
+    """Compute per-spot features for every spot of a frame in one pass.
+
+    Args:
+        image: BGR frame the polygons are in (e.g. the aligned frame)
+        parking_data: list of (polygon_ndarray, spot_id) tuples in that frame's coordinates
+        scale: downscale factor applied before measuring
+
+    Returns an (n_spots, 3) float array of gray mean, gray standard deviation
+    and edge density. Spots with no pixels get zeros.
+    """
+    gray = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    labels = spot_label_image(parking_data, image.shape, scale)
+    # resize rounds sizes while the label image truncates them; measure their common area
+    h, w = min(gray.shape[0], labels.shape[0]), min(gray.shape[1], labels.shape[1])
+    gray, labels = gray[:h, :w], labels[:h, :w].ravel()
+    edges = cv2.Canny(gray, 50, 150).ravel() > 0
+    values = gray.ravel().astype(np.float64)
+
+    n = len(parking_data) + 1
+    counts = np.maximum(np.bincount(labels, minlength=n), 1)
+    mean = np.bincount(labels, weights=values, minlength=n) / counts
+    sq_mean = np.bincount(labels, weights=values * values, minlength=n) / counts
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0))
+    edge_density = np.bincount(labels, weights=edges, minlength=n) / counts
+    return np.column_stack([mean, std, edge_density])[1:]
+
+
+def classify_spots(
+    image,
+    parking_data,
+    scale=CLASSIFIER_SCALE,
+    free_max_std=FREE_MAX_STD,
+    occupied_min_std=OCCUPIED_MIN_STD,
+    free_max_edges=FREE_MAX_EDGES,
+):
+    """Label each spot as occupied, free, or unsure from its crop of an aligned frame.
+
+    Args:
+        image: BGR frame the polygons are in
+        parking_data: list of (polygon_ndarray, spot_id) tuples in that frame's coordinates
+        scale: downscale factor applied before measuring
+        free_max_std, occupied_min_std: gray standard deviation bounds for a
+                                        confident free / occupied decision
+        free_max_edges: maximum edge density of a confidently free spot
+
+    Returns (states, confidences): states holds "occupied", "free" or None
+    (unsure) per spot, and confidences a heuristic score for occupied spots
+    (how far the spread exceeds occupied_min_std; 0.0 otherwise). It is not
+    a calibrated probability like a detector's confidence.
+    """
+    features = spot_features(image, parking_data, scale)
+    std, edge_density = features[:, 1], features[:, 2]
+
+    occupied = std >= occupied_min_std
+    free = (std <= free_max_std) & (edge_density <= free_max_edges)
+    confidences = np.where(occupied, np.minimum(0.99, std / (2 * occupied_min_std)), 0.0)
+    states = ["occupied" if o else "free" if f else None for o, f in zip(occupied, free)]
+    return states, [round(float(c), 2) for c in confidences]
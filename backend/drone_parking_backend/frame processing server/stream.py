@@ -0,0 +1,240 @@
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+import pipeline
+from frame_io import MAX_DECODE_SIDE, decode_frame
+from result_cache import frame_digest
+
+# Frames buffered between stages, and detector calls in flight at once
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", "4"))
+STREAM_DETECT_WORKERS = int(os.environ.get("STREAM_DETECT_WORKERS", "2"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+_DONE = object()
+
+
+def _shrink(image, max_side):
+    scale = max_side / max(image.shape[:2]) if max_side else 1.0
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def frame_source(source, every=1, max_side=MAX_DECODE_SIDE):
+    """Yield (name, image, frame_hash) for every `every`-th frame of a source.
+
+    Args:
+        source: a directory of images (read in name order), a video file or
+                stream URL opened with cv2.VideoCapture, or an iterable of
+                BGR arrays or encoded frames (bytes/memoryview)
+        every: keep one frame in `every` (skipped video frames are only grabbed, not decoded)
+        max_side: shrink frames whose longer side exceeds this (0 = keep full resolution)
+
+    frame_hash is the content hash of encoded frames (with the decode
+    reduction factor, see result_cache.frame_digest), or None for decoded ones.
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for name in names[::every]:
+            with open(os.path.join(source, name), "rb") as f:
+                data = f.read()
+            image, factor = decode_frame(data, max_side)
+            if image is None:
+                print(f"Skipping {name}: could not decode")
+                continue
+            yield name, image, frame_digest(data, factor)
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        capture = cv2.VideoCapture(str(source))
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video: {source}")
+        try:
+            index = 0
+            while True:
+                if index % every:
+                    if not capture.grab():
+                        break
+                else:
+                    ok, image = capture.read()
+                    if not ok:
+                        break
+                    yield f"{os.path.basename(str(source))}#{index}", _shrink(image, max_side), None
+                index += 1
+        finally:
+            capture.release()
+        return
+
+    for index, item in enumerate(source):
+        if index % every:
+            continue
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            image, factor = decode_frame(item, max_side)
+            if image is None:
+                print(f"Skipping frame {index}: could not decode")
+                continue
+            yield f"frame{index}", image, frame_digest(item, factor)
+        else:
+            yield f"frame{index}", _shrink(item, max_side), None
+
+
+def stream_frames(
+    lot_id,
+    source,
+    every=1,
+    max_side=MAX_DECODE_SIDE,
+    queue_size=STREAM_QUEUE_SIZE,
+    detect_workers=STREAM_DETECT_WORKERS,
+    visualize=False,
+    stats=None,
+    **kwargs,
+):
+    """Process a sequence of frames of one lot with the pipeline stages overlapped.
+
+    Decoding, alignment (pipeline.align_frame), detection
+    (pipeline.detect_frame) and completion (pipeline.complete_frame plus the
+    optional visualization) run concurrently. The stages are connected by
+    bounded queues, so frame N+1 is aligned while frame N waits on the
+    detector, and up to detect_workers detector calls are in flight. Alignment
+    and completion stay in frame order, so tracking and the change gate see
+    the frames in sequence. Results are yielded in frame order as they finish.
+    Sustained throughput then approaches the slowest stage instead of the sum
+    of all stages.
+
+    Args:
+        lot_id: lot the frames belong to
+        source: image directory, video file or iterable of frames (see frame_source)
+        every: process one frame in `every`
+        max_side: shrink frames whose longer side exceeds this (0 = full resolution)
+        queue_size: frames buffered between stages
+        detect_workers: detector calls in flight at once
+        visualize: add the master-space "visualization" to each result
+        stats: optional dict filled with "frames", "seconds", "fps" and per-stage busy seconds in "stages"
+        **kwargs: passed to pipeline.process_frame (e.g. cache=None, skip_unchanged=True)
+
+    Yields process_frame results with the frame's "frame" name added.
+    """
+    stop = threading.Event()
+    decoded = queue.Queue(maxsize=queue_size)
+    detecting = queue.Queue(maxsize=queue_size)
+    busy = {"decode": 0.0, "align": 0.0, "detect": 0.0, "complete": 0.0}
+    busy_lock = threading.Lock()
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def decode_stage():
+        try:
+            frames = frame_source(source, every, max_side)
+            while not stop.is_set():
+                start = time.perf_counter()
+                item = next(frames, _DONE)
+                busy["decode"] += time.perf_counter() - start
+                if item is _DONE or not put(decoded, item):
+                    break
+        except Exception as e:
+            put(decoded, e)
+        put(decoded, _DONE)
+
+    def timed_detect(frame):
+        start = time.perf_counter()
+        frame = pipeline.detect_frame(frame)
+        with busy_lock:
+            busy["detect"] += time.perf_counter() - start
+        return frame
+
+    def align_stage():
+        while True:
+            item = get(decoded)
+            if item is _DONE or isinstance(item, Exception):
+                put(detecting, item)
+                if item is _DONE:
+                    return
+                continue
+            name, image, frame_hash = item
+            try:
+                start = time.perf_counter()
+                frame = pipeline.align_frame(lot_id, image, frame_hash=frame_hash, **kwargs)
+                busy["align"] += time.perf_counter() - start
+                if frame is None:
+                    raise ValueError(f"Lot {lot_id} could not be loaded")
+                item = (name, image, detectors.submit(timed_detect, frame))
+            except Exception as e:
+                item = e
+            put(detecting, item)
+
+    detectors = ThreadPoolExecutor(max_workers=detect_workers, thread_name_prefix="stream-detect")
+    stages = [threading.Thread(target=decode_stage, daemon=True), threading.Thread(target=align_stage, daemon=True)]
+    started = time.perf_counter()
+    frames = 0
+    for stage in stages:
+        stage.start()
+    try:
+        while True:
+            item = get(detecting)
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            name, image, future = item
+            frame = future.result()
+
+            start = time.perf_counter()
+            result = pipeline.complete_frame(frame)
+            if visualize:
+                lot, err = pipeline.LOTS.get(lot_id)
+                if not err:
+                    result["visualization"] = pipeline.render_result(image, result, lot["master_img"], lot["parking_data"])
+            result["frame"] = name
+            busy["complete"] += time.perf_counter() - start
+            frames += 1
+            yield result
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+        detectors.shutdown(wait=True, cancel_futures=True)
+        if stats is not None:
+            seconds = time.perf_counter() - started
+            stats.update(frames=frames, seconds=seconds, fps=frames / seconds if seconds else 0.0, stages=dict(busy))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python stream.py <video_or_image_dir> [lot_id] [every]")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    lot_id = sys.argv[2] if len(sys.argv) > 2 else "1"
+    every = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    stats = {}
+    for result in stream_frames(lot_id, source, every=every, stats=stats, skip_unchanged=True):
+        occupied = [o["id"] for o in result["occupancy"]["occupied"]]
+        print(f"{result['frame']}: {len(occupied)} occupied {occupied}")
+
+    stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in stats["stages"].items())
+    print(
+        f"{stats['frames']} frames in {stats['seconds']:.2f}s ({stats['fps']:.2f} fps) | "
+        f"stage busy time: {stages} (sum {sum(stats['stages'].values()):.2f}s)"
+    )
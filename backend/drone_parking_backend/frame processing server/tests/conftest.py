@@ -0,0 +1,96 @@
+import pytest
+import json
+import time
+import cv2
+import numpy as np
+import config
+""" Synthetic masters, lots and drone frames shared by the test modules """
+def textured_master(seed=1):
+    rng = np.random.default_rng(seed)
+    master = np.full((600, 800, 3), 60, dtype=np.uint8)
+    for _ in range(80):
+        x, y = int(rng.integers(0, 760)), int(rng.integers(0, 560))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(master, (x, y), (x + int(rng.integers(10, 40)), y + int(rng.integers(10, 40))), color, -1)
+    return master
+
+def shapes_master():
+    master = np.zeros((200, 200, 3), dtype=np.uint8)
+    cv2.rectangle(master, (20, 20), (80, 80), (255, 255, 255), -1)
+    cv2.circle(master, (150, 50), 20, (200, 100, 50), -1)
+    cv2.fillPoly(master, [np.array([[50, 150], [100, 190], [10, 190]])], (100, 255, 100))
+    cv2.line(master, (120, 150), (180, 180), (100, 100, 255), 5)
+    return master
+
+@pytest.fixture
+def make_master():
+    # make_master(seed=1): an 800x600 master textured with 80 random blocks
+    return textured_master
+
+@pytest.fixture
+def make_shapes_master():
+    # make_shapes_master(): a 200x200 black master with four solid shapes
+    return shapes_master
+
+@pytest.fixture
+def make_lot(tmp_path, monkeypatch):
+    # make_lot(lot_id): writes a lot with spots A1 and A2 under tmp_path, which becomes config.LOT_DIR
+    monkeypatch.setattr(config, "LOT_DIR", str(tmp_path))
+
+    def make(lot_id):
+        master = textured_master()
+        lot_dir = tmp_path / lot_id
+        lot_dir.mkdir()
+        cv2.imwrite(str(lot_dir / "master.jpg"), master)
+        spots = [
+            {"id": "A1", "polygon": [[100, 100], [200, 100], [200, 200], [100, 200]]},
+            {"id": "A2", "polygon": [[300, 100], [400, 100], [400, 200], [300, 200]]},
+        ]
+        (lot_dir / "parking.json").write_text(json.dumps(spots))
+        return master
+
+    return make
+
+@pytest.fixture
+def drone_frame():
+    # drone_frame(master, dx=6.0, dy=-4.0, H=None) -> (frame, H): the master seen from a drone whose frame maps to it by H
+    def warp(master, dx=6.0, dy=-4.0, H=None):
+        if H is None:
+            H = np.array([[1.0, 0.01, dx], [-0.01, 1.0, dy], [0.0, 0.0, 1.0]])
+        h, w = master.shape[:2]
+        return cv2.warpPerspective(master, np.linalg.inv(H), (w, h)), H
+
+    return warp
+
+@pytest.fixture
+def rotated_frame():
+    # rotated_frame(master, angle=5, dx=10, dy=-5): the master rotated about its centre and shifted, as a drone would see it
+    def rotate(master, angle=5, dx=10, dy=-5):
+        h, w = master.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+        M[0, 2] += dx
+        M[1, 2] += dy
+        return cv2.warpAffine(master, M, (w, h))
+
+    return rotate
+
+def offline_worker(lot_dir):
+    # Shard worker initializer: read lots from lot_dir and replace the detector with a fixed car in A1
+    import pipeline
+    config.LOT_DIR = lot_dir
+    pipeline.detect_cars = lambda image, **kwargs: [(110, 110, 190, 190, 0.9)]
+
+def slow_offline_worker(lot_dir):
+    # As offline_worker, with a detector that takes 2 s per frame
+    import pipeline
+    offline_worker(lot_dir)
+    pipeline.detect_cars = lambda image, **kwargs: time.sleep(2) or [(110, 110, 190, 190, 0.9)]
+
+@pytest.fixture
+def offline_initializer():
+    # Module-level function, so spawned shard processes can unpickle it
+    return offline_worker
+
+@pytest.fixture
+def slow_offline_initializer():
+    return slow_offline_worker
@@ -1,7 +1,23 @@
 import pytest
 import cv2
 import numpy as np
-from align import align_to_master
+from align import (
+    ESTIMATORS,
+    align_to_master,
+    align_to_master_pyramid,
+    build_alignment_mask,
+    build_master_matcher,
+    estimate_homography,
+    keypoint_coords,
+    knn_candidates,
+    precompute_master,
+    precompute_master_variants,
+    project_box_corners,
+    project_boxes_to_master,
+    project_parking_data,
+    ratio_test,
+)
+from occupancy import check_occupancy
 """ Generates a synethtic master frame with sone solid shapes, and then creates a live drone frame by rotating it 5 degrees from translating
 the X and Y coordinates. """
 def test_align_to_master_synthetic():
@@ -34,3 +50,114 @@ def test_align_fail_gracefully():
     assert result["homography"] is None
     assert result["inliers"] < 10
     assert result["aligned"].shape == drone_img.shape
+
+def test_align_with_trained_master_matcher(make_shapes_master, rotated_frame):
+    master = make_shapes_master()
+    drone_img = rotated_frame(master)
+
+    kp, des = precompute_master(master)
+    matcher = build_master_matcher(des)
+
+    # The trained index is reused across frames without being rebuilt
+    for _ in range(2):
+        result = align_to_master(master, drone_img, master_kp=kp, master_des=des, master_matcher=matcher)
+        assert result["homography"] is not None
+        assert result["inliers"] >= 10
+
+    assert build_master_matcher(None) is None
+
+def test_pyramid_alignment_full_resolution_homography(make_master, drone_frame):
+    master = make_master(0)
+    H_true = np.array([[1.02, 0.03, -15.0], [-0.02, 0.99, 12.0], [0.0, 0.0, 1.0]])
+    drone_img, _ = drone_frame(master, H=H_true)
+
+    result = align_to_master_pyramid(master, drone_img, scale=0.5, refine="matches")
+
+    assert result["homography"] is not None
+    assert result["refinement"] == "matches"
+    assert result["aligned"].shape == master.shape
+    corners = np.float32([[0, 0], [800, 0], [800, 600], [0, 600]]).reshape(-1, 1, 2)
+    error = np.linalg.norm(
+        cv2.perspectiveTransform(corners, result["homography"]) - cv2.perspectiveTransform(corners, H_true), axis=2
+    )
+    assert error.mean() < 1.0
+
+def test_parallel_fallbacks_with_precomputed_variants(make_shapes_master, rotated_frame):
+    master = make_shapes_master()
+    drone_img = rotated_frame(master)
+
+    variants = precompute_master_variants(master)
+    assert set(variants) == {"clahe", "orb"}
+
+    result = align_to_master(master, drone_img, master_variants=variants, parallel_fallbacks=True)
+    assert result["homography"] is not None
+    assert result["inliers"] >= 10
+    assert result["keypoints_live"] > 0  # counted by the winning strategy
+
+    blank = np.zeros((200, 200, 3), dtype=np.uint8)
+    failed = align_to_master(blank, blank, master_variants=precompute_master_variants(blank), parallel_fallbacks=True)
+    assert failed["homography"] is None
+    assert failed["aligned"].shape == blank.shape
+
+    # Without SIFT features the CLAHE fallback wins, although it is missing from master_variants
+    no_sift = dict(master_kp=(), master_des=np.empty((0, 128), np.float32), master_variants={"orb": variants["orb"]})
+    partial = align_to_master(master, drone_img, **no_sift)
+    assert partial["homography"] is not None and partial["fallback_used"] == "CLAHE + SIFT"
+    assert partial["keypoints_live"] > 0
+    partial = align_to_master(master, drone_img, parallel_fallbacks=True, **no_sift)
+    assert partial["homography"] is not None and partial["keypoints_live"] > 0
+
+def test_projected_spots_match_warped_occupancy():
+    # live -> master is a pure translation, so warped and projected occupancy must agree exactly
+    H = np.array([[1.0, 0.0, 30.0], [0.0, 1.0, -20.0], [0.0, 0.0, 1.0]])
+    parking_data = [
+        (np.array([[100, 100], [200, 100], [200, 200], [100, 200]], np.int32), "A1"),
+        (np.array([[300, 100], [400, 100], [400, 200], [300, 200]], np.int32), "A2"),
+    ]
+    master_boxes = [(110, 110, 190, 190, 0.9)]
+    live_boxes = [(80, 130, 160, 210, 0.9)]
+
+    live_parking = project_parking_data(parking_data, H)
+    assert np.array_equal(live_parking[0][0], parking_data[0][0] + [-30, 20])
+
+    assert check_occupancy(live_boxes, live_parking) == check_occupancy(master_boxes, parking_data)
+    assert project_boxes_to_master(live_boxes, H) == master_boxes
+    assert np.allclose(project_box_corners(live_boxes, H), [[[110, 110], [190, 110], [190, 190], [110, 190]]])
+
+def test_masked_budgeted_master_features():
+    rng = np.random.default_rng(2)
+    master = np.full((300, 400, 3), 60, dtype=np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(0, 370)), int(rng.integers(0, 270))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(master, (x, y), (x + int(rng.integers(8, 30)), y + int(rng.integers(8, 30))), color, -1)
+
+    spot = np.array([[0, 0], [200, 0], [200, 300], [0, 300]], np.int32)
+    mask = build_alignment_mask(master.shape, exclude=[spot], border=10)
+    assert mask[150, 100] == 0 and mask[5, 300] == 0 and mask[150, 300] == 255
+    assert build_alignment_mask(master.shape) is None
+
+    kp, des = precompute_master(master, mask=mask, max_keypoints=50)
+    assert 0 < len(kp) <= 50
+    assert all(k.pt[0] >= 200 for k in kp)
+
+def test_vectorized_ratio_test_and_estimators(make_master, drone_frame):
+    master = make_master(3)
+    H_true = np.array([[1.01, 0.02, -12.0], [-0.02, 1.0, 9.0], [0.0, 0.0, 1.0]])
+    drone_img, _ = drone_frame(master, H=H_true)
+
+    master_kp, master_des = precompute_master(master)
+    live_kp, live_des = precompute_master(drone_img)
+    candidates = knn_candidates(master_des, live_des, index=build_master_matcher(master_des))
+    live_idx, master_idx = ratio_test(candidates, 0.7)
+    assert len(live_idx) == len(master_idx) >= 10
+
+    for estimator in ESTIMATORS:
+        H, inliers = estimate_homography(
+            keypoint_coords(live_kp)[live_idx], keypoint_coords(master_kp)[master_idx], estimator, max_iters=500
+        )
+        assert inliers >= 10
+        assert np.abs(H - H_true)[:, 2].max() < 1.0
+
+        result = align_to_master(master, drone_img, estimator=estimator, max_iters=500)
+        assert result["homography"] is not None
@@ -0,0 +1,24 @@
+import pytest
+import cv2
+import pipeline
+from change_gate import gate_stats, reset_gate
+""" Runs a frame sequence through the change gate and checks that detection only runs when a spot changed """
+def test_unchanged_spots_skip_detection(mocker, make_lot, drone_frame):
+    master = make_lot("CG1")
+    mock_detect = mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+    reset_gate("CG1")
+
+    parked = master.copy()
+    cv2.rectangle(parked, (320, 120), (380, 180), (250, 250, 250), -1)  # a car pulls into A2
+    results = []
+    for scene, dx in ((master, 6.0), (master, 7.0), (parked, 7.5)):
+        frame, _ = drone_frame(scene, dx)
+        results.append(pipeline.process_frame("CG1", frame, cache=None, skip_unchanged=True))
+    stats = gate_stats("CG1")
+    pipeline.LOTS.invalidate("CG1")
+    pipeline.reset_tracker("CG1")
+
+    assert [r["detection_skipped"] for r in results] == [False, True, False]
+    assert results[1]["occupancy"] == results[0]["occupancy"]
+    assert mock_detect.call_count == 2
+    assert stats == (1, 2)
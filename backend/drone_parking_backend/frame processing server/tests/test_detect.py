@@ -1,6 +1,12 @@
 import pytest
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
 import numpy as np
-from detect import preprocess, detect_cars
+import detect
+from detect import Preprocessor, preprocess, detect_cars, detect_cars_tiled, merge_boxes, parse_predictions, spot_union_roi, tile_grid
 """ Passes dummy image matrices through the pipeline """
 def test_preprocess_keeps_shape_and_type():
     img = np.random.randint(0, 256, (100, 100, 3), dtype=np.uint8)
@@ -9,6 +15,30 @@ def test_preprocess_keeps_shape_and_type():
     assert out.shape == (100, 100, 3)
     assert out.dtype == np.uint8
 
+def test_preprocessor_matches_original_and_reuses_buffers():
+    """Preprocessor must be bit-exact with the original per-call implementation."""
+    def original(image):
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        cl = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8)).apply(l)
+        enhanced = cv2.cvtColor(cv2.merge((cl, a, b)), cv2.COLOR_LAB2BGR)
+        table = np.array([((i / 255.0) ** (1.0 / 1.2)) * 255 for i in np.arange(0, 256)]).astype("uint8")
+        kernel = np.array([[-1/9, -1/9, -1/9], [-1/9, 17/9, -1/9], [-1/9, -1/9, -1/9]])
+        return cv2.filter2D(cv2.LUT(enhanced, table), -1, kernel)
+
+    rng = np.random.default_rng(0)
+    preprocessor = Preprocessor()
+    for shape in [(100, 100, 3), (37, 61, 3), (100, 100, 3)]:
+        img = rng.integers(0, 256, shape, dtype=np.uint8)
+        expected = original(img)
+        assert np.array_equal(preprocess(img), expected)
+
+        out = np.zeros_like(img)
+        assert preprocessor(img, out) is out
+        assert np.array_equal(out, expected)
+        # A fresh array is returned when no buffer is given, so results don't alias
+        assert preprocessor(img) is not preprocessor(img)
+
 def test_detect_cars_mocked(mocker):
     """
     Mock the Roboflow API response so we test parsing logic 
@@ -45,3 +75,148 @@ def test_detect_cars_mocked(mocker):
     assert x2 == 60
     assert y2 == 60
     assert conf == 0.95
+
+def test_local_backend_matches_roboflow_boxes(mocker, tmp_path, monkeypatch):
+    # One (1, 4 + num_classes, N) YOLOv8 output in 64x64 input pixels: a car, a weaker duplicate and a low score
+    output = np.array([[
+        [32, 33, 10],
+        [32, 32, 50],
+        [16, 16, 8],
+        [16, 16, 8],
+        [0.9, 0.6, 0.1],
+    ]], dtype=np.float32)
+    mock_net = mocker.MagicMock()
+    mock_net.forward.return_value = output
+    mocker.patch("detect.cv2.dnn.readNetFromONNX", return_value=mock_net)
+    model_path = tmp_path / "model.onnx"
+    model_path.write_bytes(b"")
+
+    monkeypatch.setattr(detect, "DETECTOR_BACKENDS", {"local": lambda: detect.LocalDetector(str(model_path), 64)})
+    monkeypatch.setattr(detect, "DETECTOR_BACKEND", "local")
+    monkeypatch.setattr(detect, "_detectors", {})
+
+    dummy_img = np.ones((100, 200, 3), dtype=np.uint8) * 100
+    boxes = detect_cars(dummy_img, confidence=40, overlap=30, use_preprocess=False)
+
+    # What the hosted API returns for the same detection, in image pixels
+    roboflow_boxes = parse_predictions([{"x": 100, "y": 50, "width": 50, "height": 25, "confidence": 0.9}])
+    assert len(boxes) == 1
+    assert boxes[0][:4] == roboflow_boxes[0][:4] == (75, 37, 125, 62)
+    assert boxes[0][4] == pytest.approx(0.9)
+    assert mock_net.setInput.call_args[0][0].shape == (1, 3, 64, 64)
+
+    # Every thread runs its own copy of the network
+    read_net = detect.cv2.dnn.readNetFromONNX
+    detector = detect.get_detector("local")
+    nets = []
+    thread = threading.Thread(target=lambda: nets.append(detector.net))
+    thread.start()
+    thread.join()
+    assert detector.net is mock_net and read_net.call_count == 2 and len(nets) == 1
+
+    with pytest.raises(ValueError):
+        detect.get_detector("missing")
+
+def test_compact_upload_maps_boxes_back(mocker, monkeypatch):
+    monkeypatch.setattr(detect, "_detectors", {})
+    mock_post = mocker.patch("detect.requests.Session.post")
+    # A car at the center of the sent image, which is the 400x200 ROI halved to 200x100
+    mock_post.return_value.json.return_value = {
+        "predictions": [{"x": 100, "y": 50, "width": 20, "height": 10, "confidence": 0.8, "class": "car"}]
+    }
+
+    image = np.random.randint(0, 256, (600, 800, 3), dtype=np.uint8)
+    parking_data = [
+        (np.array([[132, 232], [300, 232], [300, 367], [132, 367]], np.int32), "A1"),
+        (np.array([[300, 232], [467, 232], [467, 367], [300, 367]], np.int32), "A2"),
+    ]
+    roi = spot_union_roi(parking_data, image.shape)
+    assert roi == (100, 200, 400, 200)
+
+    stats = {}
+    boxes = detect_cars(image, use_preprocess=False, backend="roboflow", roi=roi, input_size=200, jpeg_quality=70, stats=stats)
+
+    assert boxes == [(280, 290, 320, 310, 0.8)]
+    sent = mock_post.call_args.kwargs["data"]
+    assert stats["bytes_sent"] == len(sent)
+    assert cv2.imdecode(np.frombuffer(base64.b64decode(sent), np.uint8), cv2.IMREAD_COLOR).shape == (100, 200, 3)
+    assert stats["full_frame_bytes"] > stats["bytes_sent"]
+    assert stats["latency_saved"] > 0
+
+def test_detect_cars_many_against_stub_server(monkeypatch):
+    requests_seen = []
+    client_ports = set()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            requests_seen.append(self.path)
+            client_ports.add(self.client_address[1])
+            if len(requests_seen) == 1:
+                # First call fails so the client has to retry it
+                payload, status = b"{}", 503
+            else:
+                image = cv2.imdecode(np.frombuffer(base64.b64decode(body), np.uint8), cv2.IMREAD_COLOR)
+                # Echo the frame width back as the x position so results can be matched to inputs
+                prediction = {"x": image.shape[1] / 2, "y": 10, "width": 4, "height": 4, "confidence": 0.9}
+                payload, status = json.dumps({"predictions": [prediction]}).encode(), 200
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = detect.DetectionClient(f"http://127.0.0.1:{server.server_port}", max_concurrency=2, timeout=5, backoff=0)
+    monkeypatch.setattr(detect, "_client", client)
+    monkeypatch.setattr(detect, "_detectors", {})
+    try:
+        images = [np.zeros((40, 20 * (i + 1), 3), dtype=np.uint8) for i in range(6)]
+        results = detect.detect_cars_many(images, use_preprocess=False, backend="roboflow")
+        # 12 tiles still share the client's two pooled connections
+        tiled = detect_cars_tiled(np.zeros((120, 360, 3), np.uint8), use_preprocess=False, backend="roboflow", tile_size=60, tile_overlap=0)
+    finally:
+        client.close()
+        server.shutdown()
+
+    assert [boxes[0][0] for boxes in results] == [8 + 10 * i for i in range(6)]
+    assert len(requests_seen) == 7 + 12 and len(tiled) > 0
+    assert requests_seen[0].startswith("/drone-parking-detection/4?")
+    # Keep-alive: the 19 requests reuse at most one connection per worker (plus one after the 503)
+    assert len(client_ports) <= 3
+
+def test_tiled_detection_merges_cars_across_seams(monkeypatch):
+    class BlobDetector:
+        # Reports every white blob in the tile as a car, including ones clipped by the tile edge
+        def predict(self, image, confidence=30, overlap=30):
+            mask = cv2.inRange(image, (250, 250, 250), (255, 255, 255))
+            predictions = []
+            for contour in cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+                x, y, w, h = cv2.boundingRect(contour)
+                predictions.append({"x": x + w / 2, "y": y + h / 2, "width": w, "height": h, "confidence": 0.9})
+            return predictions
+
+    monkeypatch.setattr(detect, "DETECTOR_BACKENDS", {"blobs": BlobDetector})
+    monkeypatch.setattr(detect, "_detectors", {})
+
+    image = np.zeros((300, 700, 3), dtype=np.uint8)
+    cv2.rectangle(image, (180, 40), (229, 79), (255, 255, 255), -1)  # across the seam of the first two tiles
+    cv2.rectangle(image, (20, 200), (59, 239), (255, 255, 255), -1)
+    cv2.rectangle(image, (600, 200), (639, 239), (255, 255, 255), -1)  # only in a tile without spots
+    parking_data = [(np.array([[0, 0], [300, 0], [300, 299], [0, 299]], np.int32), "A1")]
+
+    tiles = tile_grid(image.shape, 250, 80, parking_data)
+    assert tiles == [(0, 0, 250, 250), (170, 0, 250, 250), (0, 50, 250, 250), (170, 50, 250, 250)]
+
+    boxes = detect_cars_tiled(image, parking_data, use_preprocess=False, backend="blobs", tile_size=250, tile_overlap=80)
+    assert sorted(b[:4] for b in boxes) == [(20, 200, 60, 240), (180, 40, 230, 80)]
+
+    # A half box clipped by a tile edge is folded into the whole one
+    assert merge_boxes([(100, 0, 130, 40, 0.9), (100, 0, 150, 40, 0.9)]) == [(100, 0, 150, 40, 0.9)]
+    assert len(merge_boxes([(0, 0, 40, 40, 0.9), (60, 0, 100, 40, 0.8)])) == 2
@@ -0,0 +1,116 @@
+import pytest
+import json
+import threading
+import cv2
+import numpy as np
+import config
+from feature_cache import CACHE_FILENAME, file_hash, load_features, save_features
+""" Round-trips master SIFT features through the on-disk cache and checks that a changed master invalidates it """
+def test_save_and_load_roundtrip(tmp_path, make_shapes_master):
+    master = make_shapes_master()
+    kp, des = cv2.SIFT_create().detectAndCompute(cv2.cvtColor(master, cv2.COLOR_BGR2GRAY), None)
+
+    path = str(tmp_path / CACHE_FILENAME)
+    save_features(path, "abc", (200, 200), {"sift": (kp, des)})
+
+    image_size, feature_sets = load_features(path, "abc")
+    kp2, des2 = feature_sets["sift"]
+
+    assert image_size == (200, 200)
+    assert len(kp2) == len(kp)
+    assert kp2[0].pt == pytest.approx(kp[0].pt)
+    assert np.array_equal(des2, des)
+    assert load_features(path, "other-hash") is None
+
+def test_load_master_features_invalidated_by_new_master(tmp_path, monkeypatch, make_shapes_master):
+    monkeypatch.setattr(config, "LOT_DIR", str(tmp_path))
+    lot_dir = tmp_path / "A"
+    lot_dir.mkdir()
+    master_path = str(lot_dir / "master.jpg")
+    cv2.imwrite(master_path, make_shapes_master())
+
+    kp, des = config.load_master_features("A")
+    cache_path = str(lot_dir / CACHE_FILENAME)
+    assert load_features(cache_path, file_hash(master_path)) is not None
+
+    cached_kp, cached_des = config.load_master_features("A")
+    assert len(cached_kp) == len(kp)
+
+    cv2.imwrite(master_path, np.zeros((120, 160, 3), dtype=np.uint8))
+    kp_new, des_new = config.load_master_features("A")
+    assert len(kp_new) == 0
+    assert des_new is None
+    image_size, _ = load_features(cache_path, file_hash(master_path))
+    assert image_size == (160, 120)
+
+def test_load_lot_reads_features_lazily(tmp_path, monkeypatch, make_shapes_master):
+    monkeypatch.setattr(config, "LOT_DIR", str(tmp_path))
+    lot_dir = tmp_path / "L"
+    lot_dir.mkdir()
+    cv2.imwrite(str(lot_dir / "master.jpg"), make_shapes_master())
+    (lot_dir / "parking.json").write_text(json.dumps([{"id": "A1", "polygon": [[0, 0], [50, 0], [50, 50], [0, 50]]}]))
+
+    master, parking_data, features, err = config.load_lot_features("L")
+    assert err is None and len(parking_data) == 1
+    assert not (lot_dir / CACHE_FILENAME).exists()
+    kp, des = features.sift()
+    assert (lot_dir / CACHE_FILENAME).exists()
+    assert np.array_equal(des, config.load_master_features("L")[1])
+    assert set(features.variants()) == {"clahe", "orb"}
+    assert config.load_lot_features("missing") == (None, None, None, "Master image missing for missing")
+
+def test_concurrent_cache_writers_use_separate_temp_files(tmp_path, make_shapes_master):
+    master = make_shapes_master()
+    kp, des = cv2.SIFT_create().detectAndCompute(cv2.cvtColor(master, cv2.COLOR_BGR2GRAY), None)
+    path = str(tmp_path / CACHE_FILENAME)
+    errors = []
+
+    def write():
+        try:
+            for _ in range(20):
+                save_features(path, "abc", (200, 200), {"sift": (kp, des)})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [p.name for p in tmp_path.iterdir()] == [CACHE_FILENAME]
+    assert len(load_features(path, "abc")[1]["sift"][0]) == len(kp)
+
+def test_load_master_variants_extends_cache(tmp_path, monkeypatch, make_shapes_master):
+    monkeypatch.setattr(config, "LOT_DIR", str(tmp_path))
+    lot_dir = tmp_path / "B"
+    lot_dir.mkdir()
+    master_path = str(lot_dir / "master.jpg")
+    cv2.imwrite(master_path, make_shapes_master())
+
+    config.load_master_features("B")
+    variants = config.load_master_variants("B")
+
+    assert set(variants) == {"clahe", "orb"}
+    assert variants["clahe"]["matcher"] is not None
+    _, feature_sets = load_features(str(lot_dir / CACHE_FILENAME), file_hash(master_path))
+    assert set(feature_sets) == {"sift", "clahe", "orb"}
+    assert feature_sets["orb"][1].dtype == np.uint8
+
+def test_alignment_settings_key_the_cache(tmp_path, monkeypatch, make_shapes_master):
+    monkeypatch.setattr(config, "LOT_DIR", str(tmp_path))
+    lot_dir = tmp_path / "C"
+    lot_dir.mkdir()
+    master = make_shapes_master()
+    cv2.imwrite(str(lot_dir / "master.jpg"), master)
+    (lot_dir / "alignment.json").write_text('{"max_keypoints": 5, "border": 4}')
+
+    settings = config.load_alignment_settings("C")
+    assert settings["max_keypoints"] == 5
+    assert settings["exclude_spots"] is False
+
+    full_kp, _ = config.load_master_features("C", master)
+    mask = config.build_master_mask(master, [], settings)
+    budget_kp, _ = config.load_master_features("C", master, mask, settings["max_keypoints"])
+    assert len(budget_kp) < len(full_kp)
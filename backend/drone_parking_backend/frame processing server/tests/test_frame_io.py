@@ -0,0 +1,31 @@
+import pytest
+import cv2
+import pipeline
+from frame_io import decode_frame, encoded_image_size
+""" Decodes uploaded frames from memory, at full and reduced resolution, and runs them through pipeline.process_frame_bytes """
+def test_process_frame_bytes_decodes_in_memory(tmp_path, monkeypatch, mocker, make_lot, drone_frame):
+    monkeypatch.chdir(tmp_path)
+    master = make_lot("BY1")
+    frame, _ = drone_frame(master)
+    jpeg = cv2.imencode(".jpg", frame)[1].tobytes()
+    png = cv2.imencode(".png", frame)[1].tobytes()
+    mock_detect = mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+
+    assert encoded_image_size(jpeg) == (800, 600)
+    assert encoded_image_size(memoryview(png)) == (800, 600)
+    assert encoded_image_size(b"not an image") is None
+    assert decode_frame(memoryview(png), max_side=300)[0].shape == (150, 200, 3)
+    assert decode_frame(b"not an image")[0] is None
+
+    full = pipeline.process_frame_bytes("BY1", memoryview(jpeg), cache=None)
+    reduced = pipeline.process_frame_bytes("BY1", jpeg, max_side=400, visualize=True, cache=None)
+    pipeline.LOTS.invalidate("BY1")
+    pipeline.reset_tracker("BY1")
+
+    assert mock_detect.call_count == 2
+    assert full["decode_scale"] == 1.0 and "visualization" not in full
+    assert reduced["decode_scale"] == 0.5
+    assert reduced["visualization"].shape == master.shape
+    assert reduced["occupancy"] == full["occupancy"]
+    assert list(tmp_path.iterdir()) == [tmp_path / "BY1"]
+    assert pipeline.process_frame_bytes("BY1", b"not an image") is None
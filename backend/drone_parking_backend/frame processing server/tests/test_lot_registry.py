@@ -0,0 +1,38 @@
+import pytest
+import json
+import os
+from lot_registry import LotRegistry
+""" Loads lots from a temp LOT_DIR into a LotRegistry: change detection, reloads, eviction and preload """
+def test_lot_registry_reloads_changed_lots_and_evicts(tmp_path, make_lot):
+    make_lot("R1")
+    make_lot("R2")
+    (tmp_path / "not_a_lot.txt").write_text("")
+    builds = []
+    changed = []
+    registry = LotRegistry(build_state=lambda lot_id, img, spots: builds.append(lot_id) or len(spots), on_change=changed.append)
+
+    first, err = registry.get("R1")
+    assert err is None and registry.get("R1")[0] is first
+    assert first["state"] == 2 and first["master_img"].shape == (600, 800, 3)
+
+    # Touched but unchanged: hashed once, kept
+    parking_path = tmp_path / "R1" / "parking.json"
+    st = parking_path.stat()
+    os.utime(parking_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert registry.get("R1")[0] is first and builds == ["R1"]
+
+    spots = json.loads(parking_path.read_text()) + [{"id": "A3", "polygon": [[500, 100], [600, 100], [600, 200], [500, 200]]}]
+    parking_path.write_text(json.dumps(spots))
+    reloaded, _ = registry.get("R1")
+    assert reloaded["state"] == 3 and builds == ["R1", "R1"] and changed == ["R1"]
+
+    registry.max_bytes = reloaded["nbytes"] + 1
+    registry.get("R2")
+    assert "R2" in registry and "R1" not in registry and registry.evictions == 1
+    assert changed == ["R1", "R1"]  # evicted lots drop their frame history too
+    assert "R1" not in registry._lot_locks
+
+    assert registry.get("missing") == (None, "Master image missing for missing")
+    registry.max_bytes = 1 << 30
+    assert registry.preload() == {"R1": None, "R2": None}
+    assert len(registry) == 2
@@ -1,7 +1,41 @@
 import pytest
+import cv2
 import numpy as np
-from occupancy import check_occupancy
+from occupancy import LotGeometry, check_occupancy
 """ Tests for bounding boxes covering single parking spots vs overlapping multiple spots """
+def reference_check_occupancy(boxes, parking_data, overlap_threshold=0.3):
+    # The original per-spot, per-box mask loop, kept as the reference for LotGeometry
+    occupied = []
+    free = []
+    for polygon, spot_id in parking_data:
+        px, py, pw, ph = cv2.boundingRect(polygon)
+        if pw <= 1 or ph <= 1 or cv2.contourArea(polygon) < 5:
+            free.append({"id": spot_id, "confidence": 0.0})
+            continue
+        spot_mask = np.zeros((ph, pw), dtype=np.uint8)
+        cv2.fillPoly(spot_mask, [polygon - [px, py]], 255)
+        spot_area = np.count_nonzero(spot_mask)
+        if spot_area == 0:
+            free.append({"id": spot_id, "confidence": 0.0})
+            continue
+        best_conf = 0.0
+        is_occupied = False
+        for box in boxes:
+            bx1, by1, bx2, by2 = int(box[0]), int(box[1]), int(box[2]), int(box[3])
+            conf = box[4] if len(box) > 4 else 0.0
+            ix1, iy1 = max(0, bx1 - px), max(0, by1 - py)
+            ix2, iy2 = min(pw, bx2 - px), min(ph, by2 - py)
+            if ix2 > ix1 and iy2 > iy1:
+                overlap_ratio = np.count_nonzero(spot_mask[iy1:iy2, ix1:ix2]) / spot_area
+                if overlap_ratio >= overlap_threshold:
+                    is_occupied = True
+                    best_conf = max(best_conf, conf)
+        if is_occupied:
+            occupied.append({"id": spot_id, "confidence": best_conf})
+        else:
+            free.append({"id": spot_id, "confidence": 0.0})
+    return {"occupied": occupied, "free": free}
+
 def test_check_occupancy_basic():
     test_polygon = np.array([[100, 100], [200, 100], [200, 200], [100, 200]], np.int32)
     parking_data = [
@@ -50,3 +84,64 @@ def test_zero_area_box_or_polygon():
     
     assert len(res["occupied"]) == 0
     assert len(res["free"]) == 1
+
+def test_lot_geometry_reused_across_frames():
+    p1 = np.array([[0, 0], [100, 0], [100, 100], [0, 100]], np.int32)
+    p2 = np.array([[150, 20], [260, 0], [240, 110], [160, 90]], np.int32)
+    p3 = np.array([[0, 0], [0, 0], [0, 0], [0, 0]], np.int32)
+    parking_data = [(p1, "S1"), (p2, "S2"), (p3, "BAD_SPOT")]
+    geometry = LotGeometry(parking_data)
+
+    frames = [
+        [],
+        [(50, 0, 150, 100, 0.9)],
+        [(-20, -20, 40, 40, 0.5), (140, 0, 270, 120, 0.7), (500, 500, 600, 600, 0.99)],
+        [(200, 50, 180, 30, 0.9)],
+    ]
+    for boxes in frames:
+        for threshold in (0.0, 0.3, 0.9):
+            assert geometry.check(boxes, threshold) == reference_check_occupancy(boxes, parking_data, threshold)
+
+    res = geometry.check(frames[2], 0.3)
+    assert res["occupied"] == [{"id": "S2", "confidence": 0.7}]
+    assert [d["id"] for d in res["free"]] == ["S1", "BAD_SPOT"]
+
+def test_lot_geometry_matches_reference_on_random_lots():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        parking_data = []
+        for i in range(int(rng.integers(1, 30))):
+            cx, cy = rng.integers(0, 1000, 2)
+            # Skewed quads, slivers and degenerate spots alike
+            polygon = np.array([[cx, cy]], np.int32) + rng.integers(-60, 60, (4, 2)).astype(np.int32)
+            parking_data.append((polygon, f"S{i}"))
+        geometry = LotGeometry(parking_data, cell_size=int(rng.integers(16, 256)))
+        for _ in range(5):
+            boxes = []
+            for _ in range(int(rng.integers(0, 25))):
+                x1, y1 = rng.integers(-100, 1000, 2)
+                w, h = rng.integers(-20, 200, 2)
+                boxes.append((int(x1), int(y1), int(x1 + w), int(y1 + h), float(rng.random())))
+            threshold = float(rng.choice([0.0, rng.random(), 1.0]))
+            expected = reference_check_occupancy(boxes, parking_data, threshold)
+            assert geometry.check(boxes, threshold) == expected
+            assert check_occupancy(boxes, parking_data, threshold) == expected
+
+def test_grid_index_limits_candidates():
+    parking_data = []
+    for i in range(200):
+        row, col = divmod(i, 20)
+        x, y = col * 50, row * 90
+        parking_data.append((np.array([[x, y], [x + 40, y], [x + 40, y + 80], [x, y + 80]], np.int32), f"S{i}"))
+    geometry = LotGeometry(parking_data)
+    brute_force = LotGeometry(parking_data, cell_size=1 << 30)
+
+    box = (95, 85, 145, 175, 0.9)
+    found = geometry.candidates(box)
+    assert 22 in found
+    assert len(found) < 10
+    assert geometry.candidates((10, 10, 10, 50)) == []
+
+    boxes = [box, (0, 0, 40, 80, 0.6), (-500, -500, 5000, 5000, 0.1), (2000, 2000, 2100, 2100, 0.8)]
+    assert geometry.check(boxes, 0.3) == brute_force.check(boxes, 0.3)
+    assert {d["id"]: d["confidence"] for d in geometry.check(boxes[:2], 0.3)["occupied"]} == {"S0": 0.6, "S22": 0.9}
@@ -0,0 +1,76 @@
+import pytest
+import json
+import cv2
+import numpy as np
+import pipeline
+from align import project_box_corners
+from result_cache import ResultCache
+""" Runs synthetic frames through pipeline.process_frame with the detector mocked: result caching and live-frame mode """
+def test_duplicate_frame_skips_pipeline(mocker, make_lot, drone_frame):
+    master = make_lot("RC1")
+    frame, H = drone_frame(master)
+    mock_detect = mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+    cache = ResultCache(max_entries=4, ttl=60)
+
+    first = pipeline.process_frame("RC1", frame, frame_hash="abc", cache=cache)
+    second = pipeline.process_frame("RC1", frame, frame_hash="abc", cache=cache)
+    pipeline.LOTS.invalidate("RC1")
+    pipeline.reset_tracker("RC1")
+
+    assert mock_detect.call_count == 1
+    assert first["cached"] is False and second["cached"] is True
+    assert second["occupancy"] == first["occupancy"]
+    assert [o["id"] for o in first["occupancy"]["occupied"]] == ["A1"]
+    assert np.abs(np.array(second["alignment"]["homography"]) - H)[:, 2].max() < 1.0
+    assert "aligned" not in second
+    json.dumps(second)
+
+def test_cache_keeps_classifier_and_detector_results_apart(mocker, make_lot, drone_frame):
+    master = make_lot("RC2")
+    frame, _ = drone_frame(master)
+    mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+    cache = ResultCache(max_entries=8, ttl=60)
+
+    classified = pipeline.process_frame("RC2", frame, frame_hash="same", cache=cache, classify=True)
+    detected = pipeline.process_frame("RC2", frame, frame_hash="same", cache=cache)
+    again = pipeline.process_frame("RC2", frame, frame_hash="same", cache=cache, classify=True)
+    pipeline.LOTS.invalidate("RC2")
+    pipeline.reset_tracker("RC2")
+
+    assert classified["cached"] is False and detected["cached"] is False
+    assert classified["escalated_spots"] is not None and detected["escalated_spots"] is None
+    assert again["cached"] is True and again["escalated_spots"] == classified["escalated_spots"]
+    assert len(cache) == 2
+
+def test_live_frame_mode_matches_warped_under_perspective(mocker, make_lot, drone_frame):
+    master = make_lot("LF1")
+    scene = master.copy()
+    for center in ((150, 150), (365, 240)):  # a car parked in A1, one mostly below A2
+        car = cv2.boxPoints((center, (50, 70), 12)).astype(np.int32)
+        cv2.fillPoly(scene, [car], (0, 0, 255))
+    H = np.array([[0.97, 0.08, -12.0], [-0.06, 1.01, 14.0], [2e-5, -1e-5, 1.0]])
+    frame, _ = drone_frame(scene, H=H)
+
+    def red_blobs(image, **kwargs):
+        contours, _ = cv2.findContours(cv2.inRange(image, (0, 0, 200), (60, 60, 255)), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return [(x, y, x + w, y + h, 0.9) for x, y, w, h in map(cv2.boundingRect, contours) if w * h > 1500]
+
+    mocker.patch("pipeline.detect_cars", side_effect=red_blobs)
+    warped = pipeline.process_frame("LF1", frame, cache=None)
+    live = pipeline.process_frame("LF1", frame, cache=None, warp_frame=False)
+    parking_data = pipeline.LOTS.get("LF1")[0]["parking_data"]
+    pipeline.LOTS.invalidate("LF1")
+
+    assert [o["id"] for o in live["occupancy"]["occupied"]] == [o["id"] for o in warped["occupancy"]["occupied"]] == ["A1"]
+    # Live boxes project to quads whose bounding rects are looser than, but close to, the warped-frame boxes
+    H_live = np.array(live["alignment"]["homography"])
+    quads = project_box_corners(live["boxes"], H_live)
+    assert len(quads) == len(warped["boxes"]) == 2
+    for quad, box in zip(sorted(quads, key=lambda q: q[:, 0].min()), sorted(warped["boxes"])):
+        (x1, y1), (x2, y2) = quad.min(axis=0), quad.max(axis=0)
+        ix = max(0.0, min(x2, box[2]) - max(x1, box[0]))
+        iy = max(0.0, min(y2, box[3]) - max(y1, box[1]))
+        union = (x2 - x1) * (y2 - y1) + (box[2] - box[0]) * (box[3] - box[1]) - ix * iy
+        assert ix * iy / union > 0.75
+    vis = pipeline.render_result(frame, live, master, parking_data)
+    assert vis.shape == master.shape
@@ -0,0 +1,50 @@
+import pytest
+import threading
+import cv2
+import numpy as np
+import pipeline
+import tracking
+""" Promotes frames to lot masters through pipeline.PROMOTER and checks the background swap """
+def test_master_promotion_swaps_in_background(tmp_path, monkeypatch, make_lot, drone_frame):
+    master = make_lot("PM1")
+    lot_dir = tmp_path / "PM1"
+    original = (lot_dir / "master.jpg").read_bytes()
+    old, _ = pipeline.LOTS.get("PM1")
+    tracking.reset_tracker("PM1")
+    tracking.align_tracked("PM1", old["master_img"], drone_frame(master)[0])
+    tracked = tracking.TRACKERS["PM1"]["homography"]
+    started, release = threading.Event(), threading.Event()
+
+    def gated_build(*args, **kwargs):
+        started.set()
+        release.wait(10)
+        return pipeline.build_master_state(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline.PROMOTER, "build_state", gated_build)
+    brighter = cv2.add(master, (30, 30, 30, 0))
+    assert pipeline.promote_master("PM1", brighter, 100) is False
+    assert pipeline.promote_master("PM1", brighter, 200) is True
+    assert pipeline.promote_master("PM1", master, 300) is False  # one promotion per lot at a time
+    assert pipeline.LOTS.get("PM1")[0] is old  # requests keep the old master until the swap
+    release.set()
+    pipeline.PROMOTER.wait()
+    loads = pipeline.LOTS.loads
+    new, _ = pipeline.LOTS.get("PM1")
+    assert tracking.TRACKERS["PM1"]["homography"] is tracked  # same coordinates, so tracking carries over
+
+    started.clear()
+    release.clear()
+    assert pipeline.promote_master("PM1", master, 300) is True
+    started.wait(10)
+    (lot_dir / "parking.json").write_text("[]")  # the lot changes before the swap
+    release.set()
+    pipeline.PROMOTER.wait()
+    kept = cv2.imread(str(lot_dir / "master.jpg"))
+    pipeline.LOTS.invalidate("PM1")
+
+    assert new is not old and pipeline.LOTS.loads == loads
+    assert new["master_img"].mean() > old["master_img"].mean() + 20
+    assert len(new["state"]["kp"]) > 0
+    assert (lot_dir / "master_backup.jpg").read_bytes() == original
+    assert np.array_equal(kept, new["master_img"])
+    assert sorted(p.name for p in lot_dir.iterdir() if ".tmp" in p.name) == []
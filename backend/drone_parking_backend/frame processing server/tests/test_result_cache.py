@@ -0,0 +1,23 @@
+import pytest
+import result_cache
+from result_cache import ResultCache, frame_digest, result_key
+""" Checks the result cache: LRU order, TTL expiry, disk spill and cache keys """
+def test_result_cache_lru_ttl_and_spill(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    cache = ResultCache(max_entries=2, ttl=60, spill_dir=str(tmp_path / "spill"))
+
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.put("c", {"v": 3})  # evicts "b", the least recently used, to disk
+    assert len(cache) == 2
+    assert len(list((tmp_path / "spill").iterdir())) == 1
+
+    assert cache.get("b") == {"v": 2}
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert ResultCache(max_entries=1, ttl=60).get("missing") is None
+
+    assert result_key(frame_digest(b"jpeg bytes"), "1", "model/4") != result_key(frame_digest(b"jpeg bytes"), "2", "model/4")
@@ -0,0 +1,111 @@
+import pytest
+import threading
+import cv2
+from fastapi.testclient import TestClient
+import pipeline
+import server
+""" Drives the FastAPI /process service with an in-memory frame store and the detector mocked """
+def test_process_endpoint_runs_pipeline(mocker, make_lot, drone_frame):
+    frame, _ = drone_frame(make_lot("SV1"))
+    frames = {"frames/a.jpg": cv2.imencode(".jpg", frame)[1].tobytes()}
+    mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+
+    app = server.create_app(workers=2, max_pending=4, fetch=frames.get, preload=True)
+    with TestClient(app) as client:
+        assert "SV1" in pipeline.LOTS
+        response = client.post("/process", json={"lot_id": "SV1", "key": "frames/a.jpg"})
+        missing_frame = client.post("/process", json={"lot_id": "SV1", "key": "frames/missing.jpg"})
+        missing_lot = client.post("/process", json={"lot_id": "nope", "key": "frames/a.jpg"})
+        escaping_lot = client.post("/process", json={"lot_id": "../../x", "key": "frames/a.jpg"})
+        health = client.get("/health").json()
+    pipeline.LOTS.invalidate("SV1")
+    pipeline.RESULT_CACHE.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["key"] == "frames/a.jpg" and body["lot_id"] == "SV1"
+    assert [o["id"] for o in body["occupancy"]["occupied"]] == ["A1"]
+    assert "aligned" not in body
+    assert missing_frame.status_code == 404 and missing_lot.status_code == 404
+    assert escaping_lot.status_code == 400
+    assert health["processed"] == 1 and health["pending"] == 0
+
+def test_process_endpoint_rejects_when_full():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_fetch(key):
+        started.set()
+        release.wait(5)
+        return None
+
+    app = server.create_app(workers=1, max_pending=1, fetch=slow_fetch, preload=False)
+    with TestClient(app) as client:
+        first = []
+        thread = threading.Thread(target=lambda: first.append(client.post("/process", json={"key": "a"})))
+        thread.start()
+        assert started.wait(5)
+        busy = client.post("/process", json={"key": "b"})
+        release.set()
+        thread.join(5)
+
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"] == str(server.RETRY_AFTER_SECONDS)
+    assert first[0].status_code == 404
+
+def test_process_batch_groups_by_lot_with_per_item_status(mocker, make_lot, drone_frame):
+    frames = {}
+    for lot_id in ("SB1", "SB2"):
+        master = make_lot(lot_id)
+        for dx in (6.0, 7.0):
+            frame, _ = drone_frame(master, dx)
+            frames[f"{lot_id}/{dx}.jpg"] = cv2.imencode(".jpg", frame)[1].tobytes()
+    frames["junk.jpg"] = b"not an image"
+    mock_detect = mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+
+    items = [
+        {"lot_id": "SB1", "key": "SB1/6.0.jpg"},
+        {"lot_id": "SB2", "key": "SB2/6.0.jpg"},
+        {"lot_id": "SB1", "key": "SB1/7.0.jpg"},
+        {"lot_id": "SB1", "key": "missing.jpg"},
+        {"lot_id": "nope", "key": "SB2/7.0.jpg"},
+        {"lot_id": "SB2", "key": "junk.jpg"},
+        {"lot_id": "../SB1", "key": "SB1/6.0.jpg"},
+    ]
+    app = server.create_app(workers=2, max_pending=2, fetch=frames.get, preload=False)
+    with TestClient(app) as client:
+        response = client.post("/process_batch", json={"items": items})
+    direct = pipeline.process_batch([("SB2", frames["SB2/7.0.jpg"]), ("nope", b""), ("SB2", b"junk")], cache=None)
+    for lot_id in ("SB1", "SB2"):
+        pipeline.LOTS.invalidate(lot_id)
+    pipeline.RESULT_CACHE.clear()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == [200, 200, 200, 404, 404, 422, 400]
+    assert [r["key"] for r in body["results"]] == [item["key"] for item in items]
+    assert body["succeeded"] == 3 and body["failed"] == 4
+    assert [o["id"] for o in body["results"][2]["occupancy"]["occupied"]] == ["A1"]
+    assert mock_detect.call_count == 4
+    assert "occupancy" in direct[0]
+    assert [r.get("reason") for r in direct] == [None, "lot_unavailable", "undecodable"]
+
+def test_unanswered_shard_request_times_out(tmp_path, make_lot, drone_frame, slow_offline_initializer):
+    frame, _ = drone_frame(make_lot("ST1"))
+    frames = {"a.jpg": cv2.imencode(".jpg", frame)[1].tobytes()}
+
+    app = server.create_app(
+        max_pending=1,
+        fetch=frames.get,
+        preload=False,
+        shards=1,
+        shard_options={"initializer": slow_offline_initializer, "initargs": (str(tmp_path),)},
+        shard_timeout=0.5,
+        cache=None,
+    )
+    with TestClient(app) as client:
+        response = client.post("/process", json={"lot_id": "ST1", "key": "a.jpg"})
+        health = client.get("/health").json()
+
+    assert response.status_code == 504
+    assert health["pending"] == 0
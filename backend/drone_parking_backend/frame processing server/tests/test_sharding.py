@@ -0,0 +1,77 @@
+import pytest
+import os
+import signal
+import time
+import cv2
+from sharding import HashRing, ShardedPool
+""" Checks the consistent hash ring and runs lots through spawned shard processes with the detector replaced """
+def test_hash_ring_moves_only_the_new_workers_share():
+    lots = [f"lot-{i}" for i in range(1000)]
+    ring = HashRing(["a", "b", "c"])
+    before = {lot: ring.node_for(lot) for lot in lots}
+    assert before == {lot: HashRing(["c", "a", "b"]).node_for(lot) for lot in lots}
+    assert min(list(before.values()).count(node) for node in "abc") > 200
+
+    ring.add("d")
+    moved = [lot for lot in lots if ring.node_for(lot) != before[lot]]
+    assert all(ring.node_for(lot) == "d" for lot in moved)
+    assert 150 < len(moved) < 350
+
+    ring.remove("d")
+    assert {lot: ring.node_for(lot) for lot in lots} == before
+    assert HashRing().node_for("x") is None
+
+def test_sharded_pool_pins_lots_and_rebalances(tmp_path, make_lot, drone_frame, offline_initializer):
+    frames = {}
+    for lot_id in ("SH1", "SH2", "SH3"):
+        frame, _ = drone_frame(make_lot(lot_id))
+        frames[lot_id] = cv2.imencode(".jpg", frame)[1].tobytes()
+    items = [(lot_id, frames[lot_id]) for lot_id in ("SH1", "SH2", "SH3", "SH1")]
+
+    pool = ShardedPool(2, initializer=offline_initializer, initargs=(str(tmp_path),), cache=None)
+    try:
+        assert pool.preload() == {"SH1": None, "SH2": None, "SH3": None}
+        results = pool.process_batch(items + [("nope", b"")])
+
+        def owners():
+            return {lot_id: stats["worker"] for stats in pool.stats() for lot_id in stats["lots"]}
+
+        assert owners() == {lot_id: pool.worker_for(lot_id) for lot_id in frames}
+
+        pool.add_worker()
+        assert len(pool.nodes) == 3
+        assert all(pool.worker_for(lot_id) == worker for lot_id, worker in owners().items())
+        results += pool.process_batch(items)
+        assert owners() == {lot_id: pool.worker_for(lot_id) for lot_id in frames}
+
+        pool.remove_worker()
+        assert len(pool.nodes) == 2
+        results += pool.process_batch(items)
+    finally:
+        pool.close()
+
+    assert results[4]["reason"] == "lot_unavailable"
+    ok = results[:4] + results[5:]
+    assert len(ok) == 12
+    assert all([o["id"] for o in r["occupancy"]["occupied"]] == ["A1"] for r in ok)
+    assert all("aligned" not in r for r in ok)
+
+def test_dead_worker_fails_its_requests_and_restarts(tmp_path, make_lot, drone_frame, slow_offline_initializer):
+    frame = cv2.imencode(".jpg", drone_frame(make_lot("SD1"))[0])[1].tobytes()
+
+    pool = ShardedPool(1, initializer=slow_offline_initializer, initargs=(str(tmp_path),), cache=None)
+    try:
+        before = pool.stats()[0]["pid"]
+        pending = pool.submit("SD1", [frame])
+        time.sleep(0.5)
+        os.kill(before, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="died"):
+            pending.result(timeout=30)
+        result = pool.submit("SD1", [frame]).result(timeout=60)[0]
+        after = pool.stats()[0]["pid"]
+        nodes = pool.nodes
+    finally:
+        pool.close()
+
+    assert after != before and nodes == ["shard-0"]
+    assert [o["id"] for o in result["occupancy"]["occupied"]] == ["A1"]
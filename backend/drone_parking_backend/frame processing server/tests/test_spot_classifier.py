@@ -0,0 +1,42 @@
+import pytest
+import cv2
+import numpy as np
+import pipeline
+from spot_classifier import classify_spots
+""" Classifies synthetic spot crops and checks that only unsure spots are escalated to the detector """
+def test_classifier_escalates_only_unsure_spots(mocker):
+    frame = np.full((400, 600, 3), 150, dtype=np.uint8)
+    # A car in B2: bright body, dark windshield and roof glass, dark shadow
+    cv2.rectangle(frame, (215, 120), (285, 280), (240, 240, 240), -1)
+    cv2.rectangle(frame, (222, 140), (278, 170), (20, 20, 20), -1)
+    cv2.rectangle(frame, (222, 230), (278, 250), (20, 20, 20), -1)
+    cv2.rectangle(frame, (285, 120), (298, 280), (40, 40, 40), -1)
+    # Low-contrast change in B3 the classifier can't call either way
+    frame[200:300, 400:500] = 180
+    frame[100:200, 400:500] = 115
+    parking_data = [
+        (np.array([[0, 100], [100, 100], [100, 300], [0, 300]], np.int32), "B1"),
+        (np.array([[200, 100], [300, 100], [300, 300], [200, 300]], np.int32), "B2"),
+        (np.array([[400, 100], [500, 100], [500, 300], [400, 300]], np.int32), "B3"),
+    ]
+
+    states, confidences = classify_spots(frame, parking_data)
+    assert states == ["free", "occupied", None]
+    assert confidences[1] > 0.5
+
+    def fake_detect(image, roi=None, **kwargs):
+        return [(400, 100, 500, 300, 0.7)]
+
+    mock_detect = mocker.patch("pipeline.detect_cars", side_effect=fake_detect)
+    boxes, occ, escalated = pipeline.classify_then_detect(frame, parking_data)
+
+    assert escalated == 1
+    x, y, w, h = mock_detect.call_args.kwargs["roi"]
+    assert x >= 300 and x + w <= 600
+    assert occ == {
+        "occupied": [
+            {"id": "B2", "confidence": confidences[1], "source": "classifier"},
+            {"id": "B3", "confidence": 0.7, "source": "detector"},
+        ],
+        "free": [{"id": "B1", "confidence": 0.0, "source": "classifier"}],
+    }
@@ -0,0 +1,77 @@
+import pytest
+import threading
+import time
+import cv2
+import pipeline
+from result_cache import frame_digest
+from stream import frame_source, stream_frames
+""" Streams synthetic frame sequences (arrays, a directory, a video file) through the overlapped pipeline stages with the detector mocked """
+def test_stream_overlaps_detection_and_keeps_order(mocker, make_lot, drone_frame):
+    master = make_lot("ST1")
+    frames = [drone_frame(master, 4.0 + i)[0] for i in range(5)]
+    in_flight = [0, 0]
+    lock = threading.Lock()
+
+    def slow_detect(image, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.3)
+        with lock:
+            in_flight[0] -= 1
+        return [(110, 110, 190, 190, 0.9)]
+
+    mocker.patch("pipeline.detect_cars", side_effect=slow_detect)
+    expected = [pipeline.process_frame("ST1", frame, cache=None) for frame in frames]
+    pipeline.reset_tracker("ST1")
+
+    stats = {}
+    results = list(stream_frames("ST1", iter(frames), detect_workers=2, queue_size=2, visualize=True, stats=stats, cache=None))
+    pipeline.LOTS.invalidate("ST1")
+    pipeline.reset_tracker("ST1")
+
+    assert [r["frame"] for r in results] == [f"frame{i}" for i in range(5)]
+    assert [r["occupancy"] for r in results] == [r["occupancy"] for r in expected]
+    assert results[0]["visualization"].shape == master.shape
+    assert in_flight[1] == 2
+    assert stats["frames"] == 5
+    assert stats["seconds"] < stats["stages"]["detect"]
+
+def test_stream_reads_directories_and_sampled_video(tmp_path, mocker, make_lot, drone_frame):
+    master = make_lot("ST2")
+    frames = [drone_frame(master, 4.0 + i)[0] for i in range(6)]
+    frame_dir = tmp_path / "frames"
+    frame_dir.mkdir()
+    for i, frame in enumerate(frames):
+        cv2.imwrite(str(frame_dir / f"{i:03d}.png"), frame)
+    (frame_dir / "notes.txt").write_text("")
+    video = str(tmp_path / "flight.avi")
+    writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"MJPG"), 5, (800, 600))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    mock_detect = mocker.patch("pipeline.detect_cars", return_value=[(110, 110, 190, 190, 0.9)])
+
+    assert [name for name, _, _ in frame_source(str(frame_dir), every=2)] == ["000.png", "002.png", "004.png"]
+    assert [image.shape for _, image, _ in frame_source(iter(frames[:1]), max_side=400)] == [(300, 400, 3)]
+    # The same file decoded at another scale must not share cached results
+    data = (frame_dir / "000.png").read_bytes()
+    full = next(frame_source([data], max_side=0))[2]
+    half = next(frame_source(str(frame_dir), max_side=400))[2]
+    assert full == frame_digest(data) and half == frame_digest(data, 2) != full
+    from_dir = list(stream_frames("ST2", str(frame_dir), cache=None))
+    from_video = list(stream_frames("ST2", video, every=2, cache=None))
+    calls = mock_detect.call_count
+    stream = stream_frames("ST2", video, cache=None)
+    next(stream)
+    stream.close()  # stopping early must not leave stage threads behind
+    with pytest.raises(ValueError):
+        list(stream_frames("missing", iter(frames), cache=None))
+    pipeline.LOTS.invalidate("ST2")
+    pipeline.reset_tracker("ST2")
+
+    assert len(from_dir) == 6
+    assert [r["frame"] for r in from_video] == ["flight.avi#0", "flight.avi#2", "flight.avi#4"]
+    assert all([o["id"] for o in r["occupancy"]["occupied"]] == ["A1"] for r in from_dir + from_video)
+    assert calls == 9
+    assert not [t for t in threading.enumerate() if t.name.startswith("stream-detect")]
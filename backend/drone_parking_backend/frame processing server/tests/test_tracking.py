@@ -0,0 +1,45 @@
+import pytest
+import cv2
+import numpy as np
+import tracking
+from tracking import align_tracked, reset_tracker, tracking_stats
+""" Feeds a drifting sequence of synthetic drone frames through the tracker: the first frame needs full SIFT alignment, the rest should be tracked """
+def test_consecutive_frames_are_tracked(make_master, drone_frame):
+    reset_tracker("T1")
+    master = make_master()
+
+    for i in range(4):
+        frame, H_true = drone_frame(master, 5 + i, -3 + i)
+        result = align_tracked("T1", master, frame)
+        assert result["homography"] is not None
+        assert np.abs(result["homography"] - H_true)[:, 2].max() < 1.0
+        if i > 0:
+            assert result["fallback_used"] == "Tracked"
+
+    assert tracking_stats("T1") == (3, 1)
+
+def test_new_master_of_same_size_keeps_tracking(make_master, drone_frame):
+    reset_tracker("T3")
+    master = make_master()
+    align_tracked("T3", master, drone_frame(master)[0])
+
+    promoted = cv2.add(master, (20, 20, 20, 0))
+    frame, H_true = drone_frame(promoted, 7, -2)
+    result = align_tracked("T3", promoted, frame)
+    assert result["fallback_used"] == "Tracked"
+    assert np.abs(result["homography"] - H_true)[:, 2].max() < 1.0
+    assert tracking.TRACKERS["T3"]["master"] is promoted
+    assert tracking_stats("T3") == (1, 1)
+
+def test_tracking_falls_back_when_check_fails(make_master, drone_frame):
+    reset_tracker("T2")
+    master = make_master()
+
+    frame, _ = drone_frame(master, 5, 5)
+    align_tracked("T2", master, frame)
+
+    blank = np.zeros_like(master)
+    result = align_tracked("T2", master, blank)
+    assert result["fallback_used"] != "Tracked"
+    assert result["homography"] is None
+    assert tracking.TRACKERS["T2"]["homography"] is None
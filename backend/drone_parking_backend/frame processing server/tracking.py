@@ -0,0 +1,88 @@
+import cv2
+
+from align import align_to_master, master_track_points, refine_with_point_tracks
+
+# lot_id -> tracking state for consecutive frames of that lot
+TRACKERS = {}
+
+
+def _new_state(master, mask=None):
+    gray = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
+    return {
+        "master": master,
+        "master_shape": master.shape,
+        "master_gray": gray,
+        "track_points": master_track_points(gray, mask=mask),
+        "homography": None,
+        "tracked_frames": 0,
+        "full_alignments": 0,
+    }
+
+
+def reset_tracker(lot_id):
+    """Forget the tracking state for a lot, e.g. after its master image changes."""
+    TRACKERS.pop(lot_id, None)
+
+
+def align_tracked(lot_id, master, new_img, min_inliers=30, warp=True, **align_kwargs):
+    """Align a frame by tracking from the lot's last good homography, falling back to align_to_master.
+
+    The last homography is verified by projecting a few hundred master corners into
+    the new frame and snapping them with sparse Lucas-Kanade flow. If enough of them
+    agree on a homography, that refined estimate is used and SIFT/FLANN is skipped.
+    A new master of the same size (e.g. a promoted one) only replaces the tracked
+    points; the last homography is kept, since the master's coordinates are unchanged.
+
+    Args:
+        lot_id: lot whose tracking state to use and update
+        master: the master image BGR array
+        new_img: the live drone image BGR array
+        min_inliers: tracked RANSAC inliers required to accept the tracked homography
+        warp: as in align_to_master
+        **align_kwargs: passed through to align_to_master (precomputed master features etc.)
+
+    Returns the align_to_master result dict, with "fallback_used" set to "Tracked"
+    when the frame was aligned from the previous homography.
+    """
+    state = TRACKERS.get(lot_id)
+    if state is None or state["master_shape"] != master.shape:
+        # Track the same static structure the lot's alignment mask keeps
+        state = _new_state(master, align_kwargs.get("master_mask"))
+        TRACKERS[lot_id] = state
+    elif state["master"] is not master:
+        old = state
+        state = _new_state(master, align_kwargs.get("master_mask"))
+        for key in ("homography", "tracked_frames", "full_alignments"):
+            state[key] = old[key]
+        TRACKERS[lot_id] = state
+
+    if state["homography"] is not None:
+        gray2 = cv2.cvtColor(new_img, cv2.COLOR_BGR2GRAY)
+        H, tracked, inliers = refine_with_point_tracks(
+            state["master_gray"], gray2, state["homography"], state["track_points"]
+        )
+        if H is not None and inliers >= min_inliers:
+            state["homography"] = H
+            state["tracked_frames"] += 1
+            return {
+                "aligned": cv2.warpPerspective(new_img, H, (master.shape[1], master.shape[0])) if warp else new_img,
+                "homography": H,
+                "keypoints_master": len(state["track_points"]),
+                "keypoints_live": tracked,
+                "good_matches": tracked,
+                "inliers": inliers,
+                "fallback_used": "Tracked",
+            }
+
+    result = align_to_master(master, new_img, warp=warp, **align_kwargs)
+    state["full_alignments"] += 1
+    state["homography"] = result["homography"]
+    return result
+
+
+def tracking_stats(lot_id):
+    """Return (tracked_frames, full_alignments) counts for a lot."""
+    state = TRACKERS.get(lot_id)
+    if state is None:
+        return 0, 0
+    return state["tracked_frames"], state["full_alignments"]